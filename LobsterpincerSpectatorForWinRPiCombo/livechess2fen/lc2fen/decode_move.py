@@ -0,0 +1,386 @@
+"""This module is responsible for decoding moves from piece probabilities.
+
+Given the full previous position (as a `chess.Board`, which knows whose
+turn it is, the castling rights, and the en-passant square), every legal
+move is scored against the piece probabilities generated by the
+chess-piece CNN, and the most likely move is returned along with a
+confidence margin.
+
+The score of a move is the change in log-likelihood of the whole board
+caused by the move, which only involves the (2 to 4) squares the move
+changes, so all legal moves are scored with one vectorized computation.
+
+If both players moved between two board updates, no single move explains
+the changed squares; sequences of up to `MAX_NUM_OF_PLIES` legal moves
+are then searched as well (only moves touching a changed square are
+considered, which keeps the search small).
+"""
+
+import numpy as np
+import chess
+
+from livechess2fen.lc2fen.fen import PIECES, EMPTY, MIN_PROB, fen_to_codes
+
+
+MIN_MARGIN = 2
+"""Minimum confidence margin (in log-likelihood) to accept a move.
+
+The margin is the log-likelihood difference between the best hypothesis
+and the best competing one (see `decode_moves()`); a margin of 2 means
+the detected move is about 7 times as likely as any alternative.
+
+This is also the log-likelihood gap above which a square is considered
+to have changed when deciding whether to search move sequences.
+"""
+
+MAX_NUM_OF_PLIES = 2
+"""Maximum number of moves (plies) detected in one board update.
+
+Set it to 1 to detect single moves only, or to 3 to also recover from
+three moves made between two board updates (which is slower).
+"""
+
+EXTRA_PLY_PENALTY = 1
+"""Log-likelihood penalty for each move beyond the first in a sequence.
+
+This penalty makes the decoder prefer the simplest explanation of the
+changed squares. It is subtracted from the margin of a sequence over
+its first move alone, so it must stay well below what a second move
+adds: if the CNN gives the true piece a probability of 0.5 (and spreads
+the rest evenly), each changed square adds log(12) = 2.48, and a clean
+two-move catch-up is accepted with a margin of 2 * 2.48 - 1 = 3.97 (a
+penalty of 3 would bring it down to 1.97, below `MIN_MARGIN`).
+"""
+
+MAX_NUM_OF_CHANGED_SQUARES = 8
+"""Maximum number of changed squares for which sequences are searched.
+
+More changed squares than this usually means something else happened
+(e.g., a hand over the board), so no sequence is searched.
+"""
+
+
+def _fen_idx(square: chess.Square) -> int:
+    """Convert a python-chess square to its FEN-notation-order index.
+
+    :param square: Square (0 for a1, 1 for b1, ..., and 63 for h8).
+
+    :return: Index of the square in FEN-notation order (0 for a8, 1 for
+    b8, ..., and 63 for h1).
+    """
+    return square ^ 56
+
+
+def board_to_codes(board: chess.Board) -> np.ndarray:
+    """Encode the piece placement of a board as piece indices.
+
+    :param board: Board position.
+
+    :return: Length-64 array of piece indices (i.e., the piece codes of
+    `PIECES` in "fen.py") in FEN-notation order.
+    """
+    return fen_to_codes(board.board_fen())
+
+
+def changed_squares_of_move(
+    board: chess.Board, move: chess.Move
+) -> list[tuple[int, int]]:
+    """Return the squares a move changes along with their new contents.
+
+    :param board: Board position in which the move is played.
+
+    :param move: Legal move.
+
+    :return: List of `(square, piece index)` pairs, where `square` is in
+    FEN-notation order and `piece index` is the index (in the order of
+    `PIECES`) of the piece on that square after the move.
+    """
+    piece = board.piece_at(move.from_square)
+    if move.promotion is not None:
+        piece = chess.Piece(move.promotion, piece.color)
+    changes = [
+        (_fen_idx(move.from_square), EMPTY),
+        (_fen_idx(move.to_square), PIECES.index(piece.symbol())),
+    ]
+
+    if board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        if chess.square_file(move.to_square) == 6:  # Kingside castling
+            rook_from, rook_to = chess.square(7, rank), chess.square(5, rank)
+        else:  # Queenside castling
+            rook_from, rook_to = chess.square(0, rank), chess.square(3, rank)
+        rook = "R" if piece.color == chess.WHITE else "r"
+        changes.append((_fen_idx(rook_from), EMPTY))
+        changes.append((_fen_idx(rook_to), PIECES.index(rook)))
+    elif board.is_en_passant(move):
+        captured_square = chess.square(
+            chess.square_file(move.to_square),
+            chess.square_rank(move.from_square),
+        )
+        changes.append((_fen_idx(captured_square), EMPTY))
+
+    return changes
+
+
+def _log_probs(probs: np.ndarray) -> np.ndarray:
+    """Return the logarithms of the piece probabilities.
+
+    :param probs: `(64, 13)` array of piece probabilities.
+
+    :return: `(64, 13)` array of log piece probabilities.
+    """
+    return np.log(np.maximum(np.asarray(probs, np.float64), MIN_PROB))
+
+
+def _score_legal_moves(
+    board: chess.Board, log_probs: np.ndarray, previous_codes: np.ndarray
+) -> tuple[list[chess.Move], np.ndarray, list[frozenset]]:
+    """Score every legal move against the log piece probabilities.
+
+    :param board: Previous board position.
+
+    :param log_probs: `(64, 13)` array of log piece probabilities.
+
+    :param previous_codes: Length-64 array of the previous piece indices
+        (see `board_to_codes()`).
+
+    :return: Length-3 tuple formed by the list of legal moves, the array
+    of their scores, and the list of the sets of squares they change.
+    """
+    moves = list(board.legal_moves)
+
+    # Flatten the (2 to 4) changed squares of every move into one list
+    move_indices, squares, new_codes, squares_by_move = [], [], [], []
+    for i, move in enumerate(moves):
+        changes = changed_squares_of_move(board, move)
+        for square, code in changes:
+            move_indices.append(i)
+            squares.append(square)
+            new_codes.append(code)
+        squares_by_move.append(frozenset(square for square, _ in changes))
+    squares = np.array(squares, dtype=np.intp)
+    new_codes = np.array(new_codes, dtype=np.intp)
+
+    gains = (
+        log_probs[squares, new_codes]
+        - log_probs[squares, previous_codes[squares]]
+    )
+    scores = np.bincount(move_indices, gains, minlength=len(moves))
+    return moves, scores, squares_by_move
+
+
+def score_legal_moves(
+    board: chess.Board, probs: np.ndarray
+) -> tuple[list[chess.Move], np.ndarray]:
+    """Score every legal move against the piece probabilities.
+
+    :param board: Previous board position.
+
+    :param probs: `(64, 13)` array of piece probabilities in
+        FEN-notation order (with the a1 square in the bottom-left
+        corner).
+
+    :return: Pair formed by the list of legal moves and the array of
+    their scores (the log-likelihood change of the board caused by each
+    move; the score of not moving at all is 0).
+    """
+    moves, scores, _ = _score_legal_moves(
+        board, _log_probs(probs), board_to_codes(board)
+    )
+    return moves, scores
+
+
+def _find_changed_squares(
+    previous_codes: np.ndarray, log_probs: np.ndarray
+) -> set[int]:
+    """Find the squares the CNN clearly sees differently than before.
+
+    :param previous_codes: Length-64 array of the previous piece indices.
+
+    :param log_probs: `(64, 13)` array of log piece probabilities.
+
+    :return: Set of the squares (in FEN-notation order) whose most
+    probable content is at least `MIN_MARGIN` more likely (in
+    log-likelihood) than their previous content.
+    """
+    gaps = log_probs.max(axis=1) - log_probs[np.arange(64), previous_codes]
+    return set(np.flatnonzero(gaps > MIN_MARGIN).tolist())
+
+
+def _score_sequence(
+    board: chess.Board,
+    sequence: list[chess.Move],
+    previous_codes: np.ndarray,
+    log_probs: np.ndarray,
+) -> tuple[float, frozenset]:
+    """Score a sequence of legal moves against the piece probabilities.
+
+    :param board: Board position in which the sequence is played.
+
+    :param sequence: Sequence of legal moves.
+
+    :param previous_codes: Length-64 array of the previous piece indices.
+
+    :param log_probs: `(64, 13)` array of log piece probabilities.
+
+    :return: Pair formed by the log-likelihood change of the board
+    caused by the sequence (minus `EXTRA_PLY_PENALTY` per extra move)
+    and the set of squares the sequence changes.
+    """
+    contents = {}
+    board = board.copy(stack=False)
+    for move in sequence:
+        contents.update(changed_squares_of_move(board, move))
+        board.push(move)
+    changes = {
+        square: code
+        for square, code in contents.items()
+        if code != previous_codes[square]
+    }  # A piece may have come back to its square, e.g., after a recapture
+    squares = np.fromiter(changes.keys(), dtype=np.intp, count=len(changes))
+    codes = np.fromiter(changes.values(), dtype=np.intp, count=len(changes))
+    score = (
+        log_probs[squares, codes] - log_probs[squares, previous_codes[squares]]
+    ).sum()
+    return (
+        float(score) - EXTRA_PLY_PENALTY * (len(sequence) - 1),
+        frozenset(changes),
+    )
+
+
+def _search_sequences(
+    board: chess.Board, changed_squares: set[int], max_plies: int
+) -> list[list[chess.Move]]:
+    """Enumerate the legal move sequences that touch the changed squares.
+
+    Only moves that change at least one of `changed_squares` are
+    followed, which prunes the search down to a few hundred sequences.
+
+    :param board: Board position in which the sequences are played.
+
+    :param changed_squares: Squares (in FEN-notation order) the CNN sees
+        differently than before.
+
+    :param max_plies: Maximum length of the sequences.
+
+    :return: List of the legal move sequences of 2 to `max_plies` moves.
+    """
+    sequences = []
+    board = board.copy(stack=False)
+
+    def extend(sequence: list[chess.Move]):
+        for move in list(board.legal_moves):
+            squares = {
+                square for square, _ in changed_squares_of_move(board, move)
+            }
+            if squares.isdisjoint(changed_squares):
+                continue
+            if len(sequence) >= 1:
+                sequences.append(sequence + [move])
+            if len(sequence) + 1 < max_plies:
+                board.push(move)
+                extend(sequence + [move])
+                board.pop()
+
+    extend([])
+    return sequences
+
+
+def decode_moves(
+    board: chess.Board, probs: np.ndarray, max_plies: int = MAX_NUM_OF_PLIES
+) -> tuple[list[chess.Move], float]:
+    """Decode the move(s) played in a position from piece probabilities.
+
+    The hypotheses are all legal moves plus the null hypothesis (no move
+    has been played). If the best legal move does not explain all the
+    squares the CNN sees differently than before, legal sequences of up
+    to `max_plies` moves are hypotheses too.
+
+    The most likely hypothesis is returned along with its margin over
+    the most likely competing hypothesis, i.e., the best hypothesis that
+    changes a different set of squares (so that promotions to different
+    pieces, which the CNN has a hard time telling apart, and sequences
+    played in a different order do not compete with each other).
+
+    :param board: Previous board position.
+
+    :param probs: `(64, 13)` array of piece probabilities in
+        FEN-notation order (with the a1 square in the bottom-left
+        corner).
+
+    :param max_plies: Maximum number of moves to detect.
+
+    :return: Pair formed by the most likely list of moves (empty for
+    the null hypothesis) and its confidence margin (in log-likelihood).
+    """
+    log_probs = _log_probs(probs)
+    previous_codes = board_to_codes(board)
+    moves, scores, squares_by_move = _score_legal_moves(
+        board, log_probs, previous_codes
+    )
+    if not moves:
+        return [], np.inf
+
+    hypotheses = [([], 0.0, frozenset())] + [
+        ([move], score, squares)
+        for move, score, squares in zip(
+            moves, scores.tolist(), squares_by_move
+        )
+    ]
+
+    if max_plies > 1:
+        changed_squares = _find_changed_squares(previous_codes, log_probs)
+        best_single = hypotheses[1 + int(np.argmax(scores))]
+        if (
+            0 < len(changed_squares) <= MAX_NUM_OF_CHANGED_SQUARES
+            and not changed_squares <= best_single[2]
+        ):  # The best single move does not explain all changed squares
+            for sequence in _search_sequences(
+                board, changed_squares, max_plies
+            ):
+                hypotheses.append(
+                    (sequence,)
+                    + _score_sequence(
+                        board, sequence, previous_codes, log_probs
+                    )
+                )
+
+    best = max(hypotheses, key=lambda hypothesis: hypothesis[1])
+    competing_score = max(
+        hypothesis[1] for hypothesis in hypotheses if hypothesis[2] != best[2]
+    )
+    return best[0], best[1] - competing_score
+
+
+if __name__ == "__main__":
+    import time
+
+    # The position before black castles queenside in
+    # "Test Images/before_0-0-0_by_black.png"
+    board = chess.Board(
+        "r3kbnr/pppqpppp/2np4/8/3PP1b1/2N1BN2/PPP2PPP/R2BKQ1R b kq - 0 1"
+    )
+    after = board.copy()
+    after.push_uci("e8c8")
+
+    # Synthetic CNN output: the true piece gets most of the probability
+    rng = np.random.default_rng(0)
+    probs = rng.dirichlet(np.ones(13), size=64) * 0.3
+    probs[np.arange(64), board_to_codes(after)] += 0.7
+
+    start_time = time.time()
+    moves, margin = decode_moves(board, probs)
+    finish_time = time.time()
+    print(f"\tDecoded moves: {moves} (margin: {margin})")
+    print(f"\tDecoding took {finish_time - start_time} s")
+
+    # Both players moved between two board updates
+    after.push_uci("d4d5")
+    probs = rng.dirichlet(np.ones(13), size=64) * 0.3
+    probs[np.arange(64), board_to_codes(after)] += 0.7
+
+    start_time = time.time()
+    moves, margin = decode_moves(board, probs)
+    finish_time = time.time()
+    print(f"\tDecoded moves: {moves} (margin: {margin})")
+    print(f"\tDecoding took {finish_time - start_time} s")
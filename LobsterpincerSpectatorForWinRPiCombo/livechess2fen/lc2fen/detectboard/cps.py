@@ -1,6 +1,5 @@
 """This is the chessboard-position-search (CPS) module."""
 
-import collections
 import itertools
 import math
 
@@ -14,6 +13,10 @@ from sklearn.cluster import DBSCAN
 from livechess2fen.lc2fen.detectboard import debug
 
 
+__BLOCK_SIZE = 20_000
+"""Number of candidate frames processed at once."""
+
+
 def __order_points(pts: list[list]) -> list[list[int]]:
     """Order the four points in the order of TR, TR, BR, and BL.
 
@@ -103,25 +106,187 @@ def __ptl_distance(line: list[list], point: list, dx):
     )
 
 
-def __intersection(line1: list[list], line2: list[list]):
-    """Return the intersection of `line1` and `line2`.
+def __intersections(lines1: np.ndarray, lines2: np.ndarray) -> np.ndarray:
+    """Return the intersections of the lines of `lines1` and `lines2`.
+
+    :param lines1: `(n, 2, 2)` array of lines.
+
+    :param lines2: `(m, 2, 2)` array of lines.
 
-    If they don't intersect, the function returns (-1, -1).
+    :return: `(n, m, 2)` array whose element `[i, j]` is the intersection
+    of `lines1[i]` and `lines2[j]` (or (-1, -1) if they don't intersect).
     """
-    xdiff = (line1[0][0] - line1[1][0], line2[0][0] - line2[1][0])
-    ydiff = (line1[0][1] - line1[1][1], line2[0][1] - line2[1][1])
+    l1 = lines1[:, np.newaxis]
+    l2 = lines2[np.newaxis]
+    xdiff = (l1[..., 0, 0] - l1[..., 1, 0], l2[..., 0, 0] - l2[..., 1, 0])
+    ydiff = (l1[..., 0, 1] - l1[..., 1, 1], l2[..., 0, 1] - l2[..., 1, 1])
 
     def det(a, b):
         return a[0] * b[1] - a[1] * b[0]
 
     div = det(xdiff, ydiff)
-    if div == 0:
-        return -1, -1
+    d = (
+        l1[..., 0, 0] * l1[..., 1, 1] - l1[..., 0, 1] * l1[..., 1, 0],
+        l2[..., 0, 0] * l2[..., 1, 1] - l2[..., 0, 1] * l2[..., 1, 0],
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        points = np.stack((det(d, xdiff) / div, det(d, ydiff) / div), -1)
+    points[div == 0] = -1
+    return points
+
+
+def __candidate_frames(
+    vertical: list[list], horizontal: list[list], shape: tuple
+):
+    """Find the candidate frames formed by two pairs of lines.
+
+    A candidate frame is formed by two vertical lines and two horizontal
+    lines that have exactly four (of their six) intersections inside the
+    image.
+
+    :param vertical: List of the vertical lines.
+
+    :param horizontal: List of the horizontal lines.
+
+    :param shape: Shape of the image.
+
+    :return: Pair formed by the `(k, 4, 2)` array of the four points
+    (normalized, as `__normalize()` does) of each candidate frame and
+    the `(k,)` array of the indices of the candidate frames in the order
+    in which `itertools.combinations()` enumerates the pairs of lines
+    (pairs of vertical lines first).
+    """
+    v = np.array(vertical, np.int64).reshape(-1, 2, 2)
+    h = np.array(horizontal, np.int64).reshape(-1, 2, 2)
+    v_pairs = np.array(
+        list(itertools.combinations(range(len(v)), 2)), int
+    ).reshape(-1, 2)
+    h_pairs = np.array(
+        list(itertools.combinations(range(len(h)), 2)), int
+    ).reshape(-1, 2)
+
+    def is_correct(points):
+        """Check which points are in the image.
+
+        This is the vectorized counterpart of `__check_correctness()`.
+        """
+        return (
+            (0 <= points[..., 0])
+            & (points[..., 0] <= shape[1])
+            & (0 <= points[..., 1])
+            & (points[..., 1] <= shape[0])
+        )
+
+    vv = __intersections(v, v)
+    vh = __intersections(v, h)
+    hh = __intersections(h, h)
+    vv_correct = is_correct(vv)
+    vh_correct = is_correct(vh)
+    hh_correct = is_correct(hh)
+
+    frames = []
+    indices = []
+    block_size = max(1, 1_000_000 // max(1, len(h_pairs)))
+    for start in range(0, len(v_pairs), block_size):
+        v0, v1 = v_pairs[start : start + block_size].T
+        h0, h1 = h_pairs.T
+
+        # Frames with exactly four correct intersections
+        num_of_correct = (
+            vv_correct[v0, v1, np.newaxis].astype(int)
+            + vh_correct[v0[:, np.newaxis], h0]
+            + vh_correct[v0[:, np.newaxis], h1]
+            + vh_correct[v1[:, np.newaxis], h0]
+            + vh_correct[v1[:, np.newaxis], h1]
+            + hh_correct[h0, h1]
+        )
+        vi, hi = np.nonzero(num_of_correct == 4)
+        v0, v1, h0, h1 = v0[vi], v1[vi], h0[hi], h1[hi]
+
+        # The six intersections (in the same order as in `cps()`)
+        points = np.stack(
+            (
+                vv[v0, v1],
+                vh[v0, h0],
+                vh[v0, h1],
+                vh[v1, h0],
+                vh[v1, h1],
+                hh[h0, h1],
+            ),
+            1,
+        )
+        correct = is_correct(points)
+        # The four correct intersections (in order) of each frame
+        order = np.argsort(~correct, axis=1, kind="stable")[:, :4]
+        frames.append(np.take_along_axis(points, order[..., np.newaxis], 1))
+        indices.append((start + vi) * len(h_pairs) + hi)
+
+    if not frames:
+        return np.zeros((0, 4, 2), int), np.zeros(0, int)
+    return np.concatenate(frames).astype(int), np.concatenate(indices)
+
+
+def __score_bounds(frames: np.ndarray, pts: np.ndarray, alfa, beta):
+    """Compute upper bounds of the polyscores of the candidate frames.
 
-    d = (det(*line1), det(*line2))
-    x = det(d, xdiff) / div
-    y = det(d, ydiff) / div
-    return x, y
+    The bound of a frame is 0 if `__polyscore()` is sure to return 0 for
+    it (because the frame is too small or too few points can be in it).
+    Otherwise, it is `min(num_of_points, 49) ** 4 / frame_area ** 2`,
+    where `num_of_points` counts the points close enough to the frame to
+    possibly be in its offset.
+
+    Only convex frames are ever scored, so their area is that of the
+    convex hull of their four points (the largest area of the three ways
+    of connecting them).
+
+    :param frames: `(k, 4, 2)` array of the points of the frames.
+
+    :param pts: `(n, 2)` array of the lattice points.
+
+    :param alfa: Same as for `__polyscore()`.
+
+    :param beta: Same as for `__polyscore()`.
+
+    :return: `(k,)` array of the upper bounds.
+    """
+    # The offset of a (convex) frame by `gamma` with miter joins is
+    # within the half-planes of its sides pushed out by `gamma`, up to
+    # its rounding to integers
+    max_dist = alfa / 1.5 + 1
+    min_pts_in_frame = min(len(pts), 49) - 2 * beta - 1
+    connections = np.array([[0, 1, 2, 3], [0, 1, 3, 2], [0, 2, 1, 3]])
+
+    bounds = np.zeros(len(frames))
+    for start in range(0, len(frames), __BLOCK_SIZE):
+        quads = frames[start : start + __BLOCK_SIZE][:, connections]
+        x, y = quads[..., 0], quads[..., 1]
+        twice_areas = (
+            x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y
+        ).sum(axis=-1)
+        convex = np.argmax(abs(twice_areas), axis=1)
+        twice_area = twice_areas[np.arange(len(quads)), convex]
+        quad = quads[np.arange(len(quads)), convex]
+        frame_area = abs(twice_area) / 2
+
+        # Signed distances of the points to the sides of the frames
+        # (positive inside)
+        side = np.roll(quad, -1, axis=1) - quad
+        side_length = np.sqrt((side**2).sum(axis=-1))
+        cross = side[:, :, np.newaxis, 0] * (
+            pts[:, 1] - quad[:, :, np.newaxis, 1]
+        ) - side[:, :, np.newaxis, 1] * (pts[:, 0] - quad[:, :, np.newaxis, 0])
+        dist = np.sign(twice_area)[:, np.newaxis, np.newaxis] * cross
+        near = (dist >= -max_dist * side_length[..., np.newaxis]).all(axis=1)
+        num_of_points = np.minimum(np.count_nonzero(near, axis=1), 49)
+
+        with np.errstate(divide="ignore"):
+            block_bounds = num_of_points**4 / frame_area**2
+        block_bounds[
+            (frame_area < (4 * alfa * alfa) * 5)
+            | (num_of_points < min_pts_in_frame)
+        ] = 0
+        bounds[start : start + __BLOCK_SIZE] = block_bounds
+    return bounds
 
 
 def __polyscore(cnt, pts, cen, alfa, beta):
@@ -166,11 +331,10 @@ def __polyscore(cnt, pts, cen, alfa, beta):
     j = 0
     for l in lns:
         d = math.sqrt((l[0][0] - l[1][0]) ** 2 + (l[0][1] - l[1][1]) ** 2)
-        for p in points:
-            r = __ptl_distance(l, p, d)
-            if r < gamma:
-                i += r
-                j += 1
+        r = __ptl_distance(l, points.T, d)
+        for close_r in r[r < gamma]:  # Summed in order, one at a time
+            i += close_r
+            j += 1
     if j == 0:
         return 0
 
@@ -324,20 +488,21 @@ def cps(
     for l in lines:  # We will review all of the lines
         # We reject lines that pass through the center of the cluster
         if __ptl_distance(l, centroid, ptp_distance(*l)) > alfa * 2.5:
-            for p in points:
-                # We check that the line passes near a good point
-                if __ptl_distance(l, p, ptp_distance(*l)) < alfa:
-                    # The line belongs to the ring
-                    tx, ty = l[0][0] - l[1][0], l[0][1] - l[1][1]
-                    if abs(tx) < abs(ty):
-                        ll, s1, s2 = __v(l)
-                        orientation = 0
-                    else:
-                        ll, s1, s2 = __h(l)
-                        orientation = 1
-                    if s1 == 0 and s2 == 0:
-                        continue
-                    pregroup[orientation].append(ll)
+            # We check that the line passes near a good point
+            if np.any(
+                __ptl_distance(l, np.array(points).T, ptp_distance(*l)) < alfa
+            ):
+                # The line belongs to the ring
+                tx, ty = l[0][0] - l[1][0], l[0][1] - l[1][1]
+                if abs(tx) < abs(ty):
+                    ll, s1, s2 = __v(l)
+                    orientation = 0
+                else:
+                    ll, s1, s2 = __h(l)
+                    orientation = 1
+                if s1 == 0 and s2 == 0:
+                    continue
+                pregroup[orientation].append(ll)
 
     pregroup[0] = __remove_duplicates(pregroup[0])
     pregroup[1] = __remove_duplicates(pregroup[1])
@@ -367,29 +532,41 @@ def cps(
             pregroup[1], color=(255, 0, 0)
         ).save("cps_pregroups")
 
-    score = {}  # Frame ranking with the result
-    for v in itertools.combinations(pregroup[0], 2):  # Horizontal
-        for h in itertools.combinations(pregroup[1], 2):  # Vertical
-            poly = [
-                __intersection(v[0], v[1]),
-                __intersection(v[0], h[0]),
-                __intersection(v[0], h[1]),
-                __intersection(v[1], h[0]),
-                __intersection(v[1], h[1]),
-                __intersection(h[0], h[1]),
-            ]
-            poly = __check_correctness(poly, img.shape)
-            if len(poly) != 4:
-                continue
-            poly = np.array(__sort_points(__normalize(poly)))
-            if not cv2.isContourConvex(poly):
-                continue
-            score[-__polyscore(poly, points, centroid, alfa / 2, beta)] = poly
-
-    score = collections.OrderedDict(sorted(score.items()))
-    K = next(iter(score))
-
-    inner_points = __normalize(score[K])
+    # Frames formed by every two vertical lines and two horizontal lines
+    frames, indices = __candidate_frames(pregroup[0], pregroup[1], img.shape)
+    bounds = __score_bounds(frames, np.array(points), alfa / 2, beta)
+
+    def sorted_convex_poly(frame):
+        """Return the sorted frame if it is convex (or None otherwise)."""
+        poly = np.array(__sort_points(frame.tolist()))
+        return poly if cv2.isContourConvex(poly) else None
+
+    # Frame ranking: the frames are scored from the highest bound down,
+    # until no remaining frame can beat the best one (on a tie, the
+    # frame enumerated last wins)
+    best = None  # Score, index, and points of the best frame
+    for k in np.argsort(-bounds, kind="stable"):
+        if bounds[k] == 0 or (best is not None and bounds[k] < best[0]):
+            break
+        poly = sorted_convex_poly(frames[k])
+        if poly is None:
+            continue
+        score = __polyscore(poly, points, centroid, alfa / 2, beta)
+        if best is None or (score, indices[k]) > best[:2]:
+            best = (score, indices[k], poly)
+
+    if best is None or best[0] == 0:
+        # All frames have a score of 0, so the one enumerated last wins
+        best = None
+        for k in np.argsort(-indices, kind="stable"):
+            poly = sorted_convex_poly(frames[k])
+            if poly is not None:
+                best = (0, indices[k], poly)
+                break
+        if best is None:
+            raise ValueError("No chessboard frame was found")
+
+    inner_points = __normalize(best[2])
     inner_points = __order_points(inner_points)
 
     debug.DebugImage(img).points(points, color=(0, 255, 0)).points(
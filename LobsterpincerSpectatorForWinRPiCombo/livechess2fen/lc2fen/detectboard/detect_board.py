@@ -118,6 +118,31 @@ def detect(
     :return: Final ImageObject with which to compute the corners if
     necessary.
     """
+    cropped_img, image = detect_in_memory(input_image, board_corners)
+    cv2.imwrite(output_board, cropped_img)
+
+    return image
+
+
+def detect_in_memory(
+    input_image: np.ndarray,
+    board_corners: list[list[int]] | None = None,
+) -> tuple[np.ndarray, ImageObject]:
+    """Detect the board position and return the cropped detected board.
+
+    This function is the in-memory counterpart of `detect()`; nothing is
+    written to disk.
+
+    :param input_image: Input chessboard image.
+
+    :param board_corners: List of coordinates of the four board corners.
+
+        If it is not None, first check if the board is in the position
+        given by these corners. If not, runs the full detection.
+
+    :return: Pair formed by the cropped detected-board image and the
+    final ImageObject with which to compute the corners if necessary.
+    """
     # Check if we can skip full board detection (if board position is
     # already known)
     if board_corners is not None:
@@ -133,23 +158,21 @@ def detect(
             )
 
         if found:
-            cv2.imwrite(output_board, cropped_img)
             image = ImageObject(input_image)
             # For corners calculation
             image.add_points([[0, 0], [1200, 0], [1200, 1200], [0, 1200]])
             # image.add_points([[0, 0], [1199, 0], [1199, 1199], [0, 1199]])
             image.add_points(board_corners)
-            return image
+            return cropped_img, image
 
-    # Read the input image and store the cropped detected board
+    # Read the input image and keep the cropped detected board
     n_layers = 3
     image = ImageObject(input_image)
     for i in range(n_layers):
         __layer(image)
         debug.DebugImage(image["orig"]).save(f"end_iteration{i}")
-    cv2.imwrite(output_board, image["orig"])
 
-    return image
+    return image["orig"], image
 
 
 def compute_corners(image_object):
@@ -9,7 +9,7 @@ from scipy.cluster.hierarchy import single, fcluster
 from scipy.spatial.distance import pdist
 
 from livechess2fen.lc2fen.detectboard import debug, image_object
-from livechess2fen.lc2fen.detectboard import poly_point_isect
+from livechess2fen.lc2fen.detectboard import segment_isect
 
 
 try:
@@ -25,11 +25,18 @@ except (
 
 __ANALYSIS_RADIUS = 10
 
+LAPS_BATCH_SIZE = 8
+"""Maximum number of patches run through the LAPS model in a single call.
+
+The model expands every pixel of a patch into 441 channels, so larger
+batches no longer fit in the CPU cache and end up slower per patch.
+"""
+
 
 def __find_intersections(lines):
     """Find all intersections."""
     __lines = [[(a[0], a[1]), (b[0], b[1])] for a, b in lines]
-    return poly_point_isect.isect_segments(__lines)
+    return segment_isect.isect_segments(__lines)
 
 
 def __cluster_points(points, max_dist=10):
@@ -52,51 +59,80 @@ def __cluster_points(points, max_dist=10):
     return list(clusters)
 
 
-def __is_lattice_point(img):
-    """Determine if a point is a lattice point."""
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    img = cv2.threshold(img, 0, 255, cv2.THRESH_OTSU)[1]
-    img = cv2.Canny(img, 0, 255)
-    img = cv2.resize(img, (21, 21), interpolation=cv2.INTER_CUBIC)
+def __preprocess_patch(gray_patch):
+    """Extract the (resized) edges of a grayscale patch."""
+    patch = cv2.threshold(gray_patch, 0, 255, cv2.THRESH_OTSU)[1]
+    patch = cv2.Canny(patch, 0, 255)
+    return cv2.resize(patch, (21, 21), interpolation=cv2.INTER_CUBIC)
 
-    # Geometric detector to filter easy points
-    img_geo = cv2.dilate(img, None)
-    mask = cv2.copyMakeBorder(
-        img_geo,
-        top=1,
-        bottom=1,
-        left=1,
-        right=1,
-        borderType=cv2.BORDER_CONSTANT,
-        value=[255, 255, 255],
-    )
-    mask = cv2.bitwise_not(mask)
+
+def __count_rhomboids(patches):
+    """Count the rhomboids delimited by the edges of each patch.
+
+    All patches are stacked vertically (with blank rows in between, so
+    that they do not touch) and processed by a single dilation and a
+    single contour search instead of one per patch.
+    """
+    num_of_patches = len(patches)
+
+    stacked = np.zeros((num_of_patches, 22, 21), np.uint8)
+    stacked[:, :21] = patches
+    dilated = cv2.dilate(stacked.reshape(-1, 21), None)
+    dilated = dilated.reshape(num_of_patches, 22, 21)[:, :21]
+
+    # Inverted masks, each with a one-pixel white border (black once
+    # inverted)
+    masks = np.zeros((num_of_patches, 23, 23), np.uint8)
+    masks[:, 1:-1, 1:-1] = cv2.bitwise_not(dilated)
 
     contours, _ = cv2.findContours(
-        mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
+        masks.reshape(-1, 23), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE
     )
 
-    _c = np.zeros((23, 23, 3), np.uint8)
-    num_rhomboid = 0
+    num_rhomboids = np.zeros(num_of_patches, int)
     for cnt in contours:
+        patch_idx = cnt[0, 0, 1] // 23
+        # Back to the coordinates within the patch
+        cnt = cnt - np.array([0, patch_idx * 23], cnt.dtype)
         _, radius = cv2.minEnclosingCircle(cnt)
         approx = cv2.approxPolyDP(cnt, 0.1 * cv2.arcLength(cnt, True), True)
         if len(approx) == 4 and radius < 14:
-            cv2.drawContours(_c, [cnt], 0, (0, 255, 0), 1)
-            num_rhomboid += 1
-        else:
-            cv2.drawContours(_c, [cnt], 0, (0, 0, 255), 1)
+            num_rhomboids[patch_idx] += 1
+    return num_rhomboids
 
-    if num_rhomboid == 4:
-        return True
 
-    # Neural detector if unable to decide using the geometric detector
-    X = [np.where(img > int(255 / 2), 1, 0).ravel()]
-    X = X[0].reshape([-1, 21, 21, 1]).astype("float32")
+def __are_lattice_points(gray_patches):
+    """Determine which patches are centered on a lattice point."""
+    if not gray_patches:
+        return np.zeros(0, bool)
+    patches = np.stack([__preprocess_patch(p) for p in gray_patches])
 
-    pred = __LAPS_SESS.run(None, {__LAPS_SESS.get_inputs()[0].name: X})[0][0]
-
-    return pred[0] > pred[1] and pred[1] < 0.03 and pred[0] > 0.975
+    # Geometric detector to filter easy points
+    are_lattice_points = __count_rhomboids(patches) == 4
+
+    # Neural detector (in batches) for the points the geometric detector
+    # is unable to decide
+    undecided = np.flatnonzero(~are_lattice_points)
+    if len(undecided) > 0:
+        X = np.where(patches[undecided] > int(255 / 2), 1, 0)
+        X = X.reshape([-1, 21, 21, 1]).astype("float32")
+
+        input_name = __LAPS_SESS.get_inputs()[0].name
+        pred = np.concatenate(
+            [
+                __LAPS_SESS.run(
+                    None, {input_name: X[i : i + LAPS_BATCH_SIZE]}
+                )[0]
+                for i in range(0, len(X), LAPS_BATCH_SIZE)
+            ]
+        )
+
+        are_lattice_points[undecided] = (
+            (pred[:, 0] > pred[:, 1])
+            & (pred[:, 1] < 0.03)
+            & (pred[:, 0] > 0.975)
+        )
+    return are_lattice_points
 
 
 def laps(img: np.ndarray, lines):
@@ -114,33 +150,35 @@ def laps(img: np.ndarray, lines):
         intersection_points, color=(255, 0, 0), size=2
     ).save("laps_in_queue")
 
-    points = []
-    for pt in intersection_points:
-        # Pixels are in integers
-        pt = (int(pt[0]), int(pt[1]))
+    # Pixels are in integers
+    pts = np.array(intersection_points, float).reshape(-1, 2).astype(int)
 
-        if pt[0] < 0 or pt[1] < 0:
-            continue
-
-        # Size of our analysis area
-        lx1 = max(0, int(pt[0] - __ANALYSIS_RADIUS - 1))
-        lx2 = max(0, int(pt[0] + __ANALYSIS_RADIUS))
-        ly1 = max(0, int(pt[1] - __ANALYSIS_RADIUS))
-        ly2 = max(0, int(pt[1] + __ANALYSIS_RADIUS + 1))
+    # Top-left corners of our analysis areas (the points whose area would
+    # be empty are not valid)
+    lx1 = np.maximum(0, pts[:, 0] - __ANALYSIS_RADIUS - 1)
+    ly1 = np.maximum(0, pts[:, 1] - __ANALYSIS_RADIUS)
+    valid = (
+        (pts >= 0).all(axis=1) & (lx1 < img.shape[1]) & (ly1 < img.shape[0])
+    )
 
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    candidates = []
+    gray_patches = []
+    for (x, y), x1, y1 in zip(pts[valid], lx1[valid], ly1[valid]):
+        candidates.append((int(x), int(y)))
         # Cropping for detector
-        dimg = img[ly1:ly2, lx1:lx2]
-        dimg_shape = np.shape(dimg)
-
-        # Not valid
-        if dimg_shape[0] <= 0 or dimg_shape[1] <= 0:
-            continue
-
-        # Detect if it is a lattice point
-        if not __is_lattice_point(dimg):
-            continue
-
-        points.append(pt)
+        gray_patches.append(
+            gray[y1 : y + __ANALYSIS_RADIUS + 1, x1 : x + __ANALYSIS_RADIUS]
+        )
+
+    # Detect which ones are lattice points
+    points = [
+        pt
+        for pt, is_lattice_point in zip(
+            candidates, __are_lattice_points(gray_patches)
+        )
+        if is_lattice_point
+    ]
 
     if points:
         points = __cluster_points(points)
@@ -169,8 +207,9 @@ def check_board_position(
     # We will check the interior 6x6 square grid lattice points of the
     # cropped 500x500 image, as done by LAPS
     cropped_img = image_object.image_transform(img, board_corners)
+    gray = cv2.cvtColor(cropped_img, cv2.COLOR_BGR2GRAY)
 
-    correct_points = 0
+    gray_patches = []
     for row_corner in range(150, 1200, 150):
         for col_corner in range(150, 1200, 150):
             # Size of our analysis area
@@ -180,15 +219,15 @@ def check_board_position(
             ly2 = max(0, int(col_corner + __ANALYSIS_RADIUS + 1))
 
             # Cropping for detector
-            dimg = cropped_img[ly1:ly2, lx1:lx2]
-            dimg_shape = np.shape(dimg)
+            dimg = gray[ly1:ly2, lx1:lx2]
 
             # Not valid
-            if dimg_shape[0] <= 0 or dimg_shape[1] <= 0:
+            if dimg.shape[0] <= 0 or dimg.shape[1] <= 0:
                 continue
 
-            # Detect if it is a lattice point
-            if __is_lattice_point(dimg):
-                correct_points += 1
+            gray_patches.append(dimg)
+
+    # Detect which ones are lattice points
+    correct_points = int(np.count_nonzero(__are_lattice_points(gray_patches)))
 
     return correct_points >= tolerance, cropped_img
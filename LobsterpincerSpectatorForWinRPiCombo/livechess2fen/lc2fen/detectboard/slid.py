@@ -1,6 +1,8 @@
 """This is the straight-line-detector module."""
 
+import concurrent.futures
 import math
+import threading
 
 import cv2
 import numpy as np
@@ -8,6 +10,40 @@ import numpy as np
 from livechess2fen.lc2fen.detectboard import debug
 
 
+__CLAHE_SETTINGS = [
+    [3, (2, 6), 5],  # @1
+    [3, (6, 2), 5],  # @2
+    [5, (3, 3), 5],  # @3
+    [0, (0, 0), 0],
+]  # EE
+"""CLAHE settings (clip limit, tile grid size, and number of iterations)."""
+
+# The pipelines of the different CLAHE settings are independent and
+# OpenCV releases the GIL, so they run concurrently
+__EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=len(__CLAHE_SETTINGS), thread_name_prefix="slid"
+)
+
+__SIMILARITY_BLOCK_SIZE = 256
+"""Number of lines whose similarities to all lines are computed at once."""
+
+# A CLAHE object must not be used by two threads at once, so each thread
+# builds its own ones (only once)
+__THREAD_LOCAL = threading.local()
+
+
+def __get_clahe(key):
+    """Return the CLAHE object of the given setting for this thread."""
+    if not hasattr(__THREAD_LOCAL, "clahes"):
+        __THREAD_LOCAL.clahes = {}
+    if key not in __THREAD_LOCAL.clahes:
+        limit, grid, _ = __CLAHE_SETTINGS[key]
+        __THREAD_LOCAL.clahes[key] = cv2.createCLAHE(
+            clipLimit=limit, tileGridSize=grid
+        )
+    return __THREAD_LOCAL.clahes[key]
+
+
 def __slid_segments(img):
     """Find all segments in the image using different settings.
 
@@ -26,17 +62,16 @@ def __slid_segments(img):
         upper = int(min(255, (1.0 + sigma) * v))
         return cv2.Canny(img, lower, upper)
 
-    def simplify_image(img, limit, grid, iters):
+    def simplify_image(img, key):
         """Simplify image using CLAHE algorithm.
 
-        This function simplifies an image using the CLAHE algorithm
-        (adaptive histogram equalization).
+        This function simplifies a grayscale image using the CLAHE
+        algorithm (adaptive histogram equalization) with the given
+        setting.
         """
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        limit, _, iters = __CLAHE_SETTINGS[key]
         for _ in range(iters):
-            img = cv2.createCLAHE(clipLimit=limit, tileGridSize=grid).apply(
-                img
-            )
+            img = __get_clahe(key).apply(img)
         debug.DebugImage(img).save("slid_clahe_@1")
         if limit != 0:
             kernel = np.ones((10, 10), np.uint8)
@@ -65,26 +100,87 @@ def __slid_segments(img):
             )
         return __lines
 
-    clahe_settings = [
-        [3, (2, 6), 5],  # @1
-        [3, (6, 2), 5],  # @2
-        [5, (3, 3), 5],  # @3
-        [0, (0, 0), 0],
-    ]  # EE
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    def detect_segments(key):
+        """Find the segments using the given CLAHE setting."""
+        edges = detect_edges(simplify_image(gray, key))
+        __segments = detect_lines(edges)
+        debug.DebugImage(edges).lines(__segments).save("pslid_F%d" % (key + 1))
+        return __segments
 
     segments = []
-    i = 0
-    for key, arr in enumerate(clahe_settings):
-        tmp = simplify_image(img, limit=arr[0], grid=arr[1], iters=arr[2])
-        __segments = detect_lines(detect_edges(tmp))
+    for __segments in __EXECUTOR.map(
+        detect_segments, range(len(__CLAHE_SETTINGS))
+    ):
         segments += __segments
-        i += 1
-        debug.DebugImage(detect_edges(tmp)).lines(__segments).save(
-            "pslid_F%d" % i
-        )
     return segments
 
 
+def __similar_lines(lines):
+    """Determine which pairs of lines are similar.
+
+    :param lines: `(n, 2, 2)` array of lines.
+
+        Note that a line is given by two points ((x1, y1), (x2, y2)).
+
+    :return: `(n, n)` boolean array whose element `[i, j]` indicates
+    whether `lines[i]` is similar to `lines[j]`.
+
+        The test is not exactly symmetric (because of floating-point
+        rounding), so, for `i < j`, element `[i, j]` is the one that
+        compares `lines[i]` to `lines[j]`.
+    """
+    lines = lines.astype(np.float64)
+    x1, y1, x2, y2 = lines.reshape(-1, 4).T
+    # Length of each line
+    length = np.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
+
+    def ptl_distance(line, point):
+        """Compute the distances from points to lines.
+
+        :param line: Tuple of the coordinates of the two points that
+            define the lines and of the lengths of the lines.
+
+        :param point: Pair of the coordinates of the points.
+
+        :return: Distances from the points to the lines.
+        """
+        lx1, ly1, lx2, ly2, dx = line
+        return (
+            abs(
+                (lx2 - lx1) * (ly1 - point[1]) - (ly2 - ly1) * (lx1 - point[0])
+            )
+            / dx
+        )
+
+    num_of_lines = len(lines)
+    similar = np.zeros((num_of_lines, num_of_lines), bool)
+    cols = (x1, y1, x2, y2, length)
+    for start in range(0, num_of_lines, __SIMILARITY_BLOCK_SIZE):
+        rows = tuple(
+            values[start : start + __SIMILARITY_BLOCK_SIZE, np.newaxis]
+            for values in cols
+        )
+        da, db = rows[4], cols[4]
+
+        d1a = ptl_distance(rows, (cols[0], cols[1]))
+        d2a = ptl_distance(rows, (cols[2], cols[3]))
+        d1b = ptl_distance(cols, (rows[0], rows[1]))
+        d2b = ptl_distance(cols, (rows[2], rows[3]))
+
+        # Average deviation from the straight line
+        avg_dev = 0.25 * (d1a + d1b + d2a + d2b) + 0.00001
+
+        # Allowed matching error
+        delta = 0.0625 * (da + db)
+
+        similar[start : start + __SIMILARITY_BLOCK_SIZE] = (
+            da / avg_dev > delta
+        ) & (db / avg_dev > delta)
+    return similar
+
+
 def __scale_lines(raw_lines) -> list:
     """Scale raw_lines by a factor.
 
@@ -121,156 +217,97 @@ def slid(img):
 
         Each line is a pair of points.
     """
-    group = {}
-    hashmap = {}
-    ptp_cache = {}
-
-    def ptp_distance(a, b):
-        """Calculate the point-to-point distance.
-
-        This function calculates the point-to-point distance with a
-        cache to avoid multiple calculations.
-        """
-        idx = hash("__dis" + str(a) + str(b))
-        if idx in ptp_cache:
-            return ptp_cache[idx]
-        ptp_cache[idx] = math.sqrt((a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2)
-        return ptp_cache[idx]
-
-    def ptl_distance(line, point, dx):
-        """Compute the distance from a point to a line.
-
-        :param line: Line defined by two points.
-
-        :param point: Point.
-
-        :param dx: Distance between the points that define the line.
-
-        :return: Distance from the point to the line.
-        """
-        return (
-            abs(
-                (line[1][0] - line[0][0]) * (line[0][1] - point[1])
-                - (line[1][1] - line[0][1]) * (line[0][0] - point[0])
-            )
-            / dx
+    # Find all segments in image
+    segments = np.array(__slid_segments(img), np.int64).reshape(-1, 2, 2)
+
+    # Identical segments are a single element of the union-find (the
+    # first of them)
+    if len(segments) > 0:
+        _, first_idx, inverse = np.unique(
+            segments.reshape(-1, 4),
+            axis=0,
+            return_index=True,
+            return_inverse=True,
         )
-
-    def similar_lines(line1, line2):
-        """Determine whether `line1` is similar to `line2`."""
-        da = ptp_distance(line1[0], line1[1])
-        db = ptp_distance(line2[0], line2[1])
-
-        d1a = ptl_distance(line1, line2[0], da)
-        d2a = ptl_distance(line1, line2[1], da)
-        d1b = ptl_distance(line2, line1[0], db)
-        d2b = ptl_distance(line2, line1[1], db)
-
-        # Average deviation from the straight line
-        avg_dev = 0.25 * (d1a + d1b + d2a + d2b) + 0.00001
-
-        # Allowed matching error
-        delta = 0.0625 * (da + db)
-
-        return da / avg_dev > delta and db / avg_dev > delta
-
-    X = {}
-
-    def __fi(x):
-        if x not in X:
-            X[x] = 0
-        if X[x] == x or X[x] == 0:
-            X[x] = x
-        else:
-            X[x] = __fi(X[x])
-        return X[x]
-
-    def __un(a, b):
-        """Union & find."""
-        ia, ib = __fi(a), __fi(b)
-        X[ia] = ib
-        group[ib] |= group[ia]
-
-    def generate_points(a, b, n):
-        """Return n equispaced points in segment given by a and b."""
-        points = []
-        t = 1 / n
-        for i in range(n):
-            x = a[0] + (b[0] - a[0]) * (i * t)
-            y = a[1] + (b[1] - a[1]) * (i * t)
-            points.append((int(x), int(y)))
-        return points
+        elements = first_idx[inverse.reshape(-1)]
+    else:
+        elements = np.zeros(0, int)
+    parents = np.arange(len(segments))
+
+    def find(x):
+        """Find the root of `x` (with path compression)."""
+        root = x
+        while parents[root] != root:
+            root = parents[root]
+        while parents[x] != root:
+            parents[x], x = root, parents[x]
+        return root
+
+    def generate_points(ends, n):
+        """Return n equispaced points in each segment given by ends."""
+        a = ends[:, np.newaxis, 0]
+        b = ends[:, np.newaxis, 1]
+        t = np.arange(n)[:, np.newaxis] * (1 / n)
+        return (a + (b - a) * t).astype(int).reshape(-1, 2)
 
     def merge_group(group, all_points):
         """Merge the group into a single line."""
-        points = []
-        for idx in group:
-            points += generate_points(*hashmap[idx], n=10)
-
-        all_points += points
-        na_points = np.array(points)
+        na_points = generate_points(segments[group], n=10)
+        all_points += na_points.tolist()
 
         _, radius = cv2.minEnclosingCircle(na_points)
         w = radius * (math.pi / 2)
-        vx, vy, cx, cy = cv2.fitLine(na_points, cv2.DIST_L2, 0, 0.01, 0.01)
+        vx, vy, cx, cy = cv2.fitLine(
+            na_points, cv2.DIST_L2, 0, 0.01, 0.01
+        ).ravel()
 
         return (
             (int(cx - vx * w), int(cy - vy * w)),
             (int(cx + vx * w), int(cy + vy * w)),
         )
 
-    # Find all segments in image
-    segments = __slid_segments(img)
-
     # Divide segments into vertical and horizontal
-    vh_segments = [[], []]
-    for l in segments:
-        h = hash(str(l))
-        hashmap[h] = l
-        group[h] = {h}
-        X[h] = h
-
-        t1 = l[0][0] - l[1][0]
-        t2 = l[0][1] - l[1][1]
-        if abs(t1) < abs(t2):  # If l is a vertical segment
-            vh_segments[0].append(l)
-        else:
-            vh_segments[1].append(l)
+    t1 = segments[:, 0, 0] - segments[:, 1, 0]
+    t2 = segments[:, 0, 1] - segments[:, 1, 1]
+    is_vertical = abs(t1) < abs(t2)
+    vh_segments = [np.flatnonzero(is_vertical), np.flatnonzero(~is_vertical)]
 
     debug.DebugImage(img.shape).lines(
-        vh_segments[0], color=debug.rand_color()
-    ).lines(vh_segments[1], color=debug.rand_color()).save("slid_pre_groups")
+        segments[vh_segments[0]].tolist(), color=debug.rand_color()
+    ).lines(segments[vh_segments[1]].tolist(), color=debug.rand_color()).save(
+        "slid_pre_groups"
+    )
 
+    # Each line that is not grouped yet absorbs the following lines (that
+    # are not grouped yet either) similar to it
     for lines in vh_segments:
-        for i in range(len(lines)):
-            l1 = lines[i]
-            h1 = hash(str(l1))
-            if X[h1] != h1:  # Line already grouped
+        similar = __similar_lines(segments[lines])
+        line_elements = elements[lines]
+        for i, e1 in enumerate(line_elements):
+            if parents[e1] != e1:  # Line already grouped
                 continue
-            for j in range(i + 1, len(lines)):
-                l2 = lines[j]
-                h2 = hash(str(l2))
-                if X[h2] != h2:
-                    continue
-
-                if similar_lines(l1, l2):
-                    __un(h1, h2)
+            following = line_elements[i + 1 :]
+            for e2 in following[
+                similar[i, i + 1 :] & (parents[following] == following)
+            ]:
+                parents[find(e1)] = find(e2)
+
+    # Groups (in the order of the segments of their roots)
+    groups = {}
+    for idx in np.flatnonzero(elements == np.arange(len(segments))):
+        groups.setdefault(find(idx), []).append(idx)
+    groups = [groups[root] for root in sorted(groups)]
 
     if debug.DEBUG:
         __d = debug.DebugImage(img.shape)
-        for i in group:
-            if X[i] != i:
-                continue
-            ls = [hashmap[h] for h in group[i]]
-            __d.lines(ls, color=debug.rand_color())
+        for group in groups:
+            __d.lines(segments[group].tolist(), color=debug.rand_color())
         __d.save("slid_all_groups")
 
     all_points = []
     raw_lines = []
-    for i in group:
-        if X[i] != i:
-            continue
-        raw_lines.append(merge_group(group[i], all_points))
+    for group in groups:
+        raw_lines.append(merge_group(group, all_points))
 
     lines = __scale_lines(raw_lines)
 
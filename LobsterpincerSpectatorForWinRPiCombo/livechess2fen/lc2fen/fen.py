@@ -1,7 +1,153 @@
-"""This module is responsible for FEN-related transformations."""
+"""This module is responsible for FEN-related transformations.
+
+Besides FEN strings, board matrices (`list[list[str]]`), and lists of
+pieces (`list[str]`), a board can be represented by a compact `uint8[64]`
+array of piece codes in FEN-notation order (the first element
+corresponds to the a8 square, the second to the b8 square, and so on).
+The code of a piece is its index in `PIECES`, which is also its column in
+the output of the chess-piece CNN, so the codes can directly index the
+piece probabilities.
+"""
+
+import numpy as np
+
 
 PIECE_TYPES = ["r", "n", "b", "q", "k", "p", "P", "R", "N", "B", "Q", "K", "_"]
 
+PIECES = "BKNPQR_bknpqr"
+"""Pieces in the order of their codes (`"_"` is an empty square)."""
+
+EMPTY = PIECES.index("_")
+"""Code of an empty square."""
+
+STATE_OF_CODE = np.array(
+    [0 if piece == "_" else 1 if piece.isupper() else 2 for piece in PIECES]
+)
+"""State of the square holding each piece code.
+
+The states are 0 (empty), 1 (white piece), and 2 (black piece).
+"""
+
+MIN_PROB = 1e-7
+"""Lower bound applied to the probabilities before taking logarithms."""
+
+_CHAR_TO_CODE = bytes(
+    PIECES.index(chr(char)) if chr(char) in PIECES else 255
+    for char in range(256)
+)
+
+_FEN_DIGITS_TO_EMPTY_SQUARES = str.maketrans(
+    {str(num): "_" * num for num in range(1, 9)}
+)
+
+_SQUARE_INDICES = np.arange(64).reshape(8, 8)
+
+ROTATIONS_TO_STANDARD_VIEW = {
+    "BL": _SQUARE_INDICES.ravel(),
+    "BR": np.rot90(_SQUARE_INDICES, -1).ravel(),  # Clockwise rotation
+    "TL": np.rot90(_SQUARE_INDICES, 1).ravel(),  # Counterclockwise rotation
+    "TR": np.rot90(_SQUARE_INDICES, 2).ravel(),  # 180 degree rotation
+}
+"""Permutations rotating 64 squares so that the a1 square ends up in BL.
+
+If `values` is indexed by the squares of an image whose a1 square is in
+the `a1_pos` corner, `values[ROTATIONS_TO_STANDARD_VIEW[a1_pos]]` is
+indexed in FEN-notation order.
+"""
+
+ROTATIONS_FROM_STANDARD_VIEW = {
+    a1_pos: np.argsort(permutation)
+    for a1_pos, permutation in ROTATIONS_TO_STANDARD_VIEW.items()
+}
+"""Inverse permutations of `ROTATIONS_TO_STANDARD_VIEW`."""
+
+LIGHT_SQUARES = ((_SQUARE_INDICES // 8 + _SQUARE_INDICES % 8) % 2 == 0).ravel()
+"""Length-64 boolean mask of the light squares in FEN-notation order."""
+
+
+def fen_to_codes(fen: str) -> np.ndarray:
+    """Translate a FEN string to an array of piece codes.
+
+    Note that the FEN string should only contain information of the
+    positions of the pieces.
+
+    :param fen: FEN string to translate.
+
+    :return: Length-64 `uint8` array of the piece codes (see `PIECES`)
+    in FEN-notation order.
+    """
+    rows = fen.translate(_FEN_DIGITS_TO_EMPTY_SQUARES).split(sep="/")
+
+    if len(rows) != 8:
+        raise ValueError(f"fen must have 8 rows: {fen}")
+    if any(len(row) != 8 for row in rows):
+        raise ValueError(f"Each fen row must have 8 positions: {fen}")
+
+    codes = "".join(rows).encode().translate(_CHAR_TO_CODE)
+    if 255 in codes:
+        raise ValueError(f"fen has an invalid piece: {fen}")
+    return np.frombuffer(codes, dtype=np.uint8).copy()
+
+
+def codes_to_fen(codes: np.ndarray) -> str:
+    """Translate an array of piece codes to a FEN string.
+
+    :param codes: Length-64 array of the piece codes (see `PIECES`) in
+        FEN-notation order.
+
+    :return: FEN string corresponding to the piece codes.
+    """
+    return board_to_fen(list_to_board(codes_to_list(codes)))
+
+
+def list_to_codes(pieces_list: list[str]) -> np.ndarray:
+    """Translate a list of pieces to an array of piece codes.
+
+    :param pieces_list: Length-64 list of pieces in FEN-notation order.
+
+    :return: Length-64 `uint8` array of the piece codes (see `PIECES`).
+    """
+    return np.array([PIECES.index(piece) for piece in pieces_list], np.uint8)
+
+
+def codes_to_list(codes: np.ndarray) -> list[str]:
+    """Translate an array of piece codes to a list of pieces.
+
+    :param codes: Length-64 array of the piece codes (see `PIECES`).
+
+    :return: Length-64 list of pieces.
+    """
+    return [PIECES[code] for code in codes.tolist()]
+
+
+def count_pieces(codes: np.ndarray) -> np.ndarray:
+    """Count the pieces of each type.
+
+    :param codes: Array of piece codes (see `PIECES`).
+
+    :return: Length-13 array of the numbers of pieces of each type (in
+    the order of `PIECES`).
+    """
+    return np.bincount(codes, minlength=len(PIECES))
+
+
+def rotate_to_standard_view(values: np.ndarray, a1_pos: str) -> np.ndarray:
+    """Rotate per-square values s.t. their a1 square ends up in BL corner.
+
+    :param values: Array whose first axis (of length 64) is indexed by
+        the squares of an image (row by row, from the top-left corner).
+
+    :param a1_pos: Position of the a1 square of the image.
+
+        This is the position of the a1 square (`"BL"`, `"BR"`, `"TL"`,
+        or `"TR"`) corresponding to the image.
+
+    :return: Array of the same values indexed in FEN-notation order.
+    """
+    if a1_pos not in ROTATIONS_TO_STANDARD_VIEW:
+        raise ValueError("a1_pos is not BL, BR, TL or TR")
+    return np.asarray(values)[ROTATIONS_TO_STANDARD_VIEW[a1_pos]]
+
 
 def fen_to_board(fen: str) -> list[list[str]]:
     """Translate a FEN string to a board matrix.
@@ -86,9 +232,12 @@ def list_to_board(pieces_list: list[str], a1_pos="BL") -> list[list[str]]:
     if len(pieces_list) != 64:
         raise ValueError("Input pieces list must be of length 64")
 
-    board = [pieces_list[ind : ind + 8] for ind in range(0, 64, 8)]
-    board = rotate_board_to_standard_view(board, a1_pos)
-    return board
+    if a1_pos not in ROTATIONS_TO_STANDARD_VIEW:
+        raise ValueError("a1_pos is not BL, BR, TL or TR")
+    pieces_list = [
+        pieces_list[ind] for ind in ROTATIONS_TO_STANDARD_VIEW[a1_pos]
+    ]
+    return [pieces_list[ind : ind + 8] for ind in range(0, 64, 8)]
 
 
 def board_to_list(board: list[list[str]]) -> list[str]:
@@ -138,17 +287,7 @@ def rotate_board_from_standard_view(
 
     :return: Rotated board matrix.
     """
-    if a1_pos == "BL":
-        return board
-    if a1_pos == "BR":  # Counterclockwise rotation
-        return list(map(list, zip(*board)))[::-1]
-    if a1_pos == "TL":  # Clockwise rotation
-        return list(map(list, zip(*board[::-1])))
-    if a1_pos == "TR":  # 180 degree rotation
-        tmp = list(map(list, zip(*board[::-1])))
-        return list(map(list, zip(*tmp[::-1])))
-
-    raise ValueError("a1_pos is not BL, BR, TL or TR")
+    return _permute_board(board, a1_pos, ROTATIONS_FROM_STANDARD_VIEW)
 
 
 def rotate_board_to_standard_view(
@@ -172,15 +311,29 @@ def rotate_board_to_standard_view(
         The rotated board matrix has its a1 square in the bottom-left
         corner.
     """
-    # In the next two comments, C = clockwise and CC = counterclockwise
-    if a1_pos == "BR":
-        a1_pos = "TL"  # Exchange 90-degree C and 90-degree CC rotations
-    elif a1_pos == "TL":
-        a1_pos = "BR"  # Exchange 90-degree C and 90-degree CC rotations
+    return _permute_board(board, a1_pos, ROTATIONS_TO_STANDARD_VIEW)
+
+
+def _permute_board(
+    board: list[list[str]], a1_pos: str, rotations: dict[str, np.ndarray]
+) -> list[list[str]]:
+    """Permute the squares of a board matrix.
 
-    return rotate_board_from_standard_view(
-        board, a1_pos
-    )  # The 180-degree rotations stay the same
+    :param board: Board matrix to permute.
+
+    :param a1_pos: Position of the a1 square (`"BL"`, `"BR"`, `"TL"`, or
+        `"TR"`) selecting the permutation.
+
+    :param rotations: `ROTATIONS_TO_STANDARD_VIEW` or
+        `ROTATIONS_FROM_STANDARD_VIEW`.
+
+    :return: Permuted board matrix.
+    """
+    if a1_pos not in rotations:
+        raise ValueError("a1_pos is not BL, BR, TL or TR")
+    squares = board_to_list(board)
+    squares = [squares[ind] for ind in rotations[a1_pos]]
+    return [squares[ind : ind + 8] for ind in range(0, 64, 8)]
 
 
 def compare_fen(fen1: str, fen2: str) -> int:
@@ -192,11 +345,4 @@ def compare_fen(fen1: str, fen2: str) -> int:
 
     :return: Number of positions that differ for the two FEN strings.
     """
-    board1 = fen_to_board(fen1)
-    board2 = fen_to_board(fen2)
-    count = 0
-    for i in range(8):
-        for j in range(8):
-            if board1[i][j] != board2[i][j]:
-                count += 1
-    return count
+    return int((fen_to_codes(fen1) != fen_to_codes(fen2)).sum())
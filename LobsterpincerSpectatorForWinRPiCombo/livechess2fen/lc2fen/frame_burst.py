@@ -0,0 +1,172 @@
+"""This module is responsible for combining a burst of frames.
+
+A single frame can be blurry (e.g., because the camera was refocusing or
+a hand was still leaving the board), in which case the chess-piece CNN
+misreads some of its squares and the board update is wasted. Instead,
+a short burst of frames is captured at each board update:
+
+1) The frames that are much blurrier than the sharpest one (according
+to `compute_sharpness()`, which is far cheaper than running the CNN)
+are dropped. The first frame (the one the board update was triggered
+on) stays the representative frame of the burst unless it is dropped
+itself.
+
+2) The squares of the remaining frames go through the model together
+(in the same batches), and their piece probabilities are averaged.
+"""
+
+import numpy as np
+
+
+SHARPNESS_STRIDE = 3
+"""Pixel stride used to subsample the squares before measuring sharpness."""
+
+MIN_RELATIVE_SHARPNESS = 0.7
+"""Fraction of the sharpest frame's sharpness a frame must reach.
+
+A frame of a burst whose sharpness is below this fraction of the
+sharpness of the sharpest frame of the burst is dropped.
+"""
+
+
+def compute_sharpness(piece_imgs: np.ndarray) -> float:
+    """Compute the sharpness of the squares of a frame.
+
+    The sharpness is the variance of the Laplacian of the (subsampled)
+    green channel of the squares (which carries most of the luminance),
+    which drops as soon as a frame gets blurry.
+
+    The Laplacian alone also responds to pixel-level sensor noise (a
+    frame with noise of standard deviation 6 scores up to 2.4 times the
+    clean frame on the test images), so the channel is first smoothed
+    with a 3x3 binomial kernel, which brings this down to 1.13 times
+    while blurred frames still score less than half of the clean one.
+
+    :param piece_imgs: `(64, img_size, img_size, 3)` array of
+        preprocessed squares (see "preprocess_squares.py").
+
+    :return: Sharpness of the squares (the higher, the sharper).
+    """
+    gray = np.ascontiguousarray(
+        piece_imgs[:, ::SHARPNESS_STRIDE, ::SHARPNESS_STRIDE, 1]
+    )
+    gray = (gray[:, :-2] + 2 * gray[:, 1:-1] + gray[:, 2:]) / 4
+    gray = (gray[:, :, :-2] + 2 * gray[:, :, 1:-1] + gray[:, :, 2:]) / 4
+    laplacian = (
+        4 * gray[:, 1:-1, 1:-1]
+        - gray[:, :-2, 1:-1]
+        - gray[:, 2:, 1:-1]
+        - gray[:, 1:-1, :-2]
+        - gray[:, 1:-1, 2:]
+    )
+    return float(laplacian.var(dtype=np.float64))
+
+
+def select_sharp_frames(frame_piece_imgs: np.ndarray) -> list[int]:
+    """Select the frames of a burst that are sharp enough.
+
+    :param frame_piece_imgs: `(k, 64, img_size, img_size, 3)` array of
+        the preprocessed squares of the `k` frames of the burst.
+
+    :return: Indices of the frames whose sharpness reaches
+    `MIN_RELATIVE_SHARPNESS` times that of the sharpest frame, from the
+    sharpest to the blurriest, except that the first frame (if it is
+    selected) comes first.
+
+        The frame that comes first is the representative frame of the
+        burst (whose squares the square signatures are computed from),
+        so a slightly noisier frame does not take the place of the first
+        frame just because noise looks like detail.
+    """
+    sharpnesses = np.array(
+        [compute_sharpness(piece_imgs) for piece_imgs in frame_piece_imgs]
+    )
+    order = np.argsort(-sharpnesses, kind="stable")
+    threshold = MIN_RELATIVE_SHARPNESS * sharpnesses[order[0]]
+    selected = [int(idx) for idx in order if sharpnesses[idx] >= threshold]
+    if 0 in selected:
+        selected.remove(0)
+        selected.insert(0, 0)
+    return selected
+
+
+def average_piece_probs(
+    obtain_piece_probs,
+    piece_imgs: np.ndarray,
+    burst_piece_imgs: np.ndarray | None = None,
+) -> np.ndarray:
+    """Obtain the piece probabilities averaged over the frames of a burst.
+
+    :param obtain_piece_probs: Image-to-prob function.
+
+        This function takes as input an `(n, img_size, img_size, 3)`
+        array of preprocessed squares and returns an `(n, 13)` array of
+        the corresponding piece probabilities.
+
+    :param piece_imgs: `(n, img_size, img_size, 3)` array of the
+        preprocessed squares of the first frame.
+
+    :param burst_piece_imgs: `(k, n, img_size, img_size, 3)` array of
+        the same squares in `k` other frames.
+
+        If it is `None` (or empty), only `piece_imgs` is run through the
+        model. Otherwise, the squares of all frames are run through the
+        model in a single call.
+
+    :return: `(n, 13)` array of the piece probabilities (averaged over
+    the frames).
+    """
+    if burst_piece_imgs is None or len(burst_piece_imgs) == 0:
+        return obtain_piece_probs(piece_imgs)
+
+    num_of_frames = len(burst_piece_imgs) + 1
+    batch = np.concatenate((piece_imgs[np.newaxis], burst_piece_imgs))
+    probs = np.asarray(
+        obtain_piece_probs(batch.reshape(-1, *piece_imgs.shape[1:]))
+    )
+    return probs.reshape(num_of_frames, len(piece_imgs), -1).mean(axis=0)
+
+
+if __name__ == "__main__":
+    # Note: run this file from the "LobsterpincerSpectatorForWinRPiCombo"
+    # directory with `python -m livechess2fen.lc2fen.frame_burst`
+    import time
+
+    import cv2
+
+    from livechess2fen.lc2fen.preprocess_squares import SquarePreprocessor
+
+    preprocessor = SquarePreprocessor(227)
+    board_img = cv2.imread("Test Images/test.png")
+    motion_blur_kernel = np.eye(15, dtype=np.float32) / 15
+    frames = {
+        "sharp": board_img,
+        "slightly noisy": np.clip(
+            board_img + np.random.default_rng(0).normal(0, 3, board_img.shape),
+            0,
+            255,
+        ).astype(np.uint8),
+        "noisy": np.clip(
+            board_img + np.random.default_rng(1).normal(0, 6, board_img.shape),
+            0,
+            255,
+        ).astype(np.uint8),
+        "out of focus": cv2.GaussianBlur(board_img, (0, 0), 3),
+        "motion-blurred": cv2.filter2D(board_img, -1, motion_blur_kernel),
+    }
+    frame_piece_imgs = np.stack(
+        [preprocessor(frame).copy() for frame in frames.values()]
+    )
+
+    for name, piece_imgs in zip(frames, frame_piece_imgs):
+        start_time = time.perf_counter()
+        sharpness = compute_sharpness(piece_imgs)
+        finish_time = time.perf_counter()
+        print(
+            f"\t{name}: sharpness {sharpness:.1f} "
+            f"(computed in {(finish_time - start_time) * 1000:.1f} ms)"
+        )
+    selected_names = [
+        list(frames)[idx] for idx in select_sharp_frames(frame_piece_imgs)
+    ]
+    print(f"\tSelected frames: {', '.join(selected_names)}")
@@ -8,44 +8,24 @@ import numpy as np
 import chess
 
 from livechess2fen.lc2fen.fen import (
-    board_to_list,
-    list_to_board,
+    PIECES,
+    EMPTY,
+    STATE_OF_CODE,
+    LIGHT_SQUARES,
     is_light_square,
-    fen_to_board,
+    fen_to_codes,
+    codes_to_list,
+    list_to_codes,
+    count_pieces,
+    rotate_to_standard_view,
 )
+from livechess2fen.lc2fen.decode_move import decode_moves, MIN_MARGIN
+from livechess2fen.lc2fen.optimal_assignment import assign_pieces_optimally
 
 
-_IDX_TO_PIECE_FULL = {
-    0: "B",
-    1: "K",
-    2: "N",
-    3: "P",
-    4: "Q",
-    5: "R",
-    6: "_",
-    7: "b",
-    8: "k",
-    9: "n",
-    10: "p",
-    11: "q",
-    12: "r",
-}
+_IDX_TO_PIECE_FULL = dict(enumerate(PIECES))
 
-_PIECE_TO_IDX_FULL = {
-    "B": 0,
-    "K": 1,
-    "N": 2,
-    "P": 3,
-    "Q": 4,
-    "R": 5,
-    "_": 6,
-    "b": 7,
-    "k": 8,
-    "n": 9,
-    "p": 10,
-    "q": 11,
-    "r": 12,
-}
+_PIECE_TO_IDX_FULL = {piece: idx for idx, piece in enumerate(PIECES)}
 
 _IDX_TO_PIECE = {
     0: "B",
@@ -79,219 +59,162 @@ _BLACK_PIECES = ("p", "b", "n", "r", "k", "q")
 _FILES = "abcdefgh"
 _RANKS = "87654321"
 
+_TYPE_TO_IDX_FULL = np.array(
+    [_PIECE_TO_IDX_FULL[_IDX_TO_PIECE[idx]] for idx in range(10)]
+)
+"""Column (in the order of `_IDX_TO_PIECE_FULL`) of each piece type."""
 
-def _sort_probs_by_piece_type(
-    probs_by_square: list[tuple[list[float], int]]
-) -> list[list[tuple[list[float], int]]]:
-    """Return a length-10 descending-order list of piece probabilities.
+_MAX_NUM_OF_PIECES = (2, 2, 8, 2, 2, 2, 2, 8, 2, 2)
+"""Maximum number of pieces of each type (in the order of `_IDX_TO_PIECE`).
 
-    This function returns a length-10 list of piece probabilities sorted
-    in descending order.
+The kings are not included.
+"""
 
-    :param probs_by_square: Length-64 list of piece probabilities.
+_CANDIDATE_TYPES = np.concatenate(
+    [
+        np.full(48 if _IDX_TO_PIECE[idx] in ("P", "p") else 64, idx)
+        for idx in range(10)
+    ]
+)
+"""Piece type of each (piece type, square) candidate.
 
-        Each tuple in the list corresponds to a unique square on the
-        chessboard.
+Pawns can't be in the first or last row, so there are 48 pawn candidates
+for either side and 64 candidates for any other piece type (the
+candidates are grouped by piece type in the order of `_IDX_TO_PIECE`).
+"""
 
-        The first element of each tuple is the list of piece
-        probabilities (in the order of `_PIECE_TO_IDX_FULL`) for the
-        corresponding square, while the second is
-        the integer specifying the position of the corresponding square
-        on the chessboard.
+_CANDIDATE_SQUARES = np.concatenate(
+    [
+        np.arange(8, 56) if _IDX_TO_PIECE[idx] in ("P", "p") else np.arange(64)
+        for idx in range(10)
+    ]
+)
+"""Square of each (piece type, square) candidate."""
 
-    :return: Length-10 list of piece probabilities.
+_CANDIDATE_STARTS = np.flatnonzero(np.diff(_CANDIDATE_TYPES, prepend=-1))
+"""Index of the first candidate of each piece type."""
 
-        Each element in the list is a sublist that corresponds to a
-        unique piece type (the piece types are in the order of
-        `_IDX_TO_PIECE`).
+_ROWS = np.arange(64) // 8
+"""Row index of each square (the `0` row index corresponds to the 8th rank)."""
 
-        Each sublist is either length-64 (for a nonpawn piece) or
-        length-48 (for a pawn).
+_ROW_OFFSETS = _ROWS[:, None] - _ROWS
+"""Row index of the initial square minus that of the final square.
 
-        Each tuple in a sublist corresponds to a unique square on the
-        chessboard.
+The first index of this `(64, 64)` array is the initial square, and the
+second is the final square (as in all the move-geometry tables below).
+"""
 
-        The first element of each tuple is the list of piece
-        probabilities (in the order of `_PIECE_TO_IDX_FULL`) for the
-        corresponding square, while the second is the integer specifying
-        the position of the corresponding square on the chessboard.
+_COL_DISTANCES = np.abs((np.arange(64) % 8)[:, None] - np.arange(64) % 8)
+"""Distance in files between the initial square and the final square."""
 
-        The tuples are ordered based on the piece probability; the first
-        tuple in a sublist corresponds to the square on the chessboard
-        that has the highest probability of having the piece type
-        corresponding to the sublist.
-    """
-    w_bishops = sorted(
-        probs_by_square,
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["B"]],
-        reverse=True,
-    )
-    w_knights = sorted(
-        probs_by_square,
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["N"]],
-        reverse=True,
-    )
-    w_pawns = sorted(
-        probs_by_square[8:-8],  # Pawns can't be in the first or last row
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["P"]],
-        reverse=True,
-    )
-    w_queens = sorted(
-        probs_by_square,
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["Q"]],
-        reverse=True,
-    )
-    w_rooks = sorted(
-        probs_by_square,
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["R"]],
-        reverse=True,
-    )
-    b_bishops = sorted(
-        probs_by_square,
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["b"]],
-        reverse=True,
-    )
-    b_knights = sorted(
-        probs_by_square,
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["n"]],
-        reverse=True,
-    )
-    b_pawns = sorted(
-        probs_by_square[8:-8],  # Pawns can't be in the first or last row
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["p"]],
-        reverse=True,
-    )
-    b_queens = sorted(
-        probs_by_square,
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["q"]],
-        reverse=True,
-    )
-    b_rooks = sorted(
-        probs_by_square,
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["r"]],
-        reverse=True,
-    )
-    return [
-        w_bishops,
-        w_knights,
-        w_pawns,
-        w_queens,
-        w_rooks,
-        b_bishops,
-        b_knights,
-        b_pawns,
-        b_queens,
-        b_rooks,
-    ]
+_KING_MOVES = (np.abs(_ROW_OFFSETS) <= 1) & (_COL_DISTANCES <= 1)
+"""Whether a move could have been a king move.
 
+A king can move at most one square in any direction (horizontally,
+vertically, or diagonally).
+"""
 
-def _piece_with_highest_prob(
-    top_probs_by_type: list[tuple[list[float], int]]
-) -> int:
-    """Determine the piece that has the highest piece probability.
+_ROOK_MOVES = (_ROW_OFFSETS == 0) | (_COL_DISTANCES == 0)
+"""Whether a move could have been a rook move.
 
-    This function determines the piece that has the highest piece
-    probability across the entire chessboard.
+A rook can move any number of squares (without jumping over any piece)
+along the same rank or file.
+"""
 
-    See "infer_pieces.png" (in the "docs" folder) for a visualization of
-    the algorithm.
+_BISHOP_MOVES = np.abs(_ROW_OFFSETS) == _COL_DISTANCES
+"""Whether a move could have been a bishop move.
 
-    :param top_probs_by_type: Length-10 list of piece probabilities.
+A bishop can move any number of squares (without jumping over any piece)
+diagonally.
+"""
 
-        Each element in the list is a tuple that corresponds to a unique
-        piece type (the piece types are in the order of
-        `_IDX_TO_PIECE`).
+_KNIGHT_MOVES = np.abs(_ROW_OFFSETS) * _COL_DISTANCES == 2
+"""Whether a move could have been a knight move.
 
-        Each tuple also corresponds to the square on the chessboard that
-        has the highest probability of having the corresponding piece
-        type.
+A knight moves in an L-shape (diagonal of a 2x3 rectangle) fashion.
+"""
 
-        The first element of each tuple is the list of piece
-        probabilities (in the
-        order of `_PIECE_TO_IDX_FULL`) for the corresponding square,
-        while the second is the integer specifying the position of the
-        corresponding square on the chessboard.
+_PAWN_MOVES = np.array(
+    [
+        [
+            (_COL_DISTANCES == 0)
+            & (
+                (_ROW_OFFSETS == -1)
+                | ((_ROW_OFFSETS == -2) & (_ROWS[:, None] == 1))
+            ),
+            (_COL_DISTANCES == 1) & (_ROW_OFFSETS == -1),
+        ],
+        [
+            (_COL_DISTANCES == 0)
+            & (
+                (_ROW_OFFSETS == 1)
+                | ((_ROW_OFFSETS == 2) & (_ROWS[:, None] == 6))
+            ),
+            (_COL_DISTANCES == 1) & (_ROW_OFFSETS == 1),
+        ],
+    ]
+)
+"""Whether a move could have been a pawn move.
 
-    :return: Index (between 0 and 9) specifying which piece has the
-    highest piece probability on any square on the chessboard.
-    """
-    # Set the initial maximum probability and index to the first piece
-    # in the list
-    value = top_probs_by_type[_PIECE_TO_IDX["B"]][0][_PIECE_TO_IDX_FULL["B"]]
-    idx = _PIECE_TO_IDX["B"]
-    if (
-        top_probs_by_type[_PIECE_TO_IDX["N"]][0][_PIECE_TO_IDX_FULL["N"]]
-        > value
-    ):
-        value = top_probs_by_type[_PIECE_TO_IDX["N"]][0][
-            _PIECE_TO_IDX_FULL["N"]
-        ]
-        idx = _PIECE_TO_IDX["N"]
-    if (
-        top_probs_by_type[_PIECE_TO_IDX["P"]][0][_PIECE_TO_IDX_FULL["P"]]
-        > value
-    ):
-        value = top_probs_by_type[_PIECE_TO_IDX["P"]][0][
-            _PIECE_TO_IDX_FULL["P"]
-        ]
-        idx = _PIECE_TO_IDX["P"]
-    if (
-        top_probs_by_type[_PIECE_TO_IDX["Q"]][0][_PIECE_TO_IDX_FULL["Q"]]
-        > value
-    ):
-        value = top_probs_by_type[_PIECE_TO_IDX["Q"]][0][
-            _PIECE_TO_IDX_FULL["Q"]
-        ]
-        idx = _PIECE_TO_IDX["Q"]
-    if (
-        top_probs_by_type[_PIECE_TO_IDX["R"]][0][_PIECE_TO_IDX_FULL["R"]]
-        > value
-    ):
-        value = top_probs_by_type[_PIECE_TO_IDX["R"]][0][
-            _PIECE_TO_IDX_FULL["R"]
-        ]
-        idx = _PIECE_TO_IDX["R"]
-    if (
-        top_probs_by_type[_PIECE_TO_IDX["b"]][0][_PIECE_TO_IDX_FULL["b"]]
-        > value
-    ):
-        value = top_probs_by_type[_PIECE_TO_IDX["b"]][0][
-            _PIECE_TO_IDX_FULL["b"]
-        ]
-        idx = _PIECE_TO_IDX["b"]
-    if (
-        top_probs_by_type[_PIECE_TO_IDX["n"]][0][_PIECE_TO_IDX_FULL["n"]]
-        > value
-    ):
-        value = top_probs_by_type[_PIECE_TO_IDX["n"]][0][
-            _PIECE_TO_IDX_FULL["n"]
-        ]
-        idx = _PIECE_TO_IDX["n"]
-    if (
-        top_probs_by_type[_PIECE_TO_IDX["p"]][0][_PIECE_TO_IDX_FULL["p"]]
-        > value
-    ):
-        value = top_probs_by_type[_PIECE_TO_IDX["p"]][0][
-            _PIECE_TO_IDX_FULL["p"]
-        ]
-        idx = _PIECE_TO_IDX["p"]
-    if (
-        top_probs_by_type[_PIECE_TO_IDX["q"]][0][_PIECE_TO_IDX_FULL["q"]]
-        > value
-    ):
-        value = top_probs_by_type[_PIECE_TO_IDX["q"]][0][
-            _PIECE_TO_IDX_FULL["q"]
-        ]
-        idx = _PIECE_TO_IDX["q"]
-    if (
-        top_probs_by_type[_PIECE_TO_IDX["r"]][0][_PIECE_TO_IDX_FULL["r"]]
-        > value
-    ):
-        # value = top_probs_by_type[_PIECE_TO_IDX["r"]][0][
-        #     _PIECE_TO_IDX_FULL["r"]
-        # ]
-        idx = _PIECE_TO_IDX["r"]
-    return idx
+The first index of this `(2, 2, 64, 64)` array is whether the pawn is
+white, and the second is whether the move is a capture.
+
+A pawn can move one square (or two squares if it hasn't moved yet)
+forward along the same file and capture one square forward diagonally.
+"""
+
+_EN_PASSANT_MOVES = np.array(
+    [
+        _PAWN_MOVES[0, 1] & (_ROWS[:, None] == 4),
+        _PAWN_MOVES[1, 1] & (_ROWS[:, None] == 3),
+    ]
+)
+"""Whether a move could have been an en passant.
+
+The first index of this `(2, 64, 64)` array is whether the pawn is
+white. A pawn can only capture en passant from the 5th rank (white) or the 4th
+rank (black).
+"""
+
+_MOVE_GEOMETRY = np.array(
+    [
+        (
+            _PAWN_MOVES[int(piece == "P")]
+            if piece in ("P", "p")
+            else [
+                {
+                    "B": _BISHOP_MOVES,
+                    "K": _KING_MOVES,
+                    "N": _KNIGHT_MOVES,
+                    "Q": _ROOK_MOVES | _BISHOP_MOVES,
+                    "R": _ROOK_MOVES,
+                    "_": np.zeros((64, 64), dtype=bool),
+                }[piece.upper()]
+            ]
+            * 2
+        )
+        for piece in _IDX_TO_PIECE_FULL.values()
+    ]
+)
+"""Whether a move could have been made by a piece.
+
+The first index of this `(13, 2, 64, 64)` array is the piece code (in
+the order of `_IDX_TO_PIECE_FULL`), and the second is whether the move
+is a capture. Whether a piece is blocked by other pieces is not taken
+into account.
+"""
+
+_CASTLING_MOVES = {
+    (_PIECE_TO_IDX_FULL["K"], 60, 62): "white_castles_kingside",
+    (_PIECE_TO_IDX_FULL["K"], 60, 58): "white_castles_queenside",
+    (_PIECE_TO_IDX_FULL["k"], 4, 6): "black_castles_kingside",
+    (_PIECE_TO_IDX_FULL["k"], 4, 2): "black_castles_queenside",
+}
+"""Action of each castling move.
+
+The keys are the piece code of the king and the initial and final
+squares of the king (as per the UCI notation).
+"""
 
 
 def _check_bishop(
@@ -383,14 +306,16 @@ def _check_bishop(
 
 
 def _determine_promoted_piece(
-    previous_fen: str,
+    previous_counts: np.ndarray,
     probs_with_no_indices: list[list[float]],
     final_sq: int,
     color: str,
 ) -> str:
     """Determine the promoted piece.
 
-    :param previous_fen: FEN string of the previous board position.
+    :param previous_counts: Length-13 array of the numbers of pieces of
+        each type (in the order of `_IDX_TO_PIECE_FULL`) in the previous
+        board position.
 
     :param probs_with_no_indices: Length-64 list of piece probabilities.
 
@@ -401,7 +326,7 @@ def _determine_promoted_piece(
         `_IDX_TO_PIECE_FULL`) for the corresponding square.
 
         The probabilities come from the convolutional neural network
-        (see the `obtain_piece_probs_for_all_64_squares()` function
+        (see the `obtain_piece_probs()` function
         in "predict_board.py").
 
     :param final_sq: Integer specifying the square of interest.
@@ -424,7 +349,7 @@ def _determine_promoted_piece(
         if (
             probs_with_no_indices[final_sq][_PIECE_TO_IDX_FULL["Q"]]
             > highest_prob
-            and previous_fen.count("Q") < 2
+            and previous_counts[_PIECE_TO_IDX_FULL["Q"]] < 2
         ):
             promoted_piece = "Q"
             highest_prob = probs_with_no_indices[final_sq][
@@ -433,7 +358,7 @@ def _determine_promoted_piece(
         if (
             probs_with_no_indices[final_sq][_PIECE_TO_IDX_FULL["N"]]
             > highest_prob
-            and previous_fen.count("N") < 2
+            and previous_counts[_PIECE_TO_IDX_FULL["N"]] < 2
         ):
             promoted_piece = "N"
             highest_prob = probs_with_no_indices[final_sq][
@@ -442,7 +367,7 @@ def _determine_promoted_piece(
         if (
             probs_with_no_indices[final_sq][_PIECE_TO_IDX_FULL["R"]]
             > highest_prob
-            and previous_fen.count("R") < 2
+            and previous_counts[_PIECE_TO_IDX_FULL["R"]] < 2
         ):
             promoted_piece = "R"
             highest_prob = probs_with_no_indices[final_sq][
@@ -451,14 +376,14 @@ def _determine_promoted_piece(
         if (
             probs_with_no_indices[final_sq][_PIECE_TO_IDX_FULL["B"]]
             > highest_prob
-            and previous_fen.count("B") < 2
+            and previous_counts[_PIECE_TO_IDX_FULL["B"]] < 2
         ):
             promoted_piece = "B"
     else:
         if (
             probs_with_no_indices[final_sq][_PIECE_TO_IDX_FULL["q"]]
             > highest_prob
-            and previous_fen.count("q") < 2
+            and previous_counts[_PIECE_TO_IDX_FULL["q"]] < 2
         ):
             promoted_piece = "q"
             highest_prob = probs_with_no_indices[final_sq][
@@ -467,7 +392,7 @@ def _determine_promoted_piece(
         if (
             probs_with_no_indices[final_sq][_PIECE_TO_IDX_FULL["n"]]
             > highest_prob
-            and previous_fen.count("n") < 2
+            and previous_counts[_PIECE_TO_IDX_FULL["n"]] < 2
         ):
             promoted_piece = "n"
             highest_prob = probs_with_no_indices[final_sq][
@@ -476,7 +401,7 @@ def _determine_promoted_piece(
         if (
             probs_with_no_indices[final_sq][_PIECE_TO_IDX_FULL["r"]]
             > highest_prob
-            and previous_fen.count("r") < 2
+            and previous_counts[_PIECE_TO_IDX_FULL["r"]] < 2
         ):
             promoted_piece = "r"
             highest_prob = probs_with_no_indices[final_sq][
@@ -485,7 +410,7 @@ def _determine_promoted_piece(
         if (
             probs_with_no_indices[final_sq][_PIECE_TO_IDX_FULL["b"]]
             > highest_prob
-            and previous_fen.count("b") < 2
+            and previous_counts[_PIECE_TO_IDX_FULL["b"]] < 2
         ):
             promoted_piece = "b"
     # Note that if the provided previous FEN is correct,
@@ -495,6 +420,7 @@ def _determine_promoted_piece(
 
 def _generate_fen_based_on_previous_fen_and_detected_move(
     previous_fen: str,
+    previous_codes: np.ndarray,
     move: tuple[int, int, str],
     probs_with_no_indices: list[list[float]],
 ) -> tuple[str, str]:
@@ -502,6 +428,9 @@ def _generate_fen_based_on_previous_fen_and_detected_move(
 
     :param previous_fen: FEN string of the previous board position.
 
+    :param previous_codes: Length-64 array of the piece codes of the
+        previous board position (see `fen_to_codes()` in "fen.py").
+
     :param move: Tuple containing information on the detected move.
 
         The first element of the tuple specifies the initial square, the
@@ -517,7 +446,7 @@ def _generate_fen_based_on_previous_fen_and_detected_move(
         `_IDX_TO_PIECE_FULL`) for the corresponding square.
 
         The probabilities come from the convolutional neural network
-        (see the `obtain_piece_probs_for_all_64_squares()` function
+        (see the `obtain_piece_probs()` function
         in "predict_board.py").
 
     :return: FEN string of the current board position and detected move
@@ -525,7 +454,8 @@ def _generate_fen_based_on_previous_fen_and_detected_move(
     """
     assert previous_fen is not None
     assert move is not None
-    previous_list = board_to_list(fen_to_board(previous_fen))
+    previous_list = codes_to_list(previous_codes)
+    previous_counts = count_pieces(previous_codes)
     previous_board = chess.Board(previous_fen)
     initial_sq, final_sq, action = move
     initial_coordinates = _FILES[initial_sq % 8] + _RANKS[initial_sq // 8]
@@ -539,7 +469,7 @@ def _generate_fen_based_on_previous_fen_and_detected_move(
         previous_list[initial_sq] == "P" and initial_coordinates[1] == "7"
     ):  # White promotes (and we have to figure out the promoted piece)
         promoted_piece = _determine_promoted_piece(
-            previous_fen, probs_with_no_indices, final_sq, "white"
+            previous_counts, probs_with_no_indices, final_sq, "white"
         )
         move_uci = move_uci + promoted_piece.lower()
         previous_board.push_uci(move_uci)
@@ -552,7 +482,7 @@ def _generate_fen_based_on_previous_fen_and_detected_move(
         previous_list[initial_sq] == "p" and initial_coordinates[1] == "2"
     ):  # Black promotes (and we have to figure out the promoted piece)
         promoted_piece = _determine_promoted_piece(
-            previous_fen, probs_with_no_indices, final_sq, "black"
+            previous_counts, probs_with_no_indices, final_sq, "black"
         )
         move_uci = move_uci + promoted_piece
         previous_board.push_uci(move_uci)
@@ -614,7 +544,7 @@ def _determine_most_probable_white_piece(
         `_IDX_TO_PIECE_FULL`) for the corresponding square.
 
         The probabilities come from the convolutional neural network
-        (see the `obtain_piece_probs_for_all_64_squares()` function
+        (see the `obtain_piece_probs()` function
         in "predict_board.py").
 
     :param square: Integer specifying the square of interest.
@@ -679,7 +609,7 @@ def _determine_most_probable_black_piece(
         `_IDX_TO_PIECE_FULL`) for the corresponding square.
 
         The probabilities come from the convolutional neural network
-        (see the `obtain_piece_probs_for_all_64_squares()` function
+        (see the `obtain_piece_probs()` function
         in "predict_board.py").
 
     :param square: Integer specifying the square of interest.
@@ -730,171 +660,213 @@ def _determine_most_probable_black_piece(
     return most_probable_piece
 
 
-def _check_balance_among_pawns_queens_and_bishops(
-    piece_type: str,
-    max_pieces_left: list[int],
-    B_light_squared: int,
-    B_dark_squared: int,
-    b_light_squared: int,
-    b_dark_squared: int,
+def _is_balanced_after_placing(
+    type_idx: int,
     square: int,
+    max_pieces_left: np.ndarray,
+    num_of_bishops: np.ndarray,
 ) -> bool:
     """Check the balance among pawns, queens, and bishops on the board.
 
-    This function determines whether the numbers of pawns, queens, and
-    bishops make sense for a standard physical chess set after placing
-    another piece. For example, if there are 2 light-squared bishops and
-    2 queens for white, then the number of pawns that white has must be
-    at most 6 (so if there are already 6 pawns on the board, we cannot
-    place another pawn on the board).
+    For example, if there are 2 light-squared bishops and 2 queens for
+    white, then the number of pawns that white has must be at most 6 (so
+    if there are already 6 pawns on the board, we cannot place another
+    pawn on the board).
 
-    :param piece_type: Which piece we are about to place on the board.
+    :param type_idx: Index (between 0 and 9) specifying which piece we
+        are about to place on the board.
+
+    :param square: Integer specifying the square of interest.
 
-    :param max_pieces_left: Length-10 list of integers.
+    :param max_pieces_left: Length-10 array of integers.
 
         The 10 integers, in the order of `_IDX_TO_PIECE`, specifies how
         many additional pieces we may place on the rest of the board.
 
-    :param B_light_squared: Number of white's light-squared bishops.
+    :param num_of_bishops: `(2, 2)` array of the bishop counts.
 
-        This is the number of light-squared bishops that white already
-        has.
+        The rows correspond to white and black, while the columns
+        correspond to light-squared and dark-squared bishops.
 
-    :param B_dark_squared: Number of  white's dark-squared bishops.
+    :return: Whether placing the piece would affect the balance among
+    pawns, queens, and bishops on the chessboard.
+    """
+    piece_type = _IDX_TO_PIECE[type_idx]
+    if piece_type.upper() not in ("P", "Q", "B"):
+        return True
 
-        This is the number of dark-squared bishops that white already
-        has.
+    white = piece_type.isupper()
+    num_of_queens_left = max_pieces_left[
+        _PIECE_TO_IDX["Q" if white else "q"]
+    ] - (piece_type.upper() == "Q")
+    num_of_pawns_left = max_pieces_left[
+        _PIECE_TO_IDX["P" if white else "p"]
+    ] - (piece_type.upper() == "P")
+    num_of_light_squared, num_of_dark_squared = num_of_bishops[
+        0 if white else 1
+    ].tolist()
+    if piece_type.upper() == "B":
+        if LIGHT_SQUARES[square]:
+            num_of_light_squared += 1
+        else:
+            num_of_dark_squared += 1
 
-    :param b_light_squared: Number of black's light-squared bishops.
+    # Whether a pawn has promoted into a queen and into a bishop
+    num_of_promotions = int(num_of_queens_left == 0) + int(
+        num_of_light_squared == 2 or num_of_dark_squared == 2
+    )
+    return num_of_promotions <= num_of_pawns_left
 
-        This is the number of light-squared bishops that black already
-        has.
 
-    :param b_dark_squared: Number of black's dark-squared bishops.
+def _infer_pieces_greedily(
+    probs_with_no_indices: list[list[float]],
+) -> list[str]:
+    """Infer the pieces one at a time, without any previous position.
 
-        This is the number of dark-squared bishops that black already
-        has.
+    The kings are placed first, then the empty squares are identified,
+    and then the other pieces are placed in order of probability (see
+    "infer_pieces.png" in the "docs" folder), as long as each piece type
+    has pieces left and the pawns, queens, and bishops stay balanced.
 
-    :param square: Integer specifying the square of interest.
+    All (piece type, square) candidates are sorted at once (by
+    descending probability, then by piece type, then by square, which is
+    exactly the order in which the original loop over ten per-type
+    sorted lists visited them), and the candidates whose square has been
+    determined or whose piece type has been maxed are skipped with masks.
 
-        This integer specifies which square we are interested in placing
-        the piece on.
+    :param probs_with_no_indices: Length-64 list of piece probabilities
+        in FEN-notation order (see `infer_chess_pieces()`).
 
-    :return: Whether placing the piece would affect the balance among
-    pawns, queens, and bishops on the chessboard.
+    :return: Length-64 list of the inferred chess pieces in
+    FEN-notation order.
     """
-    if not piece_type in ["P", "p", "Q", "q", "B", "b"]:
-        return True
-    elif piece_type == "P" and (
-        (
-            (
-                max_pieces_left[_PIECE_TO_IDX["Q"]] == 0
-            )  # Whether a white pawn has promoted into a queen
-            + max(
-                B_dark_squared == 2, B_light_squared == 2
-            )  # Whether a white pawn has promoted into a bishop
-        )
-        <= (max_pieces_left[_PIECE_TO_IDX["P"]] - 1)
-    ):
-        return True
-    elif piece_type == "p" and (
-        (
-            (
-                max_pieces_left[_PIECE_TO_IDX["q"]] == 0
-            )  # Whether a black pawn has promoted into a queen
-            + max(
-                b_dark_squared == 2, b_light_squared == 2
-            )  # Whether a black pawn has promoted into a bishop
-        )
-        <= (max_pieces_left[_PIECE_TO_IDX["p"]] - 1)
-    ):
-        return True
-    elif piece_type == "Q" and (
-        (
-            ((max_pieces_left[_PIECE_TO_IDX["Q"]] - 1) == 0)
-            + max(
-                B_dark_squared == 2, B_light_squared == 2
-            )  # Whether a white pawn has promoted into a bishop
-        )
-        <= max_pieces_left[_PIECE_TO_IDX["P"]]
-    ):
-        return True
-    elif piece_type == "q" and (
-        (
-            ((max_pieces_left[_PIECE_TO_IDX["q"]] - 1) == 0)
-            + max(
-                b_dark_squared == 2, b_light_squared == 2
-            )  # Whether a black pawn has promoted into a bishop
-        )
-        <= max_pieces_left[_PIECE_TO_IDX["p"]]
-    ):
-        return True
-    elif (
-        piece_type == "B"
-        and not is_light_square(square)
-        and (
-            (
-                (
-                    max_pieces_left[_PIECE_TO_IDX["Q"]] == 0
-                )  # Whether a white pawn has promoted into a queen
-                + max(
-                    (B_dark_squared + 1) == 2, B_light_squared == 2
-                )  # Whether white is about to have 2 dark-squared bishops
-            )
-            <= max_pieces_left[_PIECE_TO_IDX["P"]]
-        )
-    ):
-        return True
-    elif (
-        piece_type == "B"
-        and is_light_square(square)
-        and (
-            (
-                (
-                    max_pieces_left[_PIECE_TO_IDX["Q"]] == 0
-                )  # Whether a white pawn has promoted into a queen
-                + max(
-                    B_dark_squared == 2, (B_light_squared + 1) == 2
-                )  # Whether white is about to have 2 light-squared bishops
-            )
-            <= max_pieces_left[_PIECE_TO_IDX["P"]]
-        )
-    ):
-        return True
-    elif (
-        piece_type == "b"
-        and not is_light_square(square)
-        and (
-            (
-                (
-                    max_pieces_left[_PIECE_TO_IDX["q"]] == 0
-                )  # Whether a black pawn has promoted into a queen
-                + max(
-                    (b_dark_squared + 1) == 2, b_light_squared == 2
-                )  # Whether black is about to have 2 dark-squared bishops
-            )
-            <= max_pieces_left[_PIECE_TO_IDX["p"]]
-        )
+    probs = np.asarray(probs_with_no_indices, dtype=np.float64)
+    predicted_piece_list = [None] * 64
+    undetermined = np.ones(64, dtype=bool)
+
+    # First determine the king locations (one white king and one black
+    # king, on different squares)
+    white_king = int(np.argmax(probs[:, _PIECE_TO_IDX_FULL["K"]]))
+    black_king_probs = probs[:, _PIECE_TO_IDX_FULL["k"]].copy()
+    black_king_probs[white_king] = -np.inf
+    black_king = int(np.argmax(black_king_probs))
+    predicted_piece_list[white_king] = "K"
+    predicted_piece_list[black_king] = "k"
+    undetermined[[white_king, black_king]] = False
+
+    # Then identify the empty squares
+    empty = undetermined & (
+        np.argmax(probs, axis=1) == _PIECE_TO_IDX_FULL["_"]
+    )
+    for square in np.flatnonzero(empty):
+        predicted_piece_list[square] = "_"
+    undetermined &= ~empty
+    num_of_undetermined_squares = int(undetermined.sum())
+
+    # Sort all the candidates; the pieces are placed until the last
+    # candidate of any piece type is visited, at which point the model
+    # is not accurate enough to predict a balanced board configuration
+    candidate_probs = probs[
+        _CANDIDATE_SQUARES, _TYPE_TO_IDX_FULL[_CANDIDATE_TYPES]
+    ]
+    order = np.lexsort(
+        (_CANDIDATE_SQUARES, _CANDIDATE_TYPES, -candidate_probs)
+    )
+    positions = np.empty_like(order)
+    positions[order] = np.arange(len(order))
+    last_position = np.maximum.reduceat(positions, _CANDIDATE_STARTS).min()
+    types = _CANDIDATE_TYPES[order[: last_position + 1]]
+    squares = _CANDIDATE_SQUARES[order[: last_position + 1]]
+
+    max_pieces_left = np.array(_MAX_NUM_OF_PIECES)
+    num_of_bishops = np.zeros((2, 2), dtype=int)
+    # The candidates on the squares determined so far (i.e., the kings
+    # and the empty squares) can never be placed, so they are masked out
+    # at once; the squares determined or the piece types maxed later on
+    # are checked one candidate at a time
+    viable_positions = np.flatnonzero(undetermined[squares])
+    failed_to_complete_prediction = num_of_undetermined_squares > 0
+    for position, type_idx, square in zip(
+        viable_positions.tolist(),
+        types[viable_positions].tolist(),
+        squares[viable_positions].tolist(),
     ):
-        return True
-    elif (
-        piece_type == "b"
-        and is_light_square(square)
-        and (
-            (
-                (
-                    max_pieces_left[_PIECE_TO_IDX["q"]] == 0
-                )  # Whether a black pawn has promoted into a queen
-                + max(
-                    b_dark_squared == 2, (b_light_squared + 1) == 2
-                )  # Whether black is about to have 2 light-squared bishops
+        if (
+            undetermined[square]
+            and max_pieces_left[type_idx] > 0
+            and _is_balanced_after_placing(
+                type_idx, square, max_pieces_left, num_of_bishops
             )
-            <= max_pieces_left[_PIECE_TO_IDX["p"]]
+        ):
+            piece_type = _IDX_TO_PIECE[type_idx]
+            predicted_piece_list[square] = piece_type
+            undetermined[square] = False
+            num_of_undetermined_squares -= 1
+            max_pieces_left[type_idx] -= 1
+            if piece_type in ("B", "b"):
+                num_of_bishops[
+                    0 if piece_type == "B" else 1,
+                    0 if LIGHT_SQUARES[square] else 1,
+                ] += 1
+
+        if position == last_position:  # Ran out of candidates
+            break
+        if num_of_undetermined_squares == 0:
+            failed_to_complete_prediction = False
+            break
+
+    if failed_to_complete_prediction:
+        _print_unbalanced_prediction_warning()
+        _complete_prediction_by_brute_force(
+            probs_with_no_indices, predicted_piece_list
         )
-    ):
-        return True
-    else:
-        return False
+
+    return predicted_piece_list
+
+
+def _print_unbalanced_prediction_warning():
+    """Warn that the model could not predict a balanced board."""
+    print(
+        "\tWarning: the selected model is not accurate enough to "
+        "predict a balanced board configuration"
+    )
+    print(
+        "\t\tPlease consider providing the previous FEN, selecting a "
+        "different model, or performing\n\t\ttransfer learning on that"
+        " model"
+    )
+
+
+def _complete_prediction_by_brute_force(
+    probs_with_no_indices: list[list[float]],
+    predicted_piece_list: list[str | None],
+):
+    """Determine the pieces on the undetermined squares by brute force.
+
+    :param probs_with_no_indices: Length-64 list of piece probabilities
+        in FEN-notation order (see `infer_chess_pieces()`).
+
+    :param predicted_piece_list: Length-64 list of the inferred chess
+        pieces in FEN-notation order (`None` for an undetermined
+        square), which is completed in place.
+    """
+    # For every undetermined square, rather than give up on that
+    # square, we will determine the piece on that square by brute
+    # force
+    for square, piece_type in enumerate(predicted_piece_list):
+        if piece_type is None:
+            if _is_white_piece(probs_with_no_indices[square]):
+                predicted_piece_list[square] = (
+                    _determine_most_probable_white_piece(
+                        probs_with_no_indices, square
+                    )
+                )
+            else:
+                predicted_piece_list[square] = (
+                    _determine_most_probable_black_piece(
+                        probs_with_no_indices, square
+                    )
+                )
 
 
 def infer_chess_pieces(
@@ -902,6 +874,8 @@ def infer_chess_pieces(
     a1_pos: str,
     previous_fen: str | None = None,
     must_detect_move: bool = False,
+    board: chess.Board | None = None,
+    piece_assignment: str = "greedy",
 ) -> tuple[list[str], str | None]:
     """Infer the exact piece positions on the chessboard.
 
@@ -917,7 +891,7 @@ def infer_chess_pieces(
         `_IDX_TO_PIECE_FULL`) for the corresponding square.
 
         The probabilities come from the convolutional neural network
-        (see the `obtain_piece_probs_for_all_64_squares()` function
+        (see the `obtain_piece_probs()` function
         in "predict_board.py").
 
     :param a1_pos: Position of the a1 square of list of probabilities.
@@ -930,6 +904,31 @@ def infer_chess_pieces(
         If it is not `None`, it could significantly improve the accuracy
         of piece inference.
 
+    :param must_detect_move: Whether a valid move must be detected.
+
+        If it is `True` and no move is detected, the previous position
+        is returned unchanged.
+
+    :param board: Previous board position (including whose turn it is,
+        the castling rights, and the en-passant square).
+
+        If it is not `None` (in which case its piece placement must be
+        `previous_fen`), the move is decoded among the legal moves of
+        this position (see "decode_move.py") instead of being inferred
+        from the changed squares. If both players moved since the
+        previous position, the moves are separated by spaces in the
+        returned UCI string (e.g., `"e2e4 e7e5"`).
+
+    :param piece_assignment: How the pieces are inferred when no move is
+        detected.
+
+        If it is `"greedy"`, the pieces are placed one at a time in
+        order of probability. If it is `"optimal"`, all the pieces are
+        assigned at once so that the probability of the whole board is
+        maximized (see "optimal_assignment.py"), which is slower but
+        does not get stuck when the model is not accurate enough to
+        predict a balanced board configuration.
+
     :return: Length-64 list of the inferred chess pieces in FEN-notation
     order (the first element corresponds to the a8 square, the second to
     the b8 square, and so on) and the detected move in UCI notation.
@@ -940,199 +939,76 @@ def infer_chess_pieces(
         If no move has been successfully detected, the second element of
         the returned tuple will be `None`.
     """
+    if piece_assignment not in ("greedy", "optimal"):
+        raise ValueError(f"Unknown piece assignment: {piece_assignment}")
+
     move_uci = None
-    probs_with_no_indices = board_to_list(
-        list_to_board(probs_with_no_indices, a1_pos)
+    probs_with_no_indices = rotate_to_standard_view(
+        probs_with_no_indices, a1_pos
     )
+    if previous_fen is not None:
+        previous_codes = fen_to_codes(previous_fen)
+
+    if previous_fen is not None and board is not None:  # Decode the move
+        moves, margin = decode_moves(board, probs_with_no_indices)
+        if moves and margin >= MIN_MARGIN:
+            current_board = board.copy(stack=False)
+            for move in moves:
+                current_board.push(move)
+            return (
+                codes_to_list(fen_to_codes(current_board.board_fen())),
+                " ".join(move.uci() for move in moves),
+            )  # Conclude the FEN immediately
+        if must_detect_move:
+            return codes_to_list(previous_codes), move_uci
 
-    # Initialize the output list of predicted piece types (from a8, b8,
-    # ..., to h1)
-    # (`None` represents that the piece type of that square has not been
-    # determined yet)
-    predicted_piece_list = [None] * 64
-
-    if previous_fen is not None:  # Perform move detection
+    elif previous_fen is not None:  # Perform move detection
         changed_squares = _determine_changed_squares(
-            previous_fen, probs_with_no_indices
+            previous_codes, probs_with_no_indices
         )
         move = _detect_move(
-            previous_fen, probs_with_no_indices, changed_squares
+            previous_codes, probs_with_no_indices, changed_squares
         )
         if move is None:
             if must_detect_move:
-                return board_to_list(fen_to_board(previous_fen)), move_uci
+                return codes_to_list(previous_codes), move_uci
 
         if move is not None:  # A move has been successfully detected
             (
                 current_fen,
                 move_uci,
             ) = _generate_fen_based_on_previous_fen_and_detected_move(
-                previous_fen, move, probs_with_no_indices
+                previous_fen, previous_codes, move, probs_with_no_indices
             )
             return (
-                board_to_list(fen_to_board(current_fen)),
+                codes_to_list(fen_to_codes(current_fen)),
                 move_uci,
             )  # Conclude the FEN immediately
 
     # Move detection was either not invoked or not successful, so the
-    # pieces on the board will now be inferred one at a time
-    probs_by_square = [
-        (probs, i) for i, probs in enumerate(probs_with_no_indices)
-    ]
-
-    # First determine the king locations (one white king and one black
-    # king)
-    white_king = max(
-        probs_by_square,
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["K"]],
-    )
-    black_kings = sorted(
-        probs_by_square,
-        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["k"]],
-        reverse=True,
-    )  # Descending order
-
-    black_king = black_kings[0]
-    if black_king[1] == white_king[1]:
-        black_king = black_kings[1]
-
-    predicted_piece_list[white_king[1]] = "K"
-    predicted_piece_list[black_king[1]] = "k"
-
-    num_of_undetermined_squares = (
-        62  # We have already determined the king locations
-    )
-
-    # Then identify the empty squares (the CNN has a very high accuracy
-    # of detecting empty squares)
-    for idx, piece in enumerate(probs_with_no_indices):
-        if predicted_piece_list[idx] is None:
-            if _is_empty_square(piece):
-                predicted_piece_list[idx] = "_"
-                num_of_undetermined_squares -= 1
-
-    # Determine the locations of the other pieces in order of
-    # probability (there is a total of
-    # (`num_of_undetermined_squares` * 10) probabilities)
-    probs_by_type = _sort_probs_by_piece_type(probs_by_square)
-    # Keep track of the indices to the squares, whose piece types have
-    # not been determined, with the highest probabilities in
-    # `probs_by_type` (there are 10 piece types left, so we need to keep
-    # track of 10 indices)
-    idx = [0] * 10
-    # Keep track of the top entry of each sorted piece list
-    # (corresponding to the square with the highest probability)
-    top_probs_by_type = [
-        probs_for_a_specific_type[0]
-        for probs_for_a_specific_type in probs_by_type
-    ]
-    # Maximum number of pieces of each type in the same order as
-    # `top_probs_by_type`
-    max_pieces_left = [2, 2, 8, 2, 2, 2, 2, 8, 2, 2]
-    # Keep track of the numbers of light-squared and dark-squared
-    # bishops for both sides
-    B_light_squared = 0  # Number of light-squared bishops for white
-    B_dark_squared = 0  # Number of dark-squared bishops for white
-    b_light_squared = 0  # Number of light-squared bishops for black
-    b_dark_squared = 0  # Number of dark-squared bishops for black
-    # Occasionally, the model is not accurate enough to predict a
-    # balanced board configuration (balanced in terms of the numbers of
-    # pawns, queens, and bishops)
-    failed_to_complete_prediction = False
-
-    # See "infer_pieces.png" (in the "docs" folder) for a visualization
-    # of the following `while` loop
-    while num_of_undetermined_squares > 0:
-        # Determine the piece type of the square that has the piece with
-        # the highest probability across the entire board
-        max_idx = _piece_with_highest_prob(top_probs_by_type)
-        square = top_probs_by_type[max_idx][1]
-        # If we haven't maxed that piece type and the piece type of that
-        # square hasn't been determined, then we conclude that that
-        # square has exactly that piece
-        if (
-            max_pieces_left[max_idx] > 0
-            and predicted_piece_list[square] is None
-        ):
-            piece_type = _IDX_TO_PIECE[max_idx]
-            if _check_balance_among_pawns_queens_and_bishops(
-                piece_type,
-                max_pieces_left,
-                B_light_squared,
-                B_dark_squared,
-                b_light_squared,
-                b_dark_squared,
-                square,
-            ):
-                predicted_piece_list[square] = piece_type
-                num_of_undetermined_squares -= 1
-                max_pieces_left[max_idx] -= 1
-
-                if piece_type == "B" and is_light_square(square):
-                    B_light_squared += 1
-                elif piece_type == "B" and not is_light_square(square):
-                    B_dark_squared += 1
-                elif piece_type == "b" and is_light_square(square):
-                    b_light_squared += 1
-                elif piece_type == "b" and not is_light_square(square):
-                    b_dark_squared += 1
-
-        # In any case, for the piece type we have tried above, we must
-        # replace the entry in `top_probs_by_type` with the
-        # next-highest-probability entry
-        try:
-            idx[max_idx] += 1
-            top_probs_by_type[max_idx] = probs_by_type[max_idx][idx[max_idx]]
-        except (
-            IndexError
-        ):  # Model is not accurate enough to predict a balanced configuration
-            # (balance in terms of the numbers of pawns, queens, and bishops)
-            print(
-                "\tWarning: the selected model is not accurate enough to "
-                "predict a balanced board configuration"
-            )
-            print(
-                "\t\tPlease consider providing the previous FEN, selecting a "
-                "different model, or performing\n\t\ttransfer learning on that"
-                " model"
-            )
-            failed_to_complete_prediction = True
-            break
-
-    if failed_to_complete_prediction:
-        # For every undetermined square, rather than give up on that
-        # square, we will determine the piece on that square by brute
-        # force
-        for square, piece_type in enumerate(predicted_piece_list):
-            if piece_type is None:
-                if _is_white_piece(probs_with_no_indices[square]):
-                    predicted_piece_list[square] = (
-                        _determine_most_probable_white_piece(
-                            probs_with_no_indices, square
-                        )
-                    )
-                else:
-                    predicted_piece_list[square] = (
-                        _determine_most_probable_black_piece(
-                            probs_with_no_indices, square
-                        )
-                    )
+    # pieces on the board will now be inferred without it
+    if piece_assignment == "optimal":
+        predicted_piece_list = assign_pieces_optimally(probs_with_no_indices)
+    else:
+        predicted_piece_list = _infer_pieces_greedily(probs_with_no_indices)
 
-    if previous_fen is not None:  # We will now give move detection another try
+    if (
+        previous_fen is not None and board is None
+    ):  # We will now give move detection another try
         changed_squares = _determine_changed_squares_after_piece_inference(
-            previous_fen, predicted_piece_list
+            previous_codes, predicted_piece_list
         )
         move = _detect_move(
-            previous_fen, probs_with_no_indices, changed_squares
+            previous_codes, probs_with_no_indices, changed_squares
         )
         if move is not None:  # Finally a move has been successfully detected
             (
                 current_fen,
                 move_uci,
             ) = _generate_fen_based_on_previous_fen_and_detected_move(
-                previous_fen, move, probs_with_no_indices
+                previous_fen, previous_codes, move, probs_with_no_indices
             )
-            return board_to_list(fen_to_board(current_fen)), move_uci
+            return codes_to_list(fen_to_codes(current_fen)), move_uci
 
     return predicted_piece_list, move_uci
 
@@ -1179,7 +1055,7 @@ def _is_white_piece(probs_for_a_specific_square: list) -> bool:
 
 
 def _determine_changed_squares(
-    previous_fen: str, probs_with_no_indices: list[list]
+    previous_codes: np.ndarray, probs_with_no_indices: list[list]
 ) -> list[int]:
     """Determine the squares that experienced a state change.
 
@@ -1189,7 +1065,8 @@ def _determine_changed_squares(
     This function determines the squares whose current states are
     different from the previous ones.
 
-    :param previous_fen: FEN string of the previous board position.
+    :param previous_codes: Length-64 array of the piece codes of the
+        previous board position (see `fen_to_codes()` in "fen.py").
 
     :param probs_with_no_indices: Length-64 list of piece probabilities.
 
@@ -1200,7 +1077,7 @@ def _determine_changed_squares(
         `_IDX_TO_PIECE_FULL`) for the corresponding square.
 
         The probabilities come from the convolutional neural network
-        (see the `obtain_piece_probs_for_all_64_squares()` function
+        (see the `obtain_piece_probs()` function
         in "predict_board.py").
 
     :return: List of integers specifying which squares on the chessboard
@@ -1209,36 +1086,24 @@ def _determine_changed_squares(
         `0` corresponds to the a8 square, `1` corresponds to the b8
         square, ..., `63` corresponds to the h1 square.
     """
-    previous_list = board_to_list(fen_to_board(previous_fen))
-    changed_squares = []
-    for idx, previous_piece in enumerate(previous_list):
-        # If a square's previous state is the same as its current one,
-        # ignore that square
-        if previous_piece == "_" and _is_empty_square(
-            probs_with_no_indices[idx]
-        ):
-            continue
-        if (
-            previous_piece in _WHITE_PIECES
-            and not _is_empty_square(probs_with_no_indices[idx])
-            and _is_white_piece(probs_with_no_indices[idx])
-        ):
-            continue
-        if (
-            previous_piece in _BLACK_PIECES
-            and not _is_empty_square(probs_with_no_indices[idx])
-            and not _is_white_piece(probs_with_no_indices[idx])
-        ):
-            continue
-        # If the state of a square has changed, store the index of that
-        # square
-        changed_squares.append(idx)
-
-    return changed_squares
+    probs_with_no_indices = np.asarray(probs_with_no_indices)
+    current_states = np.where(
+        np.argmax(probs_with_no_indices, axis=1) == EMPTY,
+        0,
+        np.where(
+            probs_with_no_indices[:, :6].sum(axis=1)
+            >= probs_with_no_indices[:, 7:].sum(axis=1),
+            1,
+            2,
+        ),
+    )  # Same as `_is_empty_square()` and `_is_white_piece()`
+    return np.flatnonzero(
+        STATE_OF_CODE[previous_codes] != current_states
+    ).tolist()
 
 
 def _determine_changed_squares_after_piece_inference(
-    previous_fen: str, predicted_piece_list: list[str]
+    previous_codes: np.ndarray, predicted_piece_list: list[str]
 ) -> list[int]:
     """Determine, after piece inference, the changed-state squares.
 
@@ -1251,7 +1116,8 @@ def _determine_changed_squares_after_piece_inference(
     This function determines the squares whose current states are
     different from the previous ones.
 
-    :param previous_fen: FEN string of the previous board position.
+    :param previous_codes: Length-64 array of the piece codes of the
+        previous board position (see `fen_to_codes()` in "fen.py").
 
     :param predicted_piece_list: Length-64 list of inferred pieces.
 
@@ -1265,32 +1131,14 @@ def _determine_changed_squares_after_piece_inference(
         `0` corresponds to the a8 square, `1` corresponds to the b8
         square, ..., `63` corresponds to the h1 square.
     """
-    previous_list = board_to_list(fen_to_board(previous_fen))
-    changed_squares = []
-    for idx, previous_piece in enumerate(previous_list):
-        # If a square's previous state is the same as its current one,
-        # ignore that square
-        if previous_piece == "_" and predicted_piece_list[idx] == "_":
-            continue
-        if (
-            previous_piece in _WHITE_PIECES
-            and predicted_piece_list[idx] in _WHITE_PIECES
-        ):
-            continue
-        if (
-            previous_piece in _BLACK_PIECES
-            and predicted_piece_list[idx] in _BLACK_PIECES
-        ):
-            continue
-        # If the state of a square has changed, store the index of that
-        # square
-        changed_squares.append(idx)
-
-    return changed_squares
+    return np.flatnonzero(
+        STATE_OF_CODE[previous_codes]
+        != STATE_OF_CODE[list_to_codes(predicted_piece_list)]
+    ).tolist()
 
 
 def _detect_move(
-    previous_fen: str,
+    previous_codes: np.ndarray,
     probs_with_no_indices: list[list],
     changed_squares: list[int],
 ) -> (tuple[int, int, str]) | None:
@@ -1301,10 +1149,13 @@ def _detect_move(
     current board position. Only the states of the squares are used for
     inferring the move. A square has three states: white (if it has a
     white piece on it), black (if it has a black piece on it), and empty
-    (if it is empty). If the function fails to detect the move, it
+    (if it is empty). A move that the moving piece can't have made is
+    ruled out by looking it up in the move-geometry tables (see
+    `_MOVE_GEOMETRY`). If the function fails to detect the move, it
     returns `None`.
 
-    :param previous_fen: FEN string of the previous board position.
+    :param previous_codes: Length-64 array of the piece codes of the
+        previous board position (see `fen_to_codes()` in "fen.py").
 
     :param probs_with_no_indices: Length-64 list of piece probabilities.
 
@@ -1315,7 +1166,7 @@ def _detect_move(
         `_IDX_TO_PIECE_FULL`) for the corresponding square.
 
         The probabilities come from the convolutional neural network
-        (see the `obtain_piece_probs_for_all_64_squares()` function
+        (see the `obtain_piece_probs()` function
         in "predict_board.py").
 
     :param changed_squares: List specifying changed-state squares.
@@ -1332,419 +1183,95 @@ def _detect_move(
         `"white_castles_kingside"`, `"white_castles_queenside"`,
         `"black_castles_kingside"`, and `"black_castles_queenside"`.
     """
-    previous_list = board_to_list(fen_to_board(previous_fen))
+    probs = np.array(
+        [probs_with_no_indices[square] for square in changed_squares]
+    ).reshape(-1, 13)
+    changed_squares = np.asarray(changed_squares, dtype=int)
+    previous = previous_codes[changed_squares]
+    is_empty = np.argmax(probs, axis=1) == EMPTY
+    is_white = probs[:, :6].sum(axis=1) >= probs[:, 7:].sum(axis=1)
+    # Same as `_is_empty_square()` and `_is_white_piece()`
 
     if len(changed_squares) == 2:
-        # Determine which square is the initial and which is the final
-        if _is_empty_square(probs_with_no_indices[changed_squares[0]]):
-            initial_sq = changed_squares[0]
-            if not _is_empty_square(probs_with_no_indices[changed_squares[1]]):
-                final_sq = changed_squares[1]
-            else:
-                return None
-        elif _is_empty_square(probs_with_no_indices[changed_squares[1]]):
-            initial_sq = changed_squares[1]
-            if not _is_empty_square(probs_with_no_indices[changed_squares[0]]):
-                final_sq = changed_squares[0]
-            else:
-                return None
-        else:
+        # The initial square is the one that is now empty, and the final
+        # square is the other one
+        if is_empty.sum() != 1:
             return None
-
-        # We know that in the previous board, the initial square was
-        # occupied (now it is empty) and in the current board the final
-        # square is occupied
-        if previous_list[initial_sq] in _WHITE_PIECES:
-            if previous_list[final_sq] == "_":
-                if _is_white_piece(probs_with_no_indices[final_sq]):
-                    action = "white_moves"
-                    return initial_sq, final_sq, action
-                else:
-                    # A white piece can't suddenly turn into a black
-                    # piece after moving
-                    return None
-            elif previous_list[final_sq] in _BLACK_PIECES:
-                if _is_white_piece(probs_with_no_indices[final_sq]):
-                    action = "white_captures"
-                    return initial_sq, final_sq, action
-                else:
-                    # A white piece can't suddenly turn into a black
-                    # piece after capturing
-                    return None
-            else:
-                return None  # A white piece can't capture another white piece
-        else:  # The initial square is a black piece
-            if previous_list[final_sq] == "_":
-                if not _is_white_piece(probs_with_no_indices[final_sq]):
-                    action = "black_moves"
-                    return initial_sq, final_sq, action
-                else:
-                    # A black piece can't suddenly turn into a white
-                    # piece after moving
-                    return None
-            elif previous_list[final_sq] in _WHITE_PIECES:
-                if not _is_white_piece(probs_with_no_indices[final_sq]):
-                    action = "black_captures"
-                    return initial_sq, final_sq, action
-                else:
-                    # A black piece can't suddenly turn into a white
-                    # piece after capturing
-                    return None
-            else:
-                return None  # A black piece can't capture another black piece
+        initial_idx, final_idx = (0, 1) if is_empty[0] else (1, 0)
+        initial_sq, final_sq = changed_squares[[initial_idx, final_idx]]
+        piece = previous[initial_idx]  # The initial square was occupied
+        white = STATE_OF_CODE[piece] == 1
+        if is_white[final_idx] != white:
+            # A piece can't suddenly change color after moving
+            return None
+        if STATE_OF_CODE[previous[final_idx]] == STATE_OF_CODE[piece]:
+            return None  # A piece can't capture a piece of the same color
+        capturing = previous[final_idx] != EMPTY
+        if not _MOVE_GEOMETRY[piece, int(capturing), initial_sq, final_sq]:
+            return None  # The piece can't get to the final square
+        action = ("white" if white else "black") + (
+            "_captures" if capturing else "_moves"
+        )
+        return int(initial_sq), int(final_sq), action
 
     elif len(changed_squares) == 3:  # An en passant move may have been made
-        # Determine the initial square, the final square, and the third
-        # square
-        if not _is_empty_square(probs_with_no_indices[changed_squares[0]]):
-            final_sq = changed_squares[0]
-            if previous_list[changed_squares[1]] == "P" and _is_white_piece(
-                probs_with_no_indices[final_sq]
-            ):
-                initial_sq = changed_squares[1]
-                third_sq = changed_squares[2]
-            elif previous_list[
-                changed_squares[1]
-            ] == "p" and not _is_white_piece(probs_with_no_indices[final_sq]):
-                initial_sq = changed_squares[1]
-                third_sq = changed_squares[2]
-            elif previous_list[changed_squares[2]] == "P" and _is_white_piece(
-                probs_with_no_indices[final_sq]
-            ):
-                initial_sq = changed_squares[2]
-                third_sq = changed_squares[1]
-            elif previous_list[
-                changed_squares[2]
-            ] == "p" and not _is_white_piece(probs_with_no_indices[final_sq]):
-                initial_sq = changed_squares[2]
-                third_sq = changed_squares[1]
-            else:
-                return None
-        elif not _is_empty_square(probs_with_no_indices[changed_squares[1]]):
-            final_sq = changed_squares[1]
-            if previous_list[changed_squares[0]] == "P" and _is_white_piece(
-                probs_with_no_indices[final_sq]
-            ):
-                initial_sq = changed_squares[0]
-                third_sq = changed_squares[2]
-            elif previous_list[
-                changed_squares[0]
-            ] == "p" and not _is_white_piece(probs_with_no_indices[final_sq]):
-                initial_sq = changed_squares[0]
-                third_sq = changed_squares[2]
-            elif previous_list[changed_squares[2]] == "P" and _is_white_piece(
-                probs_with_no_indices[final_sq]
-            ):
-                initial_sq = changed_squares[2]
-                third_sq = changed_squares[0]
-            elif previous_list[
-                changed_squares[2]
-            ] == "p" and not _is_white_piece(probs_with_no_indices[final_sq]):
-                initial_sq = changed_squares[2]
-                third_sq = changed_squares[0]
-            else:
-                return None
-        elif not _is_empty_square(probs_with_no_indices[changed_squares[2]]):
-            final_sq = changed_squares[2]
-            if previous_list[changed_squares[0]] == "P" and _is_white_piece(
-                probs_with_no_indices[final_sq]
-            ):
-                initial_sq = changed_squares[0]
-                third_sq = changed_squares[1]
-            elif previous_list[
-                changed_squares[0]
-            ] == "p" and not _is_white_piece(probs_with_no_indices[final_sq]):
-                initial_sq = changed_squares[0]
-                third_sq = changed_squares[1]
-            elif previous_list[changed_squares[1]] == "P" and _is_white_piece(
-                probs_with_no_indices[final_sq]
-            ):
-                initial_sq = changed_squares[1]
-                third_sq = changed_squares[0]
-            elif previous_list[
-                changed_squares[1]
-            ] == "p" and not _is_white_piece(probs_with_no_indices[final_sq]):
-                initial_sq = changed_squares[1]
-                third_sq = changed_squares[0]
-            else:
-                return None
-        else:
+        # The final square is the first one that is now occupied, the
+        # initial square is the first of the others that had a pawn of
+        # the same color, and the third square is the remaining one
+        occupied = np.flatnonzero(~is_empty)
+        if len(occupied) == 0:
             return None
-
-        # Determine the action
-        if previous_list[initial_sq] == "P" and previous_list[third_sq] == "p":
-            action = "white_en_passants"
-            return initial_sq, final_sq, action
-        elif (
-            previous_list[initial_sq] == "p" and previous_list[third_sq] == "P"
-        ):
-            action = "black_en_passants"
-            return initial_sq, final_sq, action
-        else:
+        final_idx = occupied[0]
+        white = bool(is_white[final_idx])
+        others = np.delete(np.arange(3), final_idx)
+        pawn = _PIECE_TO_IDX_FULL["P" if white else "p"]
+        pawns = others[previous[others] == pawn]
+        if len(pawns) == 0:
             return None
+        initial_idx = pawns[0]
+        third_idx = others[others != initial_idx][0]
+        if previous[third_idx] != _PIECE_TO_IDX_FULL["p" if white else "P"]:
+            return None  # The third square must have had the captured pawn
+        initial_sq, final_sq, third_sq = changed_squares[
+            [initial_idx, final_idx, third_idx]
+        ]
+        if (
+            not _EN_PASSANT_MOVES[int(white), initial_sq, final_sq]
+            or third_sq != initial_sq - initial_sq % 8 + final_sq % 8
+        ):
+            return None  # The captured pawn must be next to the initial square
+        action = "white_en_passants" if white else "black_en_passants"
+        return int(initial_sq), int(final_sq), action
 
     elif len(changed_squares) == 4:  # A castling move may have been made
-        # Determine which square is the initial and which is the final
-        # (the initial and final squares of the king, not the rook, as
-        # per the UCI notation)
-        if previous_list[changed_squares[0]] in ["K", "k"]:
-            initial_sq = changed_squares[0]
-            if (
-                previous_list[changed_squares[1]] == "_"
-                and abs(changed_squares[1] - changed_squares[0]) == 2
-            ):
-                final_sq = changed_squares[1]
-            elif (
-                previous_list[changed_squares[2]] == "_"
-                and abs(changed_squares[2] - changed_squares[0]) == 2
-            ):
-                final_sq = changed_squares[2]
-            elif (
-                previous_list[changed_squares[3]] == "_"
-                and abs(changed_squares[3] - changed_squares[0]) == 2
-            ):
-                final_sq = changed_squares[3]
-            else:
-                return None
-        elif previous_list[changed_squares[1]] in ["K", "k"]:
-            initial_sq = changed_squares[1]
-            if (
-                previous_list[changed_squares[0]] == "_"
-                and abs(changed_squares[0] - changed_squares[1]) == 2
-            ):
-                final_sq = changed_squares[0]
-            elif (
-                previous_list[changed_squares[2]] == "_"
-                and abs(changed_squares[2] - changed_squares[1]) == 2
-            ):
-                final_sq = changed_squares[2]
-            elif (
-                previous_list[changed_squares[3]] == "_"
-                and abs(changed_squares[3] - changed_squares[1]) == 2
-            ):
-                final_sq = changed_squares[3]
-            else:
-                return None
-        elif previous_list[changed_squares[2]] in ["K", "k"]:
-            initial_sq = changed_squares[2]
-            if (
-                previous_list[changed_squares[0]] == "_"
-                and abs(changed_squares[0] - changed_squares[2]) == 2
-            ):
-                final_sq = changed_squares[0]
-            elif (
-                previous_list[changed_squares[1]] == "_"
-                and abs(changed_squares[1] - changed_squares[2]) == 2
-            ):
-                final_sq = changed_squares[1]
-            elif (
-                previous_list[changed_squares[3]] == "_"
-                and abs(changed_squares[3] - changed_squares[2]) == 2
-            ):
-                final_sq = changed_squares[3]
-            else:
-                return None
-        elif previous_list[changed_squares[3]] in ["K", "k"]:
-            initial_sq = changed_squares[3]
-            if (
-                previous_list[changed_squares[0]] == "_"
-                and abs(changed_squares[0] - changed_squares[3]) == 2
-            ):
-                final_sq = changed_squares[0]
-            elif (
-                previous_list[changed_squares[1]] == "_"
-                and abs(changed_squares[1] - changed_squares[3]) == 2
-            ):
-                final_sq = changed_squares[1]
-            elif (
-                previous_list[changed_squares[2]] == "_"
-                and abs(changed_squares[2] - changed_squares[3]) == 2
-            ):
-                final_sq = changed_squares[2]
-            else:
-                return None
-        else:
+        # The initial square is the first one that had a king, and the
+        # final square is the first of the others that was empty and is
+        # two squares away (these are the initial and final squares of
+        # the king, not the rook, as per the UCI notation)
+        kings = np.flatnonzero(
+            (previous == _PIECE_TO_IDX_FULL["K"])
+            | (previous == _PIECE_TO_IDX_FULL["k"])
+        )
+        if len(kings) == 0:
             return None
-
-        # Determine the action
-        if previous_list[initial_sq] == "K" and final_sq == 62:
-            action = "white_castles_kingside"
-            return initial_sq, final_sq, action
-        elif previous_list[initial_sq] == "K" and final_sq == 58:
-            action = "white_castles_queenside"
-            return initial_sq, final_sq, action
-        elif previous_list[initial_sq] == "k" and final_sq == 6:
-            action = "black_castles_kingside"
-            return initial_sq, final_sq, action
-        elif previous_list[initial_sq] == "k" and final_sq == 2:
-            action = "black_castles_queenside"
-            return initial_sq, final_sq, action
-        else:
+        initial_sq = changed_squares[kings[0]]
+        finals = np.flatnonzero(
+            (previous == EMPTY) & (np.abs(changed_squares - initial_sq) == 2)
+        )
+        if len(finals) == 0:
             return None
+        final_sq = changed_squares[finals[0]]
+        action = _CASTLING_MOVES.get(
+            (previous[kings[0]], initial_sq, final_sq)
+        )
+        if action is None:
+            return None
+        return int(initial_sq), int(final_sq), action
 
     else:  # The number of changed-state squares is neither 2, 3, nor 4
         return None
 
 
-def _is_king_move(
-    initial_sq: tuple[int, int], final_sq: tuple[int, int]
-) -> bool:
-    """Determine if the move could have been a king move.
-
-    A king can move at most one square in any direction (horizontally,
-    vertically, or diagonally).
-
-    :param initial_sq: Row and column indices of the initial square.
-
-        The `0` row index corresponds to the 8th rank, and the `0`
-        column index corresponds to the a file.
-
-    :param final_sq: Row and column indices of the final square.
-
-        The `0` row index of corresponds to the 8th rank, and the `0`
-        column index corresponds to the a file.
-
-    :return: Whether the move given by the initial and final squares
-    could have been a king move.
-    """
-    return (
-        abs(initial_sq[0] - final_sq[0]) <= 1
-        and abs(initial_sq[1] - final_sq[1]) <= 1
-    )
-
-
-def _is_rook_move(
-    initial_sq: tuple[int, int], final_sq: tuple[int, int]
-) -> bool:
-    """Determine if the move could have been a rook move.
-
-    A rook can move any number of squares (without jumping over any
-    piece) along the same rank or file.
-
-    :param initial_sq: Row and column indices of the initial square.
-
-        The `0` row index corresponds to the 8th rank, and the `0`
-        column index corresponds to the a file.
-
-    :param final_sq: Row and column indices of the final square.
-
-        The `0` row index of corresponds to the 8th rank, and the `0`
-        column index corresponds to the a file.
-
-    :return: Whether the move given by the initial and final squares
-    could have been a rook move.
-    """
-    return initial_sq[0] == final_sq[0] or initial_sq[1] == final_sq[1]
-
-
-def _is_bishop_move(
-    initial_sq: tuple[int, int], final_sq: tuple[int, int]
-) -> bool:
-    """Determine if the move could have been a bishop move.
-
-    A bishop can move any number of squares (without jumping over any
-    piece) diagonally.
-
-    :param initial_sq: Row and column indices of the initial square.
-
-        The `0` row index corresponds to the 8th rank, and the `0`
-        column index corresponds to the a file.
-
-    :param final_sq: Row and column indices of the final square.
-
-        The `0` row index of corresponds to the 8th rank, and the `0`
-        column index corresponds to the a file.
-
-    :return: Whether the move given by the initial and final squares
-    could have been a bishop move.
-    """
-    return (
-        (initial_sq[0] - initial_sq[1] == final_sq[0] - final_sq[1])
-        # The move is parallel to the a8-h1 diagonal
-    ) or (
-        (initial_sq[0] + initial_sq[1] == final_sq[0] + final_sq[1])
-        # The move is parallel to the a1-h8 diagonal
-    )
-
-
-def _is_knight_move(
-    initial_sq: tuple[int, int], final_sq: tuple[int, int]
-) -> bool:
-    """Determine if the move could have been a knight move.
-
-    A knight moves in an L-shape (diagonal of a 2x3 rectangle) fashion.
-
-    :param initial_sq: Row and column indices of the initial square.
-
-        The `0` row index corresponds to the 8th rank, and the `0`
-        column index corresponds to the a file.
-
-    :param final_sq: Row and column indices of the final square.
-
-        The `0` row index of corresponds to the 8th rank, and the `0`
-        column index corresponds to the a file.
-
-    :return: Whether the move given by the initial and final squares
-    could have been a knight move.
-    """
-    row_d = abs(initial_sq[0] - final_sq[0])  # This is the distance in ranks
-    col_d = abs(initial_sq[1] - final_sq[1])  # This is the distance in files
-    return (row_d == 1 and col_d == 2) or (row_d == 2 and col_d == 1)
-
-
-def _is_pawn_move(
-    initial_sq: tuple[int, int],
-    final_sq: tuple[int, int],
-    capturing: bool,
-    white: bool,
-) -> bool:
-    """Determine if the move could have been a pawn move.
-
-    A pawn can move one square (or two squares if it hasn't moved yet)
-    forward along the same file (or two if it hasn't moved yet) and
-    capture one square forward diagonally.
-
-    :param initial_sq: Row and column indices of the initial square.
-
-        The `0` row index corresponds to the 8th rank, and the `0`
-        column index corresponds to the a file.
-
-    :param final_sq: Row and column indices of the final square.
-
-        The `0` row index of corresponds to the 8th rank, and the `0`
-        column index corresponds to the a file.
-
-    :param capturing: Whether the move was a capture.
-
-    :param white: Whether it was white to move.
-
-    :return: Whether the move given by the initial and final squares
-    could have been a pawn move.
-    """
-    if white:
-        if capturing:
-            return (
-                initial_sq[0] - final_sq[0] == 1
-                and abs(initial_sq[1] - final_sq[1]) == 1
-            )
-        else:
-            return initial_sq[1] == final_sq[1] and (
-                initial_sq[0] - final_sq[0] == 1
-                or (initial_sq[0] - final_sq[0] == 2 and initial_sq[0] == 6)
-            )
-    else:
-        if capturing:
-            return (
-                initial_sq[0] - final_sq[0] == -1
-                and abs(initial_sq[1] - final_sq[1]) == 1
-            )
-        else:
-            return initial_sq[1] == final_sq[1] and (
-                initial_sq[0] - final_sq[0] == -1
-                or (initial_sq[0] - final_sq[0] == -2 and initial_sq[0] == 1)
-            )
-
-
 def _infer_possible_pieces_from_move(
     initial_sq: int, final_sq: int, action: str
 ) -> list[str]:
@@ -1767,67 +1294,29 @@ def _infer_possible_pieces_from_move(
     :param action: What action was detected.
 
     :return: List of distinct piece types that could possibly occupy the
-    final square.
+    final square (in the order of `_IDX_TO_PIECE_FULL`).
     """
-    initial_row_and_col = (
-        initial_sq // 8,
-        initial_sq % 8,
-    )  # (row index, column index)
-    final_row_and_col = (final_sq // 8, final_sq % 8)
-
     capturing = action.endswith("captures") | action.endswith("en_passants")
     white = action.startswith("white")
     castling = action[6:13] == "castles"
 
-    possible_pieces = []  # There can't be duplicates
+    if castling:
+        return ["K" if white else "k"]
 
-    if white:
-        if castling:
-            possible_pieces.append("K")
-            return possible_pieces
-
-        if _is_pawn_move(
-            initial_row_and_col, final_row_and_col, capturing, white
-        ):
-            if final_row_and_col[0] == 0:
-                # If the move ends in the last row, promotions apply, so
-                # the result no longer is a pawn. This move also
-                # corresponds with a king, so the result can be all
-                # pieces except for the pawn. In this case we don't need
-                # to check the rest of the pieces.
-                return ["K", "R", "B", "Q", "N"]
-            possible_pieces.append("P")
-        if _is_king_move(initial_row_and_col, final_row_and_col):
-            possible_pieces.append("K")
-        if _is_rook_move(initial_row_and_col, final_row_and_col):
-            possible_pieces.append("R")
-            possible_pieces.append("Q")
-        if _is_bishop_move(initial_row_and_col, final_row_and_col):
-            possible_pieces.append("B")
-            # Bishop and rook moves are exclusive, so Q is not in
-            # possible pieces
-            possible_pieces.append("Q")
-        if _is_knight_move(initial_row_and_col, final_row_and_col):
-            possible_pieces.append("N")
-    else:  # black
-        if castling:
-            possible_pieces.append("k")
-            return possible_pieces
-
-        if _is_pawn_move(
-            initial_row_and_col, final_row_and_col, capturing, white
-        ):
-            if final_row_and_col[0] == 7:
-                return ["k", "r", "b", "q", "n"]
-            possible_pieces.append("p")
-        if _is_king_move(initial_row_and_col, final_row_and_col):
-            possible_pieces.append("k")
-        if _is_rook_move(initial_row_and_col, final_row_and_col):
-            possible_pieces.append("r")
-            possible_pieces.append("q")
-        if _is_bishop_move(initial_row_and_col, final_row_and_col):
-            possible_pieces.append("b")
-            possible_pieces.append("q")
-        if _is_knight_move(initial_row_and_col, final_row_and_col):
-            possible_pieces.append("n")
-    return possible_pieces
+    if _PAWN_MOVES[int(white), int(capturing), initial_sq, final_sq] and (
+        _ROWS[final_sq] == (0 if white else 7)
+    ):
+        # If the move ends in the last row, promotions apply, so the
+        # result no longer is a pawn. This move also corresponds with a
+        # king, so the result can be all pieces except for the pawn. In
+        # this case we don't need to check the rest of the pieces.
+        possible_pieces = ["K", "R", "B", "Q", "N"]
+        if not white:
+            possible_pieces = [piece.lower() for piece in possible_pieces]
+        return possible_pieces
+
+    possible_codes = np.flatnonzero(
+        _MOVE_GEOMETRY[:, int(capturing), initial_sq, final_sq]
+        & (STATE_OF_CODE == (1 if white else 2))
+    )
+    return [_IDX_TO_PIECE_FULL[code] for code in possible_codes]
@@ -0,0 +1,150 @@
+"""This module is responsible for keeping chess-piece models in memory.
+
+Loading a model (building an ONNXRuntime inference session or loading a
+Keras model) is far more expensive than running it, so every model is
+loaded only once per process and is then reused for every board update.
+
+Keras (and hence TensorFlow) is imported only when a Keras model is
+actually loaded, so the ONNX backend does not depend on TensorFlow at
+all (importing TensorFlow takes seconds and hundreds of MB of memory).
+"""
+
+import os
+
+import numpy as np
+import onnxruntime
+
+
+BACKENDS = ("keras", "onnx")
+"""Supported inference backends."""
+
+_MODELS = {}
+"""Process-wide registry of the loaded models.
+
+Each key is a `(model_path, backend)` tuple and each value is the
+corresponding Keras model or ONNXRuntime inference session.
+"""
+
+
+def get_model(model_path: str, backend: str):
+    """Return the model stored at `model_path`, loading it if necessary.
+
+    :param model_path: Path to the model (".h5" for Keras and ".onnx"
+    for ONNX).
+
+    :param backend: Inference backend (`"keras"` or `"onnx"`).
+
+    :return: Keras model (if `backend` is `"keras"`) or ONNXRuntime
+    inference session (if `backend` is `"onnx"`).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}: {backend}")
+
+    key = (model_path, backend)
+    if key not in _MODELS:
+        if backend == "keras":
+            _MODELS[key] = _load_keras_model(model_path)
+        else:
+            _MODELS[key] = onnxruntime.InferenceSession(model_path)
+    return _MODELS[key]
+
+
+def _load_keras_model(model_path: str):
+    """Import Keras and load a Keras model.
+
+    :param model_path: Path to the Keras model (ending with ".h5").
+
+    :return: Keras model.
+    """
+    os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
+    from keras.models import load_model
+
+    return load_model(model_path)
+
+
+def warm_up_model(model_path: str, backend: str, img_size: int):
+    """Load a model and run it once on a dummy input.
+
+    The first inference of a freshly loaded model is noticeably slower
+    than the following ones (memory allocation, graph optimization,
+    etc.), so calling this function at startup keeps that cost out of
+    the first board update.
+
+    :param model_path: Path to the model (".h5" for Keras and ".onnx"
+    for ONNX).
+
+    :param backend: Inference backend (`"keras"` or `"onnx"`).
+
+    :param img_size: Input size for the model.
+    """
+    model = get_model(model_path, backend)
+    dummy_input = np.zeros((1, img_size, img_size, 3), dtype="float32")
+    predict_in_batches(model, backend, dummy_input)
+
+
+def predict_in_batches(
+    model, backend: str, inputs: np.ndarray, batch_size: int = 64
+) -> np.ndarray:
+    """Run a model on a stack of inputs using as few calls as possible.
+
+    :param model: Keras model or ONNXRuntime inference session (see
+    `get_model()`).
+
+    :param backend: Inference backend (`"keras"` or `"onnx"`).
+
+    :param inputs: Array of preprocessed inputs.
+
+        For the chess-piece models, this is typically a
+        `(64, img_size, img_size, 3)` array holding all 64 squares.
+
+    :param batch_size: Maximum number of inputs per model call.
+
+        A smaller micro-batch size lowers the peak memory usage (which
+        matters on low-memory devices) at the cost of more calls. If the
+        ONNX model has a fixed batch dimension, that dimension is used
+        instead.
+
+    :return: Array of the model outputs (one row per input).
+    """
+    fixed_batch_size = False
+    if backend == "onnx":
+        input_meta = model.get_inputs()[0]
+        if isinstance(input_meta.shape[0], int):  # Fixed batch dimension
+            batch_size = input_meta.shape[0]
+            fixed_batch_size = True
+
+    outputs = []
+    for start in range(0, len(inputs), batch_size):
+        batch = inputs[start : start + batch_size]
+        num_of_inputs = len(batch)
+        if fixed_batch_size and num_of_inputs < batch_size:
+            # Pad the last batch to the size the model expects
+            padding = np.zeros(
+                (batch_size - num_of_inputs,) + batch.shape[1:], batch.dtype
+            )
+            batch = np.concatenate([batch, padding])
+        if backend == "keras":
+            outputs.append(model.predict(batch, verbose=0))
+        else:
+            outputs.append(
+                model.run(None, {input_meta.name: batch})[0][:num_of_inputs]
+            )
+    return np.concatenate(outputs)
+
+
+def release_model(model_path: str | None = None, backend: str | None = None):
+    """Release loaded models.
+
+    :param model_path: Path of the model to release.
+
+        If it is `None`, the models stored at every path are released.
+
+    :param backend: Inference backend of the model to release.
+
+        If it is `None`, the models of every backend are released.
+    """
+    for key in list(_MODELS):
+        if (model_path is None or key[0] == model_path) and (
+            backend is None or key[1] == backend
+        ):
+            del _MODELS[key]
@@ -0,0 +1,424 @@
+"""This module is responsible for pre-classifying the squares cheaply.
+
+Detecting a move only takes knowing which squares are empty, which hold
+a white piece, and which hold a black piece; the identity of a piece is
+only needed where the occupancy or the color of a square changed (e.g.,
+for a capture or a promotion). The `OccupancyClassifier` tells the three
+states apart from the pixel signatures of the squares (see
+"square_signatures.py"), which are computed anyway, with a tiny
+multinomial logistic model:
+
+1) It is calibrated once per calibration (typically on the starting
+position), from the signatures of a position whose pieces were all
+identified by the chess-piece CNN.
+
+2) Afterwards, every square whose state it decides confidently and
+which is in the same state as in the previous position keeps its
+previous piece, without running the CNN on it (see
+`OccupancyClassifier.known_piece_probs()`).
+
+The squares whose signatures did not change reuse their cached piece
+probabilities anyway (see `SquareProbabilityCache` in
+"square_signatures.py"), so the classifier is only consulted on the
+changed squares, and it only saves CNN calls when signatures change
+without a move, e.g., when the lighting changes (see the end of this
+file).
+
+Since the features compare each square with the empty squares of the
+same color, they carry over from the squares seen at calibration to
+squares that held no piece back then.
+"""
+
+import numpy as np
+import chess
+from scipy.optimize import minimize
+
+from livechess2fen.lc2fen.fen import (
+    LIGHT_SQUARES,
+    ROTATIONS_FROM_STANDARD_VIEW,
+    STATE_OF_CODE,
+    fen_to_codes,
+    rotate_to_standard_view,
+)
+from livechess2fen.lc2fen.decode_move import decode_moves
+from livechess2fen.lc2fen.square_signatures import SIGNATURE_GRID_SIZE
+
+
+_CODES_OF_STATE = [
+    np.flatnonzero(STATE_OF_CODE == state) for state in range(3)
+]
+
+CONFIDENCE_THRESHOLD = 0.99
+"""Minimum probability of a state for a square to be decided."""
+
+STATE_PROB_FLOOR = 0.01
+"""Lower bound applied to the state probabilities of a decided square.
+
+A square decided by the classifier still leaves a small probability to
+the other states, so that a move that the CNN clearly sees on the other
+squares can still be detected if the classifier is wrong.
+"""
+
+REGULARIZATION = 0.1
+"""Weight of the L2 penalty on the weights of the logistic model."""
+
+
+def _compute_features(
+    signatures: np.ndarray, light_squares: np.ndarray, references: np.ndarray
+) -> np.ndarray:
+    """Compute the features of the squares.
+
+    For each color channel, the features are the mean absolute
+    difference, the mean difference, the maximum difference, and the
+    minimum difference between the block means of a square and those
+    of an empty square of the same color, over the whole square and over
+    its central part, followed by the spread of the block means of the
+    square.
+
+    :param signatures: `(64, SIGNATURE_GRID_SIZE ** 2 * 3)` array of the
+        signatures of the squares.
+
+    :param light_squares: Boolean array telling which squares are light.
+
+    :param references: `(2, SIGNATURE_GRID_SIZE, SIGNATURE_GRID_SIZE,
+        3)` array of the signatures of an empty light square and of an
+        empty dark square.
+
+    :return: `(64, 25)` array of the features.
+    """
+    blocks = signatures.reshape(
+        -1, SIGNATURE_GRID_SIZE, SIGNATURE_GRID_SIZE, 3
+    )
+    differences = blocks - np.where(
+        light_squares[:, None, None, None], references[0], references[1]
+    )
+    border = SIGNATURE_GRID_SIZE // 4
+    features = []
+    for region in (
+        differences,
+        differences[:, border:-border, border:-border],
+    ):
+        region = region.reshape(len(blocks), -1, 3)
+        features += [
+            np.abs(region).mean(axis=1),
+            region.mean(axis=1),
+            region.max(axis=1),
+            region.min(axis=1),
+        ]
+    features.append(blocks.mean(axis=3).reshape(len(blocks), -1).std(axis=1))
+    return np.column_stack(features)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    """Return the softmax of each row of an array."""
+    exps = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exps / exps.sum(axis=1, keepdims=True)
+
+
+class OccupancyClassifier:
+    """Logistic model telling empty, white, and black squares apart.
+
+    The signatures passed to (and the probabilities returned by) the
+    methods are in the order of the squares of the input image, like the
+    output of the CNN.
+
+    The classifier is only used with the calibration (and the
+    orientation) it was calibrated for; it is recalibrated whenever the
+    key (which identifies the calibration) changes.
+    """
+
+    def __init__(self):
+        """Initialize an uncalibrated instance of the classifier."""
+        self.clear()
+
+    def clear(self):
+        """Forget the calibration."""
+        self.key = None
+        self.a1_pos = None
+        self.references = None
+        self.feature_means = None
+        self.feature_stds = None
+        self.weights = None
+
+    def _standardized_features(self, signatures: np.ndarray) -> np.ndarray:
+        """Return the standardized features with a constant column."""
+        rotation = ROTATIONS_FROM_STANDARD_VIEW[self.a1_pos]
+        light_squares = LIGHT_SQUARES[rotation]
+        features = _compute_features(
+            signatures, light_squares, self.references
+        )
+        features = (features - self.feature_means) / self.feature_stds
+        return np.column_stack((features, np.ones(len(features))))
+
+    def calibrate(
+        self,
+        key,
+        signatures: np.ndarray,
+        fen: str,
+        a1_pos: str,
+        probs: np.ndarray | None = None,
+    ) -> bool:
+        """Calibrate the classifier on a known position.
+
+        :param key: Key identifying the calibration.
+
+        :param signatures: `(64, k)` array of the signatures of the
+            squares.
+
+        :param fen: FEN string of the position the squares show.
+
+        :param a1_pos: Position of the a1 square (`"BL"`, `"BR"`,
+            `"TL"`, or `"TR"`) corresponding to `signatures`.
+
+        :param probs: `(64, 13)` array of the piece probabilities of the
+            squares given by the CNN.
+
+            If it is not `None`, the classifier is only calibrated if the
+            most probable piece of every square agrees with `fen` on the
+            state of the square (so that a position the CNN was unsure
+            about is not used for calibration).
+
+        :return: Whether the classifier was calibrated (which also
+        requires the position to have empty squares, white pieces, and
+        black pieces, with empty squares of both colors).
+        """
+        rotation = ROTATIONS_FROM_STANDARD_VIEW[a1_pos]
+        states = STATE_OF_CODE[fen_to_codes(fen)][rotation]
+        light_squares = LIGHT_SQUARES[rotation]
+        if np.any(np.bincount(states, minlength=3) == 0):
+            return False
+        if probs is not None and np.any(
+            STATE_OF_CODE[np.asarray(probs).argmax(axis=1)] != states
+        ):
+            return False
+        blocks = signatures.reshape(
+            -1, SIGNATURE_GRID_SIZE, SIGNATURE_GRID_SIZE, 3
+        )
+        references = []
+        for is_light in (True, False):
+            empty_squares = (states == 0) & (light_squares == is_light)
+            if not empty_squares.any():
+                return False
+            references.append(np.median(blocks[empty_squares], axis=0))
+
+        self.a1_pos = a1_pos
+        self.references = np.array(references)
+        features = _compute_features(
+            signatures, light_squares, self.references
+        )
+        self.feature_means = features.mean(axis=0)
+        self.feature_stds = features.std(axis=0) + 1e-6
+        features = self._standardized_features(signatures)
+
+        # Multinomial logistic regression with an L2 penalty (the constant
+        # column is not penalized)
+        targets = np.eye(3)[states]
+        penalty = np.full((features.shape[1], 1), REGULARIZATION)
+        penalty[-1] = 0
+
+        def loss_and_gradient(flat_weights):
+            weights = flat_weights.reshape(-1, 3)
+            logits = features @ weights
+            log_probs = logits - logits.max(axis=1, keepdims=True)
+            log_probs -= np.log(np.exp(log_probs).sum(axis=1, keepdims=True))
+            loss = (
+                -(targets * log_probs).sum() + (penalty * weights**2).sum() / 2
+            )
+            gradient = features.T @ (np.exp(log_probs) - targets)
+            return loss, (gradient + penalty * weights).ravel()
+
+        result = minimize(
+            loss_and_gradient,
+            np.zeros(features.shape[1] * 3),
+            jac=True,
+            method="L-BFGS-B",
+        )
+        self.weights = result.x.reshape(-1, 3)
+        self.key = key
+        return True
+
+    def predict_state_probs(self, signatures: np.ndarray) -> np.ndarray:
+        """Predict the state probabilities of the squares.
+
+        :param signatures: `(64, k)` array of the signatures of the
+            squares.
+
+        :return: `(64, 3)` array of the probabilities of the squares
+        being empty, holding a white piece, and holding a black piece.
+        """
+        return _softmax(self._standardized_features(signatures) @ self.weights)
+
+    def known_piece_probs(
+        self, signatures: np.ndarray, previous_fen: str | None
+    ) -> np.ndarray:
+        """Obtain the piece probabilities of the squares that are decided.
+
+        A square is decided if the probability of its most probable state
+        reaches `CONFIDENCE_THRESHOLD` and, if `previous_fen` is not
+        `None`, that state is the one it had in the previous position
+        (so that the piece it holds is known). If `previous_fen` is
+        `None`, only empty squares can be decided.
+
+        :param signatures: `(64, k)` array of the signatures of the
+            squares.
+
+        :param previous_fen: FEN string of the previous board position.
+
+        :return: `(64, 13)` array of the piece probabilities of the
+        decided squares (whose state probabilities are bounded below by
+        `STATE_PROB_FLOOR` and given to their previous piece, or spread
+        evenly over the pieces of a color the square did not hold), with
+        rows of `np.nan` for the other squares.
+        """
+        state_probs = self.predict_state_probs(signatures)
+        states = state_probs.argmax(axis=1)
+        decided_squares = state_probs.max(axis=1) >= CONFIDENCE_THRESHOLD
+        if previous_fen is None:
+            decided_squares &= states == 0
+            previous_codes = np.full(len(states), -1)
+        else:
+            previous_codes = fen_to_codes(previous_fen)[
+                ROTATIONS_FROM_STANDARD_VIEW[self.a1_pos]
+            ]
+            decided_squares &= states == STATE_OF_CODE[previous_codes]
+
+        state_probs = np.maximum(state_probs, STATE_PROB_FLOOR)
+        state_probs /= state_probs.sum(axis=1, keepdims=True)
+        probs = np.full((len(states), len(STATE_OF_CODE)), np.nan)
+        for square in np.flatnonzero(decided_squares):
+            for state, codes in enumerate(_CODES_OF_STATE):
+                probs[square, codes] = state_probs[square, state] / len(codes)
+            previous_code = previous_codes[square]
+            if previous_code >= 0:
+                previous_state = STATE_OF_CODE[previous_code]
+                probs[square, _CODES_OF_STATE[previous_state]] = 0
+                probs[square, previous_code] = state_probs[
+                    square, previous_state
+                ]
+        return probs
+
+
+def hides_state_change(
+    probs: np.ndarray,
+    known_squares: np.ndarray,
+    previous_fen: str | None,
+    a1_pos: str,
+    board: chess.Board | None = None,
+) -> bool:
+    """Check whether the decided squares may be hiding part of a move.
+
+    The most likely move(s) given the probabilities (see
+    `decode_moves()` in "decode_move.py") must lead to a position that
+    agrees with the CNN on the state of every square the CNN was run
+    on. Otherwise, part of a move may be on a square decided (wrongly)
+    by the classifier, e.g., the square a piece moved to.
+
+    :param probs: `(64, 13)` array of the piece probabilities.
+
+    :param known_squares: Boolean array telling which squares were
+        decided by the classifier.
+
+    :param previous_fen: FEN string of the previous board position.
+
+    :param a1_pos: Position of the a1 square (`"BL"`, `"BR"`, `"TL"`,
+        or `"TR"`) corresponding to `probs` and `known_squares`.
+
+    :param board: Previous board position.
+
+        If it is `None`, the board is set up from `previous_fen` (with
+        all the castling rights its piece placement allows), and since
+        whose turn it is is then unknown, the moves of either side are
+        tried.
+
+    :return: Whether no most likely move(s) agree with the CNN on the
+    states of the squares it was run on.
+    """
+    if previous_fen is None or known_squares is None:
+        return False
+    if not known_squares.any():
+        return False
+    probs = rotate_to_standard_view(np.asarray(probs), a1_pos)
+    checked_squares = ~rotate_to_standard_view(known_squares, a1_pos)
+    model_states = STATE_OF_CODE[probs.argmax(axis=1)][checked_squares]
+
+    if board is None:
+        positions = []
+        for turn in (chess.WHITE, chess.BLACK):
+            position = chess.Board(previous_fen)
+            position.turn = turn
+            position.castling_rights = chess.BB_CORNERS
+            position.castling_rights = position.clean_castling_rights()
+            positions.append(position)
+    else:
+        positions = [board.copy(stack=False)]
+    for position in positions:
+        moves, _ = decode_moves(position, probs)
+        for move in moves:
+            position.push(move)
+        states = STATE_OF_CODE[fen_to_codes(position.board_fen())]
+        if np.array_equal(states[checked_squares], model_states):
+            return False
+    return True
+
+
+if __name__ == "__main__":
+    # Note: run this file from the "LobsterpincerSpectatorForWinRPiCombo"
+    # directory with `python -m livechess2fen.lc2fen.occupancy`
+    import time
+
+    import cv2
+
+    from livechess2fen.lc2fen.preprocess_squares import SquarePreprocessor
+    from livechess2fen.lc2fen.square_signatures import (
+        compute_square_signatures,
+        find_changed_squares,
+    )
+
+    # The classifier is calibrated on the position before the queenside
+    # castling and applied to the position after it
+    preprocessor = SquarePreprocessor(227)
+    before_fen = "r3kbnr/pppqpppp/2np4/8/3PP1b1/2N1BN2/PPP2PPP/R2BKQ1R"
+    after_fen = "2kr1bnr/pppqpppp/2np4/8/3PP1b1/2N1BN2/PPP2PPP/R2BKQ1R"
+    before_signatures = compute_square_signatures(
+        preprocessor(cv2.imread("Test Images/before_0-0-0_by_black.png"))
+    )
+
+    classifier = OccupancyClassifier()
+    start_time = time.perf_counter()
+    classifier.calibrate("key", before_signatures, before_fen, "BL")
+    finish_time = time.perf_counter()
+    print(f"\tCalibration took {(finish_time - start_time) * 1000:.1f} ms")
+
+    # The squares whose signatures did not change are served by the
+    # square-probability cache anyway (see "square_signatures.py"), so
+    # only the decided squares among the changed ones save CNN calls;
+    # lighting changes shift the signatures of most squares
+    true_codes = fen_to_codes(after_fen)
+    after_img = cv2.imread("Test Images/after_0-0-0_by_black.png")
+    frames = {
+        "after": after_img,
+        "after, brighter": cv2.convertScaleAbs(after_img, beta=20),
+        "after, darker": cv2.convertScaleAbs(after_img, alpha=0.85),
+    }
+    for name, img in frames.items():
+        signatures = compute_square_signatures(preprocessor(img)).copy()
+        changed_squares = find_changed_squares(signatures, before_signatures)
+        start_time = time.perf_counter()
+        probs = classifier.known_piece_probs(signatures, before_fen)
+        finish_time = time.perf_counter()
+        known_squares = ~np.isnan(probs[:, 0])
+        num_of_wrong_squares = (
+            probs[known_squares].argmax(axis=1) != true_codes[known_squares]
+        ).sum()
+        print(
+            f"\t{name}: pre-classification took "
+            f"{(finish_time - start_time) * 1000:.1f} ms and decided "
+            f"{known_squares.sum()} of the 64 squares "
+            f"({num_of_wrong_squares} wrong)"
+        )
+        print(
+            f"\t\t{changed_squares.sum()} squares changed, so the cache "
+            f"alone runs the CNN on {changed_squares.sum()} squares and "
+            "the pre-classifier saves "
+            f"{(known_squares & changed_squares).sum()} more"
+        )
@@ -0,0 +1,270 @@
+"""This module is responsible for assigning the pieces optimally.
+
+Rather than place the pieces one at a time in order of probability (see
+"infer_pieces.py"), which can paint itself into a corner, the pieces are
+assigned to all 64 squares at once so that the total log-probability of
+the board is maximized, subject to the piece counts of a standard
+physical chess set (see `check_validity_of_fen()` in "predict_board.py").
+
+Each side gets a "slot" for its king and for every other piece it may
+have, and the slots are assigned to squares by a min-cost assignment
+(`scipy.optimize.linear_sum_assignment()`) in which the cost of a slot
+on a square is relative to leaving the square empty. A slot other than
+a king slot may be left unused, and a slot can't be used on a square
+its piece can't occupy (e.g., a pawn slot on the first or last row).
+Since the number of pawns a side may have depends on whether it has
+promoted a pawn into a second queen or into a second bishop of the same
+color, an assignment is solved for every combination of such promotions
+that can't be ruled out by the lower bound given by a relaxed
+assignment.
+"""
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from livechess2fen.lc2fen.fen import PIECES, EMPTY, LIGHT_SQUARES, MIN_PROB
+
+
+_SIDES = ("KQRNBP", "kqrnbp")
+
+_PAWN_SQUARES = (np.arange(64) >= 8) & (np.arange(64) < 56)
+
+_SLOT_PIECES = "KQRNBBPkqrnbbp"
+
+_IS_KING_KIND = np.array([piece in "Kk" for piece in _SLOT_PIECES])
+
+PROMOTION_CONFIGS = (
+    (1, 1, 1, 8),
+    (2, 1, 1, 7),
+    (1, 2, 0, 7),
+    (1, 0, 2, 7),
+    (2, 2, 0, 6),
+    (2, 0, 2, 6),
+)
+"""Numbers of slots of either side for its pieces that pawns promote into.
+
+Each tuple contains the maximum numbers of queens, light-squared
+bishops, dark-squared bishops, and pawns. A second queen or a second
+bishop of the same color takes the place of a pawn.
+"""
+
+RELAXED_CONFIG = (2, 2, 2, 8)
+"""Slot numbers that ignore the balance among pawns, queens, and bishops."""
+
+
+def _slot_costs(costs: np.ndarray) -> np.ndarray:
+    """Return the costs of the kinds of slots on each square.
+
+    The cost of a slot on a square is relative to leaving the square
+    empty, so that a slot that is not worth filling can be left unused
+    at no cost.
+
+    :param costs: `(64, 13)` array of the costs (negative
+        log-probabilities).
+
+    :return: `(14, 64)` array of the costs of the white king, queen,
+    rook, knight, light-squared bishop, dark-squared bishop, and pawn
+    slots, followed by those of the black slots (`np.inf` where the slot
+    can't be used).
+    """
+    relative_costs = costs - costs[:, [EMPTY]]
+    rows = []
+    for pieces in _SIDES:
+        king, queen, rook, knight, bishop, pawn = pieces
+        for piece, allowed_squares in (
+            (king, None),
+            (queen, None),
+            (rook, None),
+            (knight, None),
+            (bishop, LIGHT_SQUARES),
+            (bishop, ~LIGHT_SQUARES),
+            (pawn, _PAWN_SQUARES),
+        ):
+            row = relative_costs[:, PIECES.index(piece)]
+            if allowed_squares is not None:
+                row = np.where(allowed_squares, row, np.inf)
+            rows.append(row)
+    return np.array(rows)
+
+
+def _solve(
+    slot_costs: np.ndarray,
+    white_config: tuple[int, int, int, int],
+    black_config: tuple[int, int, int, int],
+) -> tuple[float, list[str]]:
+    """Solve the assignment for given slot numbers.
+
+    :param slot_costs: `(14, 64)` array of the costs of the kinds of
+        slots (see `_slot_costs()`).
+
+    :param white_config: Slot numbers of white (see
+        `PROMOTION_CONFIGS`).
+
+    :param black_config: Slot numbers of black.
+
+    :return: Pair formed by the total cost (relative to an empty board)
+    and the length-64 list of the assigned pieces in FEN-notation order.
+    """
+    num_of_slots_by_kind = []
+    for num_of_queens, num_of_light, num_of_dark, num_of_pawns in (
+        white_config,
+        black_config,
+    ):
+        num_of_slots_by_kind += [
+            1,
+            num_of_queens,
+            2,
+            2,
+            num_of_light,
+            num_of_dark,
+            num_of_pawns,
+        ]
+    kinds = np.repeat(np.arange(len(_SLOT_PIECES)), num_of_slots_by_kind)
+
+    # Every slot but a king slot may be left unused (by "assigning" it to
+    # one of the extra columns)
+    unused_costs = np.zeros((len(kinds), len(kinds)))
+    unused_costs[_IS_KING_KIND[kinds]] = np.inf
+    cost_matrix = np.hstack((slot_costs[kinds], unused_costs))
+
+    slots, squares = linear_sum_assignment(cost_matrix)
+    total_cost = float(cost_matrix[slots, squares].sum())
+    pieces = ["_"] * 64
+    for slot, square in zip(slots, squares):
+        if square < 64:
+            pieces[square] = _SLOT_PIECES[kinds[slot]]
+    return total_cost, pieces
+
+
+def _fits_chess_set(pieces: list[str]) -> bool:
+    """Check the balance among pawns, queens, and bishops of a board.
+
+    :param pieces: Length-64 list of pieces in FEN-notation order.
+
+    :return: Whether the board can be set up with a standard physical
+    chess set (assuming the other piece counts are within limits).
+    """
+    pieces = np.array(pieces)
+    for _, queen, _, _, bishop, pawn in _SIDES:
+        num_of_light_squared = int((LIGHT_SQUARES & (pieces == bishop)).sum())
+        num_of_dark_squared = int((~LIGHT_SQUARES & (pieces == bishop)).sum())
+        if num_of_light_squared + num_of_dark_squared > 2:
+            return False
+        num_of_promotions = int((pieces == queen).sum() == 2) + int(
+            num_of_light_squared == 2 or num_of_dark_squared == 2
+        )
+        if num_of_promotions > 8 - (pieces == pawn).sum():
+            return False
+    return True
+
+
+def assign_pieces_optimally(probs: np.ndarray) -> list[str]:
+    """Assign the most probable valid pieces to all 64 squares.
+
+    :param probs: `(64, 13)` array of the piece probabilities in
+        FEN-notation order (the columns are in the order of `PIECES` in
+        "fen.py").
+
+    :return: Length-64 list of the inferred chess pieces in FEN-notation
+    order (`"_"` for an empty square).
+
+        The board has exactly one king per side, at most 2 queens,
+        rooks, knights, and bishops per side, no pawn on the first or
+        last row, and as many pawns as the promoted pieces allow, and
+        its total log-probability is the highest among such boards.
+    """
+    costs = -np.log(np.maximum(np.asarray(probs, dtype=np.float64), MIN_PROB))
+    slot_costs = _slot_costs(costs)
+
+    _, pieces = _solve(slot_costs, RELAXED_CONFIG, RELAXED_CONFIG)
+    if _fits_chess_set(pieces):
+        return pieces
+
+    # Relaxing the slot numbers of one side only gives a lower bound of
+    # the cost for each slot numbers of the other side (and the solution
+    # itself if the relaxed side turns out to be balanced anyway)
+    white_solutions = [
+        _solve(slot_costs, config, RELAXED_CONFIG)
+        for config in PROMOTION_CONFIGS
+    ]
+    black_lower_bounds = [
+        _solve(slot_costs, RELAXED_CONFIG, config)[0]
+        for config in PROMOTION_CONFIGS
+    ]
+    best_cost = np.inf
+    for white_idx in np.argsort([cost for cost, _ in white_solutions]):
+        lower_bound, candidate = white_solutions[white_idx]
+        if lower_bound >= best_cost:
+            break
+        if _fits_chess_set(candidate):
+            best_cost, pieces = lower_bound, candidate
+            continue
+        for black_idx in np.argsort(black_lower_bounds):
+            if max(lower_bound, black_lower_bounds[black_idx]) >= best_cost:
+                break
+            total_cost, candidate = _solve(
+                slot_costs,
+                PROMOTION_CONFIGS[white_idx],
+                PROMOTION_CONFIGS[black_idx],
+            )
+            if total_cost < best_cost:
+                best_cost, pieces = total_cost, candidate
+    return pieces
+
+
+if __name__ == "__main__":
+    # Benchmark of the optimal assignment against the greedy assignment
+    # (see "infer_pieces.py") on noisy probabilities of random positions
+    import contextlib
+    import io
+    import time
+
+    import chess
+
+    from livechess2fen.lc2fen.fen import codes_to_list, fen_to_codes
+    from livechess2fen.lc2fen.infer_pieces import _infer_pieces_greedily
+
+    NUM_OF_POSITIONS = 300
+
+    rng = np.random.default_rng(0)
+    for noise in (0.5, 1.0, 1.5):
+        num_of_correct_boards = {"greedy": 0, "optimal": 0}
+        num_of_correct_squares = {"greedy": 0, "optimal": 0}
+        total_time = {"greedy": 0, "optimal": 0}
+        for _ in range(NUM_OF_POSITIONS):
+            board = chess.Board()
+            for _ in range(rng.integers(0, 100)):
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                board.push(moves[rng.integers(len(moves))])
+            truth = codes_to_list(fen_to_codes(board.board_fen()))
+            logits = rng.normal(0, noise, (64, 13))
+            for square, piece in enumerate(truth):
+                logits[square, PIECES.index(piece)] += 3
+            probs = np.exp(logits)
+            probs /= probs.sum(axis=1, keepdims=True)
+
+            for mode, assign in (
+                ("greedy", _infer_pieces_greedily),
+                ("optimal", assign_pieces_optimally),
+            ):
+                start_time = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    pieces = assign(probs)
+                total_time[mode] += time.perf_counter() - start_time
+                num_of_correct_boards[mode] += pieces == truth
+                num_of_correct_squares[mode] += sum(
+                    piece == true_piece
+                    for piece, true_piece in zip(pieces, truth)
+                )
+
+        print(f"\tNoise level {noise}:")
+        for mode in ("greedy", "optimal"):
+            print(
+                f"\t\t{mode}: {num_of_correct_boards[mode]} of "
+                f"{NUM_OF_POSITIONS} boards and "
+                f"{num_of_correct_squares[mode] / NUM_OF_POSITIONS / 64:.2%}"
+                " of squares correct, "
+                f"{total_time[mode] / NUM_OF_POSITIONS * 1000:.2f} ms each"
+            )
@@ -1,38 +1,85 @@
 """This module is responsible for predicting board configurations."""
 
-import glob
-import os
-import shutil
-
 import cv2
 import numpy as np
-import onnxruntime
-from keras.models import load_model
-from keras.utils import load_img, img_to_array
 import chess
 
 from livechess2fen.lc2fen.detectboard.detect_board import (
-    detect,
+    detect_in_memory,
     compute_corners,
 )
 from livechess2fen.lc2fen.fen import (
+    PIECES,
+    LIGHT_SQUARES,
     list_to_board,
     board_to_fen,
-    is_light_square,
-    fen_to_board,
-    board_to_list,
+    fen_to_codes,
+    count_pieces,
 )
 from livechess2fen.lc2fen.infer_pieces import infer_chess_pieces
-from livechess2fen.lc2fen.split_board import split_board_image_trivial
+from livechess2fen.lc2fen.model_registry import get_model, predict_in_batches
+from livechess2fen.lc2fen.square_signatures import (
+    PositionSignatureCache,
+    SquareProbabilityCache,
+    compute_square_signatures,
+)
+from livechess2fen.lc2fen.temporal_filter import SquareBeliefFilter
+from livechess2fen.lc2fen.frame_burst import (
+    average_piece_probs,
+    select_sharp_frames,
+)
+from livechess2fen.lc2fen.occupancy import (
+    OccupancyClassifier,
+    hides_state_change,
+)
+
+
+_POSITION_SIGNATURES = PositionSignatureCache()
+"""Pixel signatures of the squares of the last position reached by a move.
+
+If the previous FEN passed to `predict_board()` is the position whose
+signatures are stored and no square's signature has shifted since, the
+board has not changed, and `predict_board()` returns right away without
+running the CNN.
+"""
+
+_SQUARE_PROBS = SquareProbabilityCache()
+"""Piece probabilities of the squares of the last processed frame.
+
+Only the squares that changed since their probabilities were computed
+are run through the CNN again (see `SquareProbabilityCache`).
+"""
+
+_SQUARE_BELIEFS = SquareBeliefFilter()
+"""Beliefs about the contents of the squares, fused over the frames.
 
+They are only used if temporal filtering is enabled (see
+"temporal_filter.py").
+"""
 
-def load_image(img_path: str, img_size: int, preprocess_func) -> np.ndarray:
-    """Load an image.
+_OCCUPANCY = OccupancyClassifier()
+"""Cheap classifier of the states (empty, white, or black) of the squares.
 
-    This function loads an image from its path. It is intended to be
-    used for loading piece images.
+It is only used if pre-classification is enabled (see "occupancy.py").
+"""
 
-    :param img_path: Image path.
+
+def preprocess_image(
+    img: np.ndarray, img_size: int, preprocess_func
+) -> np.ndarray:
+    """Preprocess an image.
+
+    This function preprocesses an in-memory BGR image. It is intended to
+    be used for preprocessing piece images, and it reproduces what
+    `keras.utils.load_img()` (RGB conversion and nearest-neighbor
+    resizing) and `keras.utils.img_to_array()` used to do on the saved
+    piece images.
+
+    Note: the board-prediction functions now preprocess all 64 squares
+    at once with a `SquarePreprocessor` (see "preprocess_squares.py");
+    this per-square function is kept as the reference implementation.
+
+    :param img: BGR piece image.
 
     :param img_size: Size of the input image. Example: `224`.
 
@@ -40,8 +87,13 @@ def load_image(img_path: str, img_size: int, preprocess_func) -> np.ndarray:
 
     :return: Preprocessed image.
     """
-    img = load_img(img_path, target_size=(img_size, img_size))
-    img_tensor = img_to_array(img)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    # `cv2.INTER_NEAREST_EXACT` picks the same pixels as PIL's nearest
+    # neighbor (which `keras.utils.load_img()` uses by default)
+    img = cv2.resize(
+        img, (img_size, img_size), interpolation=cv2.INTER_NEAREST_EXACT
+    )
+    img_tensor = img.astype("float32")
     img_tensor = np.expand_dims(img_tensor, axis=0)
     return preprocess_func(img_tensor)
 
@@ -50,88 +102,68 @@ def predict_board_keras(
     model_path: str,
     img_size: int,
     pre_input,
-    path="",
+    board_img: np.ndarray | None = None,
     a1_pos="",
     board_corners=None,
     previous_fen: str | None = None,
     must_detect_move: bool = False,
+    batch_size: int = 64,
+    frame_corners: list[list[int]] | None = None,
+    board: chess.Board | None = None,
+    piece_assignment: str = "greedy",
+    temporal_filtering: bool = False,
+    burst_imgs: list[np.ndarray] | None = None,
+    pre_classification: bool = False,
 ) -> tuple[str, list[list[int]], str | None]:
     """Predict FEN from board image using Keras for inference.
 
     This function predicts FEN string from chessboard image using
-    Keras as the inference engine.
+    Keras as the inference engine. The Keras model is loaded only once
+    per process (see "model_registry.py").
+
+    The parameters not documented here and the return value are the
+    same as for `predict_board()`.
 
     :param model_path: Path to the Keras model (ending with ".h5").
 
     :param img_size: Input size for the model.
 
-    :param pre_input: Input-preprocessing function for the model.
-
-    :param board_path: Path to the chessboard image of interest.
+    :param pre_input: Input preprocessor for the model.
 
-        The path must have rw permission.
+        This is a `SquarePreprocessor` (see "preprocess_squares.py")
+        that turns the detected chessboard into a batch of the 64
+        preprocessed squares. Its `img_size` must be `img_size`.
 
-        Example: `"../predictions/board.jpg"`.
-
-    :param a1_pos: Position of the a1 square of the chessboard image.
+    :param batch_size: Maximum number of squares per model call.
 
-        This is the position of the a1 square (`"BL"`, `"BR"`, `"TL"`,
-        or `"TR"`) corresponding to the chessboard image.
-
-    :param board_corners: Length-4 list of coordinates of four corners.
-
-        The 4 board corners are in the order of top left, top right,
-        bottom right, and bottom left.
-
-        If it is not `None` and the corner coordinates are accurate
-        enough, the neural-network-based board-detection step is skipped
-        (which means the total processing time is reduced).
-
-    :param previous_fen: FEN string of the previous board position.
-
-        This parameter is only used when `path` points to a single image
-        and `test` is `False`.
-
-    :param must_detect_move: Whether move detection is required.
-
-        This parameter (recommended to be set to `True`) determines
-        whether a valid move must be detected in order to update the
-        previous FEN when calling the `predict_fen()` function.
-
-        This parameter only makes a difference if `previous_fen` is
-        provided. When it is set to `True` and no valid move is
-        detected, the FEN string returned by `predict_fen()`  will be
-        exactly the same as `previous_fen`.
-
-        Note that valid moves are defined here to be different from
-        legal moves; legal moves are a subset of valid moves. Since
-        `previous_fen` does not contain any information on aspects such
-        as whose turn it is and which sides still have
-        kingside/queenside castling rights, valid moves are broadly
-        defined to be all "potentially legal" moves.
-
-    :return: Length-3 tuple formed by the predicted FEN string, the
-    coordinates of the corners of the chessboard in the input image, and
-    the detected move.
+        The default value runs all 64 squares through the model in a
+        single call; a smaller value lowers the peak memory usage.
     """
-    model = load_model(model_path)
+    if pre_input.img_size != img_size:
+        raise ValueError(
+            f"pre_input resizes squares to {pre_input.img_size}, "
+            f"not {img_size}"
+        )
+    model = get_model(model_path, "keras")
 
-    def obtain_piece_probs_for_all_64_squares(
-        pieces: list[str],
-    ) -> list[list[float]]:
-        predictions = []
-        for piece in pieces:
-            piece_img = load_image(piece, img_size, pre_input)
-            predictions.append(model.predict(piece_img)[0])
-        return predictions
+    def obtain_piece_probs(piece_imgs: np.ndarray) -> np.ndarray:
+        return predict_in_batches(model, "keras", piece_imgs, batch_size)
 
     return predict_board(
-        path,
+        board_img,
         a1_pos,
-        obtain_piece_probs_for_all_64_squares,
+        pre_input,
+        obtain_piece_probs,
         board_corners=board_corners,
         previous_fen=previous_fen,
         must_detect_move=must_detect_move,
+        frame_corners=frame_corners,
+        model_key=(model_path, "keras"),
+        board=board,
+        piece_assignment=piece_assignment,
+        temporal_filtering=temporal_filtering,
+        burst_imgs=burst_imgs,
+        pre_classification=pre_classification,
     )
 
 
@@ -139,120 +171,108 @@ def predict_board_onnx(
     model_path: str,
     img_size: int,
     pre_input,
-    path="",
+    board_img: np.ndarray | None = None,
     a1_pos="",
     board_corners=None,
     previous_fen: str | None = None,
     must_detect_move: bool = False,
+    batch_size: int = 64,
+    frame_corners: list[list[int]] | None = None,
+    board: chess.Board | None = None,
+    piece_assignment: str = "greedy",
+    temporal_filtering: bool = False,
+    burst_imgs: list[np.ndarray] | None = None,
+    pre_classification: bool = False,
 ) -> tuple[str, list[list[int]], str | None]:
     """Predict FEN from board image using ONNX for inference.
 
     This function predicts FEN string from chessboard image using
-    ONNXRuntime as the inference engine.
-
-    :param model_path: Path to the Keras model (ending with ".h5").
-
-    :param img_size: Input size for the model.
-
-    :param pre_input: Input-preprocessing function for the model.
-
-    :param board_path: Path to the chessboard image of interest.
-
-        The path must have rw permission.
-
-        Example: `"../predictions/board.jpg"`.
+    ONNXRuntime as the inference engine. The inference session is built
+    only once per process (see "model_registry.py").
 
-    :param a1_pos: Position of the a1 square of the chessboard image.
+    The parameters not documented here and the return value are the
+    same as for `predict_board()`.
 
-        This is the position of the a1 square (`"BL"`, `"BR"`, `"TL"`,
-        or `"TR"`) corresponding to the chessboard image.
-
-    :param board_corners: Length-4 list of coordinates of four corners.
+    :param model_path: Path to the ONNX model (ending with ".onnx").
 
-        The 4 board corners are in the order of top left, top right,
-        bottom right, and bottom left.
-
-        If it is not `None` and the corner coordinates are accurate
-        enough, the neural-network-based board-detection step is skipped
-        (which means the total processing time is reduced).
-
-    :param previous_fen: FEN string of the previous board position.
-
-        This parameter is only used when `path` points to a single image
-        and `test` is `False`.
-
-    :param must_detect_move: Whether move detection is required.
+    :param img_size: Input size for the model.
 
-        This parameter (recommended to be set to `True`) determines
-        whether a valid move must be detected in order to update the
-        previous FEN when calling the `predict_fen()` function.
+    :param pre_input: Input preprocessor for the model.
 
-        This parameter only makes a difference if `previous_fen` is
-        provided. When it is set to `True` and no valid move is
-        detected, the FEN string returned by `predict_fen()`  will be
-        exactly the same as `previous_fen`.
+        This is a `SquarePreprocessor` (see "preprocess_squares.py")
+        that turns the detected chessboard into a batch of the 64
+        preprocessed squares. Its `img_size` must be `img_size`.
 
-        Note that valid moves are defined here to be different from
-        legal moves; legal moves are a subset of valid moves. Since
-        `previous_fen` does not contain any information on aspects such
-        as whose turn it is and which sides still have
-        kingside/queenside castling rights, valid moves are broadly
-        defined to be all "potentially legal" moves.
+    :param batch_size: Maximum number of squares per model call.
 
-    :return: Length-3 tuple formed by the predicted FEN string, the
-    coordinates of the corners of the chessboard in the input image, and
-    the detected move.
+        The default value runs all 64 squares through the model in a
+        single call; a smaller value lowers the peak memory usage.
     """
-    sess = onnxruntime.InferenceSession(model_path)
-
-    def obtain_piece_probs_for_all_64_squares(
-        pieces: list[str],
-    ) -> list[list[float]]:
-        predictions = []
-        for piece in pieces:
-            piece_img = load_image(piece, img_size, pre_input)
-            predictions.append(
-                sess.run(None, {sess.get_inputs()[0].name: piece_img})[0][0]
-            )
-        return predictions
+    if pre_input.img_size != img_size:
+        raise ValueError(
+            f"pre_input resizes squares to {pre_input.img_size}, "
+            f"not {img_size}"
+        )
+    sess = get_model(model_path, "onnx")
+
+    def obtain_piece_probs(piece_imgs: np.ndarray) -> np.ndarray:
+        return predict_in_batches(sess, "onnx", piece_imgs, batch_size)
 
     return predict_board(
-        path,
+        board_img,
         a1_pos,
-        obtain_piece_probs_for_all_64_squares,
+        pre_input,
+        obtain_piece_probs,
         board_corners=board_corners,
         previous_fen=previous_fen,
         must_detect_move=must_detect_move,
+        frame_corners=frame_corners,
+        model_key=(model_path, "onnx"),
+        board=board,
+        piece_assignment=piece_assignment,
+        temporal_filtering=temporal_filtering,
+        burst_imgs=burst_imgs,
+        pre_classification=pre_classification,
     )
 
 
 def predict_board(
-    board_path: str,
+    board_img: np.ndarray,
     a1_pos: str,
-    obtain_piece_probs_for_all_64_squares,
+    pre_input,
+    obtain_piece_probs,
     board_corners: list[list[int]] | None = None,
     previous_fen: str | None = None,
     must_detect_move: bool = False,
+    frame_corners: list[list[int]] | None = None,
+    model_key=None,
+    board: chess.Board | None = None,
+    piece_assignment: str = "greedy",
+    temporal_filtering: bool = False,
+    burst_imgs: list[np.ndarray] | None = None,
+    pre_classification: bool = False,
 ) -> tuple[str, list[list[int]], str | None]:
     """Predict the FEN string from a chessboard image.
 
-    :param board_path: Path to the chessboard image of interest.
-
-        The path must have rw permission.
-
-        Example: `"../predictions/board.jpg"`.
+    :param board_img: BGR chessboard image of interest.
 
     :param a1_pos: Position of the a1 square of the chessboard image.
 
         This is the position of the a1 square (`"BL"`, `"BR"`, `"TL"`,
         or `"TR"`) corresponding to the chessboard image.
 
-    :param obtain_piece_probs_for_all_64_squares: Path-to-prob function.
+    :param pre_input: Input preprocessor for the model.
+
+        This is a `SquarePreprocessor` (see "preprocess_squares.py")
+        that turns the detected chessboard (or the raw camera frame)
+        into a batch of the 64 preprocessed squares.
+
+    :param obtain_piece_probs: Image-to-prob function.
 
-        This function takes as input a length-64 list of paths to
-        chess-piece images and returns a length-64 list of the
-        corresponding piece probabilities (each element of the list is a
-        length-13 sublist that contains 13 piece probabilities).
+        This function takes as input an `(n, img_size, img_size, 3)`
+        array of preprocessed squares and returns an `(n, 13)` array of
+        the corresponding piece probabilities (each row of the array
+        contains 13 piece probabilities).
 
         This parameter allows us to deploy different inference engines
         (Keras, ONNX, or TensorRT).
@@ -289,54 +309,247 @@ def predict_board(
         kingside/queenside castling rights, valid moves are broadly
         defined to be all "potentially legal" moves.
 
+    :param frame_corners: Coordinates of the board corners in the frame.
+
+        If it is not `None`, `board_img` is the raw camera frame (rather
+        than the perspective-transformed board image), these are the
+        coordinates of its four board corners (in the order of top left,
+        top right, bottom right, and bottom left), and the 64 squares
+        are sampled straight from the raw frame (see
+        `SquarePreprocessor.from_frame()`). `board_corners` is then
+        ignored since no board detection is needed.
+
+    :param model_key: Key identifying the model behind
+        `obtain_piece_probs` (e.g., its path and backend).
+
+        If it is not `None`, only the squares that changed since the
+        previous call (with the same model and calibration) are run
+        through the model again; the other squares reuse their cached
+        probabilities. If it is `None`, all 64 squares are run through
+        the model.
+
+    :param board: Previous board position.
+
+        If it is not `None` (in which case its piece placement must be
+        `previous_fen`), the move is decoded among the legal moves of
+        this position, which takes whose turn it is, the castling
+        rights, and the en-passant square into account (see
+        "decode_move.py").
+
+    :param piece_assignment: How the pieces are inferred when no move is
+        decoded: `"greedy"` (one piece at a time in order of
+        probability) or `"optimal"` (all pieces at once, see
+        "optimal_assignment.py"; slower but more robust to an
+        inaccurate model).
+
+    :param temporal_filtering: Whether to fuse the piece probabilities
+        with those of the previous frames.
+
+        If it is `True`, the pieces are inferred from the probabilities
+        filtered over time by a per-square recursive Bayesian filter
+        whose transitions follow the legal moves from the previous
+        position (see "temporal_filter.py"), so that a single misread
+        frame (e.g., because of glare) is less likely to cause a wrong
+        or missed move.
+
+    :param burst_imgs: Other frames of the same board, captured right
+        after `board_img` (and of the same kind, i.e., raw camera frames
+        if `frame_corners` is not `None`).
+
+        If it is not empty, the frames that are much blurrier than the
+        sharpest one are dropped (if `board_img` is one of them, the
+        sharpest frame takes its place), and the piece probabilities are
+        averaged over the remaining frames, whose squares go through the
+        model together (see "frame_burst.py").
+
+    :param pre_classification: Whether to skip the CNN on the squares
+        whose occupancy and color are clear-cut.
+
+        If it is `True`, a cheap classifier (calibrated on the first
+        position whose pieces were all identified by the CNN, which is
+        usually the starting position) decides whether each square is
+        empty, holds a white piece, or holds a black piece, and the
+        squares whose state it decides confidently and which are in the
+        same state as in the previous position keep their previous
+        pieces without running the CNN (see "occupancy.py").
+
+        This only applies to the squares that `model_key` does not
+        already spare the CNN (i.e., the squares whose signatures
+        changed, which outside of the squares of a move mostly happens
+        when the lighting changes), so it requires `model_key` (a
+        `ValueError` is raised if `model_key` is `None`).
+
     :return: Length-3 tuple formed by the predicted FEN string, the
     coordinates of the corners of the chessboard in the input image, and
     the detected move.
     """
-    board_corners = detect_input_board(board_path, board_corners)
-    print(
-        f"\tBoard corners: {board_corners[0]}, {board_corners[1]}, "
-        f"{board_corners[2]}, and {board_corners[3]}"
+    if pre_classification and model_key is None:
+        raise ValueError("pre_classification requires a model_key")
+
+    calibration_key = (
+        board_img.shape,
+        str(board_corners),
+        str(frame_corners),
+        a1_pos,
+        pre_input.img_size,
     )
+    if frame_corners is None:
+        detected_board, board_corners = detect_input_board(
+            board_img, board_corners
+        )
+        print(
+            f"\tBoard corners: {board_corners[0]}, {board_corners[1]}, "
+            f"{board_corners[2]}, and {board_corners[3]}"
+        )
+        piece_imgs = pre_input(detected_board)  # All 64 squares at once
+    else:  # The squares are sampled straight from the raw frame
+        board_corners = frame_corners
+        piece_imgs = pre_input.from_frame(board_img, frame_corners)
+
+    burst_piece_imgs = None
+    if burst_imgs:
+        # The squares of every frame are kept, since `pre_input` overwrites
+        # its output buffer at each call
+        frame_piece_imgs = np.empty(
+            (len(burst_imgs) + 1, *piece_imgs.shape), piece_imgs.dtype
+        )
+        frame_piece_imgs[0] = piece_imgs
+        for frame_idx, burst_img in enumerate(burst_imgs, 1):
+            if frame_corners is None:
+                detected_burst_board, _ = detect_input_board(
+                    burst_img, board_corners
+                )
+                frame_piece_imgs[frame_idx] = pre_input(detected_burst_board)
+            else:
+                frame_piece_imgs[frame_idx] = pre_input.from_frame(
+                    burst_img, frame_corners
+                )
+        sharp_frames = select_sharp_frames(frame_piece_imgs)
+        print(
+            f"\t{len(sharp_frames)} of the {len(frame_piece_imgs)} frames "
+            "are sharp enough to be used"
+        )
+        piece_imgs = frame_piece_imgs[sharp_frames[0]]
+        burst_piece_imgs = frame_piece_imgs[sharp_frames[1:]]
+
+    signatures = compute_square_signatures(piece_imgs)
+    # No square is run through the model in this case, so the beliefs of
+    # the temporal filter carry over unchanged as well
+    if _POSITION_SIGNATURES.is_unchanged(
+        previous_fen, calibration_key, signatures
+    ):
+        print(
+            "\tNo square has changed since the previous position, so the "
+            "pieces are not re-identified"
+        )
+        return previous_fen, board_corners, None
 
-    pieces = obtain_individual_pieces(board_path)
-    probs_with_no_indices = obtain_piece_probs_for_all_64_squares(pieces)
     if previous_fen is not None and not check_validity_of_fen(previous_fen):
         print(
             "\tWarning: the previous FEN is ignored because it is invalid for "
             "a standard physical chess set"
         )
         previous_fen = None
-    shutil.rmtree("tmp")
+        board = None
+
+    inferred_squares = None  # All squares are run through the model
+    if model_key is None:
+        probs_with_no_indices = average_piece_probs(
+            obtain_piece_probs, piece_imgs, burst_piece_imgs
+        )
+    else:
+        known_probs = None
+        if pre_classification and _OCCUPANCY.key == calibration_key:
+            known_probs = _OCCUPANCY.known_piece_probs(
+                signatures, previous_fen
+            )
+        probs_with_no_indices = _SQUARE_PROBS.obtain_probs(
+            (calibration_key, model_key),
+            signatures,
+            piece_imgs,
+            obtain_piece_probs,
+            burst_piece_imgs,
+            known_probs,
+        )
+        inferred_squares = _SQUARE_PROBS.inferred_squares
+        if hides_state_change(
+            probs_with_no_indices,
+            _SQUARE_PROBS.known_squares,
+            previous_fen,
+            a1_pos,
+            board,
+        ):
+            print(
+                "\tThe pre-classified squares may hide part of a move, so "
+                "they are run through the model as well"
+            )
+            probs_with_no_indices = _SQUARE_PROBS.obtain_probs(
+                (calibration_key, model_key),
+                signatures,
+                piece_imgs,
+                obtain_piece_probs,
+                burst_piece_imgs,
+            )
+            inferred_squares = (
+                inferred_squares | _SQUARE_PROBS.inferred_squares
+            )
+        print(
+            f"\t{inferred_squares.sum()} of the 64 squares have been run "
+            "through the model"
+        )
+    model_probs = probs_with_no_indices
+
+    if temporal_filtering:
+        probs_with_no_indices = _SQUARE_BELIEFS.update(
+            (calibration_key, model_key),
+            probs_with_no_indices,
+            a1_pos,
+            previous_fen,
+            board,
+            inferred_squares,
+        )
 
     predictions, detected_move = infer_chess_pieces(
-        probs_with_no_indices, a1_pos, previous_fen, must_detect_move
+        probs_with_no_indices,
+        a1_pos,
+        previous_fen,
+        must_detect_move,
+        board,
+        piece_assignment,
     )
 
     board = list_to_board(predictions)
     fen = board_to_fen(board)
 
+    if (
+        pre_classification
+        and previous_fen is not None
+        and _OCCUPANCY.key != calibration_key
+        and _OCCUPANCY.calibrate(
+            calibration_key, signatures, fen, a1_pos, model_probs
+        )
+    ):
+        print("\tThe occupancy pre-classifier has been calibrated")
+
+    if fen != previous_fen:
+        # Only a position reached by a move is stored: if no move was
+        # detected, a move may still have been made (and missed), so the
+        # squares must be re-identified at the next update
+        _POSITION_SIGNATURES.store(fen, calibration_key, signatures)
+
     return fen, board_corners, detected_move
 
 
 def detect_input_board(
-    board_path: str, board_corners: list[list[int]] | None = None
-) -> list[list[int]]:
+    board_img: np.ndarray, board_corners: list[list[int]] | None = None
+) -> tuple[np.ndarray, list[list[int]]]:
     """Detect the input board.
 
-    This function takes as input a path to a chessboard image
-    (e.g., "image.jpg") and stores the image that contains the detected
-    chessboard in the "tmp" subfolder of the folder containing the board
-    (e.g., "tmp/image.jpg").
-
-    If the "tmp" folder already exists, the function deletes its
-    contents. Otherwise, the function creates the "tmp" folder.
-
-    :param board_path: Path to the chessboard image of interest.
-
-        The path must have rw permission.
+    This function takes as input a chessboard image and returns the
+    image that contains the detected chessboard along with the
+    coordinates of the board corners.
 
-        Example: `"../predictions/board.jpg"`.
+    :param board_img: BGR chessboard image of interest.
 
     :param board_corners: Length-4 list of coordinates of four corners.
 
@@ -347,42 +560,13 @@ def detect_input_board(
         enough, the neural-network-based board-detection step is skipped
         (which means the total processing time is reduced).
 
-    :return: Length-4 list of the (new) coordinates of the four board
-    corners detected.
+    :return: Pair formed by the BGR image of the detected chessboard and
+    the length-4 list of the (new) coordinates of the four board corners
+    detected.
     """
-    input_image = cv2.imread(board_path)
-    head, tail = os.path.split(board_path)
-    tmp_dir = os.path.join(head, "tmp/")
-    if os.path.exists(tmp_dir):
-        shutil.rmtree(tmp_dir)
-    os.mkdir(tmp_dir)
-    image_object = detect(
-        input_image, os.path.join(head, "tmp", tail), board_corners
-    )
+    detected_board, image_object = detect_in_memory(board_img, board_corners)
     board_corners, _ = compute_corners(image_object)
-    return board_corners
-
-
-def obtain_individual_pieces(board_path: str) -> list[str]:
-    """Obtain the individual pieces of a board.
-
-    :param board_path: Path to the chessboard image of interest.
-
-        The path must have rw permission.
-
-        The image of the detected chessboard must be in the
-        corresponding "tmp" folder (see `detect_input_board()`).
-
-        Example: `"../predictions/board.jpg"`.
-
-    :return: Length-64 list of paths to chess-piece images
-    """
-    head, tail = os.path.split(board_path)
-    tmp_dir = os.path.join(head, "tmp/")
-    pieces_dir = os.path.join(tmp_dir, "pieces/")
-    os.mkdir(pieces_dir)
-    split_board_image_trivial(os.path.join(tmp_dir, tail), "", pieces_dir)
-    return sorted(glob.glob(pieces_dir + "/*.jpg"))
+    return detected_board, board_corners
 
 
 def check_validity_of_fen(fen: str) -> bool:
@@ -403,34 +587,28 @@ def check_validity_of_fen(fen: str) -> bool:
         ):  # If it's black to move, the FEN is also invalid
             return False
 
-    num_of_P = fen.count("P")  # Number of white pawns
-    num_of_Q = fen.count("Q")  # Number of white queens
-    num_of_R = fen.count("R")  # Number of white rooks
-    num_of_N = fen.count("N")  # Number of white knights
-    num_of_p = fen.count("p")  # Number of black pawns
-    num_of_q = fen.count("q")  # Number of black queens
-    num_of_r = fen.count("r")  # Number of black rooks
-    num_of_n = fen.count("n")  # Number of black knights
-    fen_list = board_to_list(fen_to_board(fen))
-    num_of_light_squared_B = sum(
-        [
-            is_light_square(square)
-            for (square, piece_type) in enumerate(fen_list)
-            if piece_type == "B"
-        ]
-    )  # Number of light-squared bishops for white
+    codes = fen_to_codes(fen)
+    counts = count_pieces(codes)
+    light_squared_counts = count_pieces(codes[LIGHT_SQUARES])
+    num_of_P = counts[PIECES.index("P")]  # Number of white pawns
+    num_of_Q = counts[PIECES.index("Q")]  # Number of white queens
+    num_of_R = counts[PIECES.index("R")]  # Number of white rooks
+    num_of_N = counts[PIECES.index("N")]  # Number of white knights
+    num_of_p = counts[PIECES.index("p")]  # Number of black pawns
+    num_of_q = counts[PIECES.index("q")]  # Number of black queens
+    num_of_r = counts[PIECES.index("r")]  # Number of black rooks
+    num_of_n = counts[PIECES.index("n")]  # Number of black knights
+    num_of_light_squared_B = light_squared_counts[
+        PIECES.index("B")
+    ]  # Number of light-squared bishops for white
     num_of_dark_squared_B = (
-        fen.count("B") - num_of_light_squared_B
+        counts[PIECES.index("B")] - num_of_light_squared_B
     )  # Number of dark-squared bishops for white
-    num_of_light_squared_b = sum(
-        [
-            is_light_square(square)
-            for (square, piece_type) in enumerate(fen_list)
-            if piece_type == "b"
-        ]
-    )  # Number of light-squared bishops for black
+    num_of_light_squared_b = light_squared_counts[
+        PIECES.index("b")
+    ]  # Number of light-squared bishops for black
     num_of_dark_squared_b = (
-        fen.count("b") - num_of_light_squared_b
+        counts[PIECES.index("b")] - num_of_light_squared_b
     )  # Number of dark-squared bishops for black
 
     if (
@@ -0,0 +1,284 @@
+"""This module is responsible for preprocessing the 64 square images.
+
+The preprocessing is done for all 64 squares at once with NumPy (no
+Keras, no per-square function calls) and the result is written into a
+buffer that is reused from one frame to the next.
+
+The squares can also be sampled straight from the raw camera frame (see
+`SquarePreprocessor.from_frame()`), which skips the full-board
+perspective-transformed image altogether.
+"""
+
+import cv2
+import numpy as np
+
+
+SQUEEZENET1P1_MEAN = np.float32([103.939, 116.779, 123.68])
+"""Per-channel (BGR) means used by the SqueezeNet1p1 preprocessing.
+
+The SqueezeNet1p1 model was trained with `prein_squeezenet1p1`, i.e.,
+Keras's `imagenet_utils.preprocess_input()` in its default `"caffe"`
+mode, which converts RGB images to BGR and subtracts these means without
+any scaling.
+"""
+
+
+class SquarePreprocessor:
+    """Crop, resize, and normalize the 64 squares of a chessboard image.
+
+    Calling an instance on a BGR chessboard image returns a
+    `(64, img_size, img_size, 3)` float32 array that is bit-for-bit
+    identical to what `prein_squeezenet1p1` returns for the 64 squares
+    (split with `split_board_image_trivial_in_memory()` and resized with
+    `preprocess_image()` in "predict_board.py"), in the same square
+    order.
+
+    Since the squares are resized with nearest-neighbor interpolation,
+    cropping and resizing boil down to gathering precomputed pixel
+    indices, which is done in a single `np.take()` call.
+
+    Note that the returned array is a buffer owned by the instance; it
+    is overwritten by the next call.
+    """
+
+    def __init__(
+        self, img_size: int = 227, mean: np.ndarray = SQUEEZENET1P1_MEAN
+    ):
+        """Initialize an instance of the `SquarePreprocessor`.
+
+        :param img_size: Input size for the model. Example: `227`.
+
+        :param mean: Per-channel (BGR) means to subtract.
+        """
+        self.img_size = img_size
+        self.mean = np.float32(mean)
+        # Subtracting a full-size mean tile is several times faster than
+        # broadcasting the 3 means over the last axis
+        self._mean_tile = np.ascontiguousarray(
+            np.broadcast_to(self.mean, (img_size, img_size, 3))
+        )
+        self._board_shape = None
+        self._pixel_indices = None
+        self._squares = None  # uint8 staging buffer
+        self._buffer = None  # float32 output buffer
+        self._frame_key = None
+        self._frame_maps = None
+
+    def _build_pixel_indices(self, board_shape: tuple[int, int]):
+        """Precompute the pixel indices of the 64 resized squares.
+
+        For each of the 64 resized squares, this function computes the
+        flat indices (into the chessboard image) of the pixels picked by
+        nearest-neighbor interpolation. PIL (and hence
+        `keras.utils.load_img()`) samples the source pixel
+        `floor((x + 0.5) * square_size / img_size)` for output pixel
+        `x`.
+
+        :param board_shape: Height and width of the chessboard image.
+        """
+        square_size = board_shape[0] // 8  # This is typically 1200 / 8
+        offsets = np.floor(
+            (np.arange(self.img_size) + 0.5) * square_size / self.img_size
+        ).astype(np.intp)
+        starts = np.arange(8) * square_size
+        rows = starts[:, None, None, None] + offsets[None, None, :, None]
+        cols = starts[None, :, None, None] + offsets[None, None, None, :]
+        self._pixel_indices = (rows * board_shape[1] + cols).reshape(
+            64, self.img_size, self.img_size
+        )
+        self._board_shape = board_shape
+
+    def _build_frame_maps(
+        self,
+        frame_shape: tuple[int, int],
+        frame_corners: list[list[int]],
+        board_size: int,
+    ):
+        """Precompute the remap tables that sample squares from a frame.
+
+        Output pixel `x` of a resized square is the pixel
+        `floor((x + 0.5) * square_size / img_size)` of the corresponding
+        square of the perspective-transformed board image, which itself
+        is the bilinear interpolation of the raw frame at the inverse
+        perspective transform of that pixel. The remap tables store
+        those raw-frame positions for all 64 squares, stacked vertically
+        (so that `cv2.remap()` writes the squares in batch order).
+
+        :param frame_shape: Height and width of the raw frame.
+
+        :param frame_corners: Coordinates of the four board corners.
+
+            The coordinates are in the raw frame, in the order of top
+            left, top right, bottom right, and bottom left.
+
+        :param board_size: Size of the perspective-transformed board.
+        """
+        square_size = board_size // 8
+        offsets = np.floor(
+            (np.arange(self.img_size) + 0.5) * square_size / self.img_size
+        )
+        starts = np.arange(8) * square_size
+        x = starts[None, :, None, None] + offsets[None, None, None, :]
+        y = starts[:, None, None, None] + offsets[None, None, :, None]
+        x, y = np.broadcast_arrays(x, y)
+
+        pts1 = np.float32(frame_corners)
+        pts2 = np.float32(
+            [
+                [0, 0],
+                [board_size - 1, 0],
+                [board_size - 1, board_size - 1],
+                [0, board_size - 1],
+            ]
+        )
+        M_inv = np.linalg.inv(cv2.getPerspectiveTransform(pts1, pts2))
+        w = M_inv[2, 0] * x + M_inv[2, 1] * y + M_inv[2, 2]
+        map_x = (M_inv[0, 0] * x + M_inv[0, 1] * y + M_inv[0, 2]) / w
+        map_y = (M_inv[1, 0] * x + M_inv[1, 1] * y + M_inv[1, 2]) / w
+
+        shape = (64 * self.img_size, self.img_size)
+        self._frame_maps = cv2.convertMaps(
+            map_x.reshape(shape).astype(np.float32),
+            map_y.reshape(shape).astype(np.float32),
+            cv2.CV_16SC2,
+        )  # Fixed-point maps, like those `cv2.warpPerspective()` uses
+
+    def from_frame(
+        self,
+        frame: np.ndarray,
+        frame_corners: list[list[int]],
+        board_size: int = 1200,
+    ) -> np.ndarray:
+        """Preprocess the 64 squares directly from a raw camera frame.
+
+        This function returns (up to the rounding of bilinear
+        interpolation) what calling the instance on the
+        `board_size`x`board_size` perspective-transformed board image
+        returns, but it samples each square pixel straight from the raw
+        frame with a single `cv2.remap()` call. The remap tables are
+        built only once per calibration (i.e., per `frame_corners`).
+
+        :param frame: Raw BGR camera frame.
+
+        :param frame_corners: Coordinates of the four board corners.
+
+            The coordinates are in the raw frame, in the order of top
+            left, top right, bottom right, and bottom left.
+
+        :param board_size: Size of the perspective-transformed board.
+
+        :return: `(64, img_size, img_size, 3)` float32 array of the
+        preprocessed squares (in FEN-notation order of the board).
+        """
+        key = (
+            frame.shape[:2],
+            tuple(map(tuple, np.asarray(frame_corners).tolist())),
+            board_size,
+        )
+        if key != self._frame_key:
+            self._build_frame_maps(frame.shape[:2], frame_corners, board_size)
+            self._frame_key = key
+        if self._buffer is None:
+            shape = (64, self.img_size, self.img_size, 3)
+            self._squares = np.empty(shape, np.uint8)
+            self._buffer = np.empty(shape, np.float32)
+
+        cv2.remap(
+            frame,
+            self._frame_maps[0],
+            self._frame_maps[1],
+            cv2.INTER_LINEAR,
+            dst=self._squares.reshape(64 * self.img_size, self.img_size, 3),
+        )
+        np.subtract(self._squares, self._mean_tile, out=self._buffer)
+        return self._buffer
+
+    def __call__(self, board_img: np.ndarray) -> np.ndarray:
+        """Preprocess the 64 squares of a chessboard image.
+
+        :param board_img: BGR chessboard image.
+
+            This image's height must be the same as its width.
+
+        :return: `(64, img_size, img_size, 3)` float32 array of the
+        preprocessed squares (in FEN-notation order of the input image).
+        """
+        if board_img.shape[0] != board_img.shape[1]:
+            raise ValueError("Image must have the same height and width.")
+        if board_img.shape[:2] != self._board_shape:
+            self._build_pixel_indices(board_img.shape[:2])
+        if self._buffer is None:
+            shape = (64, self.img_size, self.img_size, 3)
+            self._squares = np.empty(shape, np.uint8)
+            self._buffer = np.empty(shape, np.float32)
+
+        pixels = np.ascontiguousarray(board_img).reshape(-1, 3)
+        np.take(pixels, self._pixel_indices, axis=0, out=self._squares)
+        # The image is already BGR, so only the means are left to handle
+        np.subtract(self._squares, self._mean_tile, out=self._buffer)
+        return self._buffer
+
+
+if __name__ == "__main__":
+    # Note: run this file from the "LobsterpincerSpectatorForWinRPiCombo"
+    # directory with `python -m livechess2fen.lc2fen.preprocess_squares`
+    import time
+
+    from keras.applications.imagenet_utils import (
+        preprocess_input as prein_squeezenet1p1,
+    )
+
+    from livechess2fen.lc2fen.predict_board import preprocess_image
+    from livechess2fen.lc2fen.split_board import (
+        split_board_image_trivial_in_memory,
+    )
+
+    preprocessor = SquarePreprocessor(227)
+    for filename in [
+        "Test Images/before_0-0-0_by_black.png",
+        "Test Images/after_0-0-0_by_black.png",
+        "Test Images/test.png",
+    ]:
+        board_img = cv2.imread(filename)
+
+        start_time = time.time()
+        expected = np.concatenate(
+            [
+                preprocess_image(square, 227, prein_squeezenet1p1)
+                for square in split_board_image_trivial_in_memory(board_img)
+            ]
+        )
+        finish_time = time.time()
+        print(f"Per-square preprocessing took {finish_time - start_time} s")
+
+        start_time = time.time()
+        actual = preprocessor(board_img)
+        finish_time = time.time()
+        print(f"Vectorized preprocessing took {finish_time - start_time} s")
+
+        assert actual.dtype == expected.dtype
+        assert np.array_equal(actual, expected)
+        print(f"\tThe outputs for {filename} are bit-for-bit identical!")
+
+        # Treat the image as a raw frame and compare the two-step path
+        # (perspective transform + preprocessing) with the fused one
+        frame_corners = [[150, 100], [1100, 60], [1150, 1130], [40, 1000]]
+        start_time = time.time()
+        M = cv2.getPerspectiveTransform(
+            np.float32(frame_corners),
+            np.float32([[0, 0], [1199, 0], [1199, 1199], [0, 1199]]),
+        )
+        expected = preprocessor(
+            cv2.warpPerspective(board_img, M, (1200, 1200))
+        ).copy()
+        finish_time = time.time()
+        print(f"Warping and preprocessing took {finish_time - start_time} s")
+
+        start_time = time.time()
+        actual = preprocessor.from_frame(board_img, frame_corners)
+        finish_time = time.time()
+        print(f"Fused preprocessing took {finish_time - start_time} s")
+        print(
+            "\tMaximum absolute difference: "
+            f"{np.abs(actual - expected).max()}"
+        )
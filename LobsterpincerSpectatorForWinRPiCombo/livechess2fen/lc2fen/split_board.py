@@ -6,6 +6,7 @@ into account the piece height and perspective.
 """
 
 import cv2
+import numpy as np
 
 
 def split_board_image_trivial(
@@ -79,6 +80,42 @@ def split_board_image_trivial(
             )
 
 
+def split_board_image_trivial_in_memory(
+    board_img: np.ndarray,
+) -> list[np.ndarray]:
+    """Split a chessboard image into 64 images of the 64 squares.
+
+    This function is the in-memory counterpart of
+    `split_board_image_trivial()`: it neither reads the chessboard image
+    from disk nor writes the square images to disk (so the square images
+    do not go through any lossy JPEG re-encoding either).
+
+    :param board_img: BGR chessboard image to split.
+
+        This image's height must be the same as its width.
+
+    :return: Length-64 list of BGR square images.
+
+        The square images are in the FEN-notation order of the input
+        image (the first element corresponds to its top-left square, the
+        second to the square on its right, and so on), which is the
+        same order as the sorted filenames generated by
+        `split_board_image_trivial()`. Each square image is a view into
+        `board_img`.
+    """
+    if board_img.shape[0] != board_img.shape[1]:
+        raise ValueError("Image must have the same height and width.")
+    square_size = board_img.shape[0] // 8  # This is typically 1200 / 8
+    return [
+        board_img[
+            row_start : row_start + square_size,
+            col_start : col_start + square_size,
+        ]
+        for row_start in range(0, 8 * square_size, square_size)
+        for col_start in range(0, 8 * square_size, square_size)
+    ]
+
+
 def split_board_image_advanced(
     board_image: str,
     square_corners: list[tuple[int, int]],
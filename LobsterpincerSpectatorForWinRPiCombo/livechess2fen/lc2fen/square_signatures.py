@@ -0,0 +1,242 @@
+"""This module is responsible for computing pixel signatures of squares.
+
+The signature of a square is a coarse, downsampled version of its
+preprocessed image (a grid of block means per channel). Comparing the
+signatures of two frames is far cheaper than running the CNN and tells
+which squares have visibly changed.
+"""
+
+import numpy as np
+
+from livechess2fen.lc2fen.frame_burst import average_piece_probs
+
+
+SIGNATURE_GRID_SIZE = 8
+"""Number of blocks along each side of a square's signature."""
+
+SIGNATURE_STRIDE = 4
+"""Pixel stride used to subsample a square before the block means."""
+
+CHANGE_THRESHOLD = 6
+"""Threshold on the signature shift of a square.
+
+A square whose signature shifted (mean absolute difference of its block
+means, in gray levels) by more than this threshold is considered to
+have changed. Moving a piece onto or off a square shifts its signature
+by several tens of gray levels, whereas camera noise shifts it by only
+1 or 2.
+"""
+
+
+def compute_square_signatures(piece_imgs: np.ndarray) -> np.ndarray:
+    """Compute the pixel signatures of a batch of preprocessed squares.
+
+    :param piece_imgs: `(n, img_size, img_size, 3)` array of preprocessed
+        squares (see "preprocess_squares.py").
+
+    :return: `(n, SIGNATURE_GRID_SIZE ** 2 * 3)` float32 array of the
+    signatures.
+    """
+    block_size = piece_imgs.shape[1] // (
+        SIGNATURE_GRID_SIZE * SIGNATURE_STRIDE
+    )
+    span = SIGNATURE_GRID_SIZE * SIGNATURE_STRIDE * block_size
+    subsampled = piece_imgs[:, :span:SIGNATURE_STRIDE, :span:SIGNATURE_STRIDE]
+    blocks = subsampled.reshape(
+        len(piece_imgs),
+        SIGNATURE_GRID_SIZE,
+        block_size,
+        SIGNATURE_GRID_SIZE,
+        block_size,
+        3,
+    )
+    return blocks.mean(axis=(2, 4), dtype=np.float32).reshape(
+        len(piece_imgs), -1
+    )
+
+
+def find_changed_squares(
+    signatures: np.ndarray,
+    reference_signatures: np.ndarray,
+    threshold: float = CHANGE_THRESHOLD,
+) -> np.ndarray:
+    """Find the squares whose signatures shifted beyond a threshold.
+
+    :param signatures: Signatures of the current squares.
+
+    :param reference_signatures: Signatures of the reference squares.
+
+    :param threshold: Threshold on the signature shift of a square.
+
+    :return: Boolean array telling which squares have changed.
+    """
+    shifts = np.abs(signatures - reference_signatures).mean(axis=1)
+    return shifts > threshold
+
+
+class PositionSignatureCache:
+    """Signatures of the 64 squares of the last accepted position.
+
+    The signatures are stored along with the FEN string of the position
+    and a calibration key (anything identifying how the squares were
+    cut out of the input image, such as the board corners), so that they
+    are compared only with squares cut out the same way.
+    """
+
+    def __init__(self):
+        """Initialize an empty instance of the `PositionSignatureCache`."""
+        self.clear()
+
+    def clear(self):
+        """Forget the stored position."""
+        self.fen = None
+        self.calibration_key = None
+        self.signatures = None
+
+    def store(self, fen: str, calibration_key, signatures: np.ndarray):
+        """Store the signatures of a position.
+
+        :param fen: FEN string of the position.
+
+        :param calibration_key: Key identifying the calibration.
+
+        :param signatures: `(64, k)` array of the signatures.
+        """
+        self.fen = fen
+        self.calibration_key = calibration_key
+        self.signatures = signatures.copy()
+
+    def is_unchanged(
+        self, fen: str, calibration_key, signatures: np.ndarray
+    ) -> bool:
+        """Return whether none of the 64 squares has visibly changed.
+
+        :param fen: FEN string of the position the squares should show.
+
+        :param calibration_key: Key identifying the calibration.
+
+        :param signatures: `(64, k)` array of the current signatures.
+
+        :return: Whether the stored position is `fen` (with the same
+        calibration) and no square's signature shifted beyond
+        `CHANGE_THRESHOLD`.
+        """
+        if fen is None or fen != self.fen:
+            return False
+        if calibration_key != self.calibration_key:
+            return False
+        return not find_changed_squares(signatures, self.signatures).any()
+
+
+class SquareProbabilityCache:
+    """Piece probabilities of the squares of the last processed frame.
+
+    Between consecutive moves only 2 to 4 squares change, so only the
+    squares whose signatures shifted beyond `CHANGE_THRESHOLD` (since
+    their probabilities were last computed) are run through the model
+    again; the other squares reuse their cached probabilities.
+
+    Everything is invalidated whenever the key (which identifies the
+    calibration and the model) changes.
+    """
+
+    def __init__(self):
+        """Initialize an empty instance of the `SquareProbabilityCache`."""
+        self.clear()
+
+    def clear(self):
+        """Forget the cached probabilities."""
+        self.key = None
+        self.signatures = None
+        self.probs = None
+        self.inferred_squares = None
+        """Squares run through the model by the last call."""
+        self.num_of_squares_inferred = 0
+        """Number of squares run through the model by the last call."""
+        self.known_squares = None
+        """Squares whose known probabilities were used by the last call."""
+
+    def obtain_probs(
+        self,
+        key,
+        signatures: np.ndarray,
+        piece_imgs: np.ndarray,
+        obtain_piece_probs,
+        burst_piece_imgs: np.ndarray | None = None,
+        known_probs: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Obtain the piece probabilities, re-running only changed squares.
+
+        :param key: Key identifying the calibration and the model.
+
+        :param signatures: `(64, k)` array of the current signatures.
+
+        :param piece_imgs: `(64, img_size, img_size, 3)` array of the
+            current preprocessed squares.
+
+        :param obtain_piece_probs: Image-to-prob function.
+
+            This function takes as input an `(n, img_size, img_size, 3)`
+            array of preprocessed squares and returns an `(n, 13)` array
+            of the corresponding piece probabilities.
+
+        :param burst_piece_imgs: `(k, 64, img_size, img_size, 3)` array
+            of the preprocessed squares of `k` other frames of a burst.
+
+            If it is not `None`, the changed squares of all frames are
+            run through the model together and their probabilities are
+            averaged (see "frame_burst.py").
+
+        :param known_probs: `(64, 13)` array of the piece probabilities
+            that are known without the model (e.g., from
+            "occupancy.py"), with rows of `np.nan` for the other
+            squares.
+
+            The changed squares whose probabilities are known are not
+            run through the model. Since their probabilities are not the
+            model's, they count as changed at the next call again.
+
+        :return: `(64, 13)` array of the piece probabilities.
+        """
+        if key != self.key or self.probs is None:
+            changed_squares = np.ones(len(piece_imgs), dtype=bool)
+        else:
+            changed_squares = find_changed_squares(signatures, self.signatures)
+
+        known_squares = np.zeros(len(piece_imgs), dtype=bool)
+        if known_probs is not None:
+            known_squares = changed_squares & ~np.isnan(known_probs[:, 0])
+        inferred_squares = changed_squares & ~known_squares
+        self.known_squares = known_squares
+
+        self.inferred_squares = inferred_squares
+        self.num_of_squares_inferred = int(inferred_squares.sum())
+        if inferred_squares.all():
+            self.probs = np.array(
+                average_piece_probs(
+                    obtain_piece_probs, piece_imgs, burst_piece_imgs
+                )
+            )
+            self.signatures = signatures.copy()
+        else:
+            if changed_squares.all():
+                self.probs = np.empty(known_probs.shape)
+                self.signatures = signatures.copy()
+            if inferred_squares.any():
+                self.probs[inferred_squares] = average_piece_probs(
+                    obtain_piece_probs,
+                    piece_imgs[inferred_squares],
+                    (
+                        None
+                        if burst_piece_imgs is None
+                        else burst_piece_imgs[:, inferred_squares]
+                    ),
+                )
+                self.signatures[inferred_squares] = signatures[
+                    inferred_squares
+                ]
+            if known_squares.any():
+                self.probs[known_squares] = known_probs[known_squares]
+                self.signatures[known_squares] = np.inf
+        self.key = key
+        return self.probs.copy()
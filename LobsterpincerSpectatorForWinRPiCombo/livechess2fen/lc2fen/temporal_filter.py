@@ -0,0 +1,292 @@
+"""This module is responsible for filtering piece probabilities over time.
+
+Each board update is predicted from a single frame, so glare or a shadow
+on one frame can make the chess-piece CNN misread a square. The
+`SquareBeliefFilter` fuses the piece probabilities of consecutive frames
+with a per-square recursive Bayesian filter (a hidden Markov model whose
+hidden state is the content of the square):
+
+1) Prediction: the belief about a square carries over from the previous
+frame, except that, with probability `CHANGE_PROB`, the square changes
+the way the legal moves from the last accepted position would change it
+(see `compute_change_prior()`), and, with probability `NOISE_PROB`, the
+square may hold anything (so that a wrong belief can be recovered from).
+
+2) Update: the predicted belief is multiplied by the piece probabilities
+of the current frame (which serve as the likelihood, except that, with
+probability `OUTLIER_PROB`, the CNN is assumed to output anything) and
+normalized.
+
+A square that no legal move changes thus keeps its content unless
+several frames agree otherwise, whereas the squares changed by a legal
+move switch as soon as the CNN sees the move.
+
+Only the squares actually run through the CNN on the current frame are
+filtered: the probabilities of the other squares are cached from an
+earlier frame (see "square_signatures.py"), which they look the same as,
+so they carry no new information and the beliefs about those squares
+carry over unchanged.
+"""
+
+import numpy as np
+import chess
+
+from livechess2fen.lc2fen.fen import (
+    ROTATIONS_FROM_STANDARD_VIEW,
+    rotate_to_standard_view,
+)
+from livechess2fen.lc2fen.decode_move import changed_squares_of_move
+
+
+CHANGE_PROB = 0.5
+"""Probability that a square changes as a legal move would change it.
+
+This only applies to the squares that some legal move from the last
+accepted position changes; the other squares are assumed not to change.
+"""
+
+NOISE_PROB = 1e-3
+"""Probability that a square holds anything, regardless of the belief."""
+
+OUTLIER_PROB = 0.05
+"""Probability that the CNN output of a square is unrelated to its content.
+
+This bounds how much a single frame (e.g., one with glare over a square)
+can shift the belief.
+"""
+
+
+def compute_change_prior(
+    previous_fen: str | None, board: chess.Board | None = None
+) -> np.ndarray:
+    """Compute what each square turns into when a legal move changes it.
+
+    :param previous_fen: FEN string of the previous board position.
+
+        If it is `None`, every square may turn into anything.
+
+    :param board: Previous board position.
+
+        If it is `None`, the board is set up from `previous_fen` (with no
+        castling rights and no en-passant square), and since whose turn
+        it is is then unknown, the legal moves of both sides are
+        considered.
+
+    :return: `(64, 13)` array in FEN-notation order whose rows are the
+    distributions of the piece codes (see `PIECES` in "fen.py") a square
+    holds after the legal moves that change it (a row is all zeros if no
+    legal move changes the square).
+    """
+    if previous_fen is None:
+        return np.full((64, 13), 1 / 13)
+    if board is None:
+        board = chess.Board(previous_fen)
+        turns = (chess.WHITE, chess.BLACK)
+    else:
+        turns = (board.turn,)
+
+    counts = np.zeros((64, 13))
+    for turn in turns:
+        position = board.copy(stack=False)
+        position.turn = turn
+        for move in position.legal_moves:
+            for square, code in changed_squares_of_move(position, move):
+                counts[square, code] += 1
+    totals = counts.sum(axis=1, keepdims=True)
+    return np.divide(
+        counts, totals, out=np.zeros_like(counts), where=totals > 0
+    )
+
+
+class SquareBeliefFilter:
+    """Beliefs about the contents of the 64 squares, updated every frame.
+
+    The beliefs are kept in FEN-notation order, while the probabilities
+    passed to (and returned by) `update()` are in the order of the squares
+    of the input image, like the output of the CNN.
+
+    Everything is invalidated whenever the key (which identifies the
+    calibration and the model) changes.
+    """
+
+    def __init__(self):
+        """Initialize an empty instance of the `SquareBeliefFilter`."""
+        self.clear()
+
+    def clear(self):
+        """Forget the beliefs."""
+        self.key = None
+        self.beliefs = None
+        self.position = None
+        """Previous position the cached change prior was computed for."""
+        self.change_prior = None
+
+    def update(
+        self,
+        key,
+        probs: np.ndarray,
+        a1_pos: str,
+        previous_fen: str | None = None,
+        board: chess.Board | None = None,
+        observed_squares: np.ndarray | None = None,
+    ) -> np.ndarray:
+        """Fuse the piece probabilities of a new frame into the beliefs.
+
+        :param key: Key identifying the calibration and the model.
+
+        :param probs: `(64, 13)` array of the piece probabilities of the
+            current frame.
+
+        :param a1_pos: Position of the a1 square (`"BL"`, `"BR"`,
+            `"TL"`, or `"TR"`) corresponding to `probs`.
+
+        :param previous_fen: FEN string of the last accepted position.
+
+        :param board: Last accepted position (see
+            `compute_change_prior()`).
+
+        :param observed_squares: Length-64 boolean array (in the same
+            order as `probs`) telling which squares were run through the
+            CNN on the current frame.
+
+            The beliefs about the other squares carry over unchanged
+            (unless there are no beliefs yet for `key`). If it is
+            `None`, all squares are fused.
+
+        :return: `(64, 13)` array of the filtered piece probabilities
+        (in the same order as `probs`).
+        """
+        likelihoods = rotate_to_standard_view(
+            np.asarray(probs, dtype=np.float64), a1_pos
+        )
+
+        position = board.fen() if board is not None else previous_fen
+        if self.change_prior is None or position != self.position:
+            self.change_prior = compute_change_prior(previous_fen, board)
+            self.position = position
+
+        if key != self.key or self.beliefs is None:
+            predicted = np.full((64, 13), 1 / 13)
+        else:
+            can_change = self.change_prior.any(axis=1, keepdims=True)
+            predicted = np.where(
+                can_change,
+                (1 - CHANGE_PROB) * self.beliefs
+                + CHANGE_PROB * self.change_prior,
+                self.beliefs,
+            )
+            predicted = (1 - NOISE_PROB) * predicted + NOISE_PROB / 13
+
+        likelihoods = (1 - OUTLIER_PROB) * likelihoods + OUTLIER_PROB / 13
+        beliefs = predicted * likelihoods
+        totals = beliefs.sum(axis=1, keepdims=True)
+        beliefs = np.where(totals > 0, beliefs / totals, predicted)
+        if (
+            observed_squares is not None
+            and key == self.key
+            and self.beliefs is not None
+        ):
+            observed_squares = rotate_to_standard_view(
+                observed_squares, a1_pos
+            )
+            beliefs = np.where(
+                observed_squares[:, np.newaxis], beliefs, self.beliefs
+            )
+        self.beliefs = beliefs
+        self.key = key
+        return self.beliefs[ROTATIONS_FROM_STANDARD_VIEW[a1_pos]]
+
+
+if __name__ == "__main__":
+    # Simulation of random games in which the CNN misreads every frame a
+    # little (and some frames have glare over a few squares); after each
+    # move, frames are processed until a move is decoded (see
+    # "decode_move.py") from either the raw or the filtered probabilities
+    # (at most `MAX_NUM_OF_FRAMES` frames)
+    import time
+
+    from livechess2fen.lc2fen.decode_move import decode_moves, MIN_MARGIN
+    from livechess2fen.lc2fen.fen import fen_to_codes
+
+    NUM_OF_GAMES = 20
+    NUM_OF_PLIES = 40
+    MAX_NUM_OF_FRAMES = 3
+    GLARE_PROB = 0.3
+
+    def simulate_frame(board: chess.Board, noise: float) -> np.ndarray:
+        """Return noisy piece probabilities of a board (in BL view)."""
+        logits = rng.normal(0, noise, (64, 13))
+        logits[np.arange(64), fen_to_codes(board.board_fen())] += 3
+        if rng.random() < GLARE_PROB:
+            glare_squares = rng.choice(64, rng.integers(1, 5), replace=False)
+            logits[glare_squares] = rng.normal(0, 3, (len(glare_squares), 13))
+        probs = np.exp(logits)
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    for noise in (1.0, 1.5):
+        rng = np.random.default_rng(0)
+        num_of_frames = {"raw": 0, "filtered": 0}
+        num_of_missed_moves = {"raw": 0, "filtered": 0}
+        num_of_wrong_moves = {"raw": 0, "filtered": 0}
+        num_of_moves = 0
+        num_of_updates = 0
+        filter_time = 0
+        for _ in range(NUM_OF_GAMES):
+            board = chess.Board()
+            belief_filter = SquareBeliefFilter()
+            belief_filter.update("key", simulate_frame(board, noise), "BL")
+            for _ in range(NUM_OF_PLIES):
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                move = moves[rng.integers(len(moves))]
+                previous_board = board.copy()
+                board.push(move)
+                num_of_moves += 1
+
+                done = {"raw": False, "filtered": False}
+                for frame_idx in range(MAX_NUM_OF_FRAMES):
+                    if all(done.values()):
+                        break
+                    probs = simulate_frame(board, noise)
+                    start_time = time.perf_counter()
+                    filtered_probs = belief_filter.update(
+                        "key",
+                        probs,
+                        "BL",
+                        previous_board.board_fen(),
+                        previous_board,
+                    )
+                    filter_time += time.perf_counter() - start_time
+                    num_of_updates += 1
+                    for mode, mode_probs in (
+                        ("raw", probs),
+                        ("filtered", filtered_probs),
+                    ):
+                        if done[mode]:
+                            continue
+                        decoded_moves, margin = decode_moves(
+                            previous_board, mode_probs
+                        )
+                        if decoded_moves and margin >= MIN_MARGIN:
+                            done[mode] = True
+                            num_of_frames[mode] += frame_idx + 1
+                            if decoded_moves != [move]:
+                                num_of_wrong_moves[mode] += 1
+                for mode in ("raw", "filtered"):
+                    if not done[mode]:
+                        num_of_frames[mode] += MAX_NUM_OF_FRAMES
+                        num_of_missed_moves[mode] += 1
+
+        print(f"\tNoise level {noise}:")
+        for mode in ("raw", "filtered"):
+            print(
+                f"\t\t{mode}: "
+                f"{num_of_frames[mode] / num_of_moves:.3f} frames per move, "
+                f"{num_of_missed_moves[mode]} of {num_of_moves} moves "
+                f"missed, and {num_of_wrong_moves[mode]} wrong moves"
+            )
+        print(
+            "\t\tFiltering took "
+            f"{filter_time / num_of_updates * 1000:.2f} ms per frame"
+        )
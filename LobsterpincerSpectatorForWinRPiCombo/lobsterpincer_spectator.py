@@ -22,9 +22,14 @@ import chess.pgn
 from lpspectator.initialize_main_program import initialize_lpspectator
 from lpspectator.capture_and_label_img import (
     visualize_slider_values_and_get_transformed_img,
+    get_transformed_img,
     save_slider_values,
+    obtain_frame_corners,
+    lock_perspective_transform,
+    unlock_perspective_transform,
 )
 from lpspectator.predict_fen import predict_fen_and_move
+from lpspectator.detect_motion import BoardMotionGate
 from lpspectator.configure_lcd_win import run_lcd_configuration_script_on_rpi
 from lpspectator.process_board import (
     print_legal_moves,
@@ -81,6 +86,19 @@ board, then this parameter should be set to
 perspective-transformed image has a size of 1200x1200).
 """
 
+EXTRACT_SQUARES_FROM_RAW_FRAME = True
+"""Parameter controlling whether to sample squares from the raw frame.
+
+When it is set to `True` and `BOARD_CORNERS` corresponds to manual
+chessboard detection (`[[0, 0], [1199, 0], [1199, 1199], [0, 1199]]`),
+the 64 squares fed to the neural-network model are sampled straight from
+the captured image using the slider values, which skips the full-board
+perspective-transformed image (and its extra interpolation passes).
+
+When it is set to `False`, or when `BOARD_CORNERS` is `None`, the
+squares are cut out of the perspective-transformed image instead.
+"""
+
 AUTO_PROMOTION_TO_QUEEN = True
 """Parameter controlling whether to assume pawn-into-queen promotions.
 
@@ -131,7 +149,47 @@ slider-value tuning."""
 TIME_BETWEEN_CONSECUTIVE_BOARD_UPDATES = (
     3  # This means we update the board every 3 seconds
 )
-"""Parameter determining board-update frequency."""
+"""Parameter determining board-update frequency.
+
+This parameter only applies when `MOTION_GATED_BOARD_UPDATES` is set to
+`False`.
+"""
+
+MOTION_GATED_BOARD_UPDATES = True
+"""Parameter controlling whether board updates are motion-gated.
+
+When it is set to `True`, the board is updated only once the
+perspective-transformed image has changed and then stayed still for
+`NUM_OF_STABLE_FRAMES_FOR_BOARD_UPDATE` consecutive frames (see
+"detect_motion.py"), so that no prediction is wasted while nothing
+happens or while a hand is over the board.
+
+When it is set to `False`, the board is updated every
+`TIME_BETWEEN_CONSECUTIVE_BOARD_UPDATES` seconds.
+"""
+
+NUM_OF_STABLE_FRAMES_FOR_BOARD_UPDATE = 5
+"""Number of still frames required before a motion-gated board update."""
+
+MAX_TIME_BETWEEN_CONSECUTIVE_BOARD_UPDATES = 15
+"""Parameter determining the fallback board-update frequency.
+
+When `MOTION_GATED_BOARD_UPDATES` is set to `True`, the board is still
+updated if it has been still for this many seconds since the last board
+update (which retries moves that were missed, e.g., because of a
+lighting change).
+"""
+
+NUM_OF_FRAMES_PER_BOARD_UPDATE = 3
+"""Number of consecutive frames captured for each board update.
+
+The frames that are much blurrier than the sharpest one are dropped and
+the piece probabilities are averaged over the others (see
+"frame_burst.py" in the "livechess2fen/lc2fen" folder), so that a single
+blurry frame costs a little more computation instead of a missed move.
+
+When it is set to `1`, each board update uses a single frame.
+"""
 
 
 if __name__ == "__main__":
@@ -152,6 +210,7 @@ if __name__ == "__main__":
         PRINT_BEST_MOVES_IN_TERMINAL,
         BOARD_CORNERS,
     )
+    motion_gate = BoardMotionGate(NUM_OF_STABLE_FRAMES_FOR_BOARD_UPDATE)
 
     while True:
         try:
@@ -176,14 +235,39 @@ if __name__ == "__main__":
                 print(
                     "Processing the current perspective-transformed image..."
                 )
+                motion_gate.set_reference(img_perspective_transformed)
+                burst_imgs = cap.read_burst(NUM_OF_FRAMES_PER_BOARD_UPDATE - 1)
                 try:
-                    fen, detected_move = predict_fen_and_move(
-                        img_perspective_transformed,
-                        A1_POS,
-                        BOARD_CORNERS,
-                        previous_fen,
-                        MUST_DETECT_MOVE,
-                    )
+                    if EXTRACT_SQUARES_FROM_RAW_FRAME and BOARD_CORNERS == [
+                        [0, 0],
+                        [1199, 0],
+                        [1199, 1199],
+                        [0, 1199],
+                    ]:
+                        fen, detected_move = predict_fen_and_move(
+                            img,
+                            A1_POS,
+                            BOARD_CORNERS,
+                            previous_fen,
+                            MUST_DETECT_MOVE,
+                            obtain_frame_corners(img),
+                            board,
+                            burst_imgs,
+                        )
+                    else:
+                        burst_imgs = [
+                            get_transformed_img(burst_img)
+                            for burst_img in burst_imgs
+                        ]
+                        fen, detected_move = predict_fen_and_move(
+                            img_perspective_transformed,
+                            A1_POS,
+                            BOARD_CORNERS,
+                            previous_fen,
+                            MUST_DETECT_MOVE,
+                            board=board,
+                            burst_imgs=burst_imgs,
+                        )
                 except:
                     print(
                         "\tFailed to detect the chessboard, so the FEN is not "
@@ -194,24 +278,40 @@ if __name__ == "__main__":
                     ready_for_fen = False
                     continue
 
-                if (
-                    detected_move is not None
-                    and len(detected_move) == 5
-                    and not detected_move[4] == "q"
-                    and AUTO_PROMOTION_TO_QUEEN
-                ):
-                    detected_move = detected_move[:4] + "q"
-                    print(
-                        "\tThe detected move in UCI notation is reset to "
-                        f"{detected_move} since `AUTO_PROMOTION_TO_QUEEN` is "
-                        "enabled"
-                    )
-
-                if (
-                    detected_move == None
-                    or chess.Move.from_uci(detected_move)
-                    not in board.legal_moves
-                ):
+                # Several moves are detected (separated by spaces) if both
+                # players moved since the last board update
+                detected_moves = (
+                    [] if detected_move is None else detected_move.split(" ")
+                )
+                for i, detected_move in enumerate(detected_moves):
+                    if (
+                        len(detected_move) == 5
+                        and not detected_move[4] == "q"
+                        and AUTO_PROMOTION_TO_QUEEN
+                    ):
+                        detected_moves[i] = detected_move[:4] + "q"
+                        print(
+                            "\tThe detected move in UCI notation is reset to "
+                            f"{detected_moves[i]} since "
+                            "`AUTO_PROMOTION_TO_QUEEN` is enabled"
+                        )
+                detected_moves = [
+                    chess.Move.from_uci(detected_move)
+                    for detected_move in detected_moves
+                ]
+
+                board_after_detected_moves = board.copy()
+                all_detected_moves_are_legal = len(detected_moves) > 0
+                for detected_move in detected_moves:
+                    if (
+                        detected_move
+                        not in board_after_detected_moves.legal_moves
+                    ):
+                        all_detected_moves_are_legal = False
+                        break
+                    board_after_detected_moves.push(detected_move)
+
+                if not all_detected_moves_are_legal:
                     print(
                         "\tNo legal move has been made, so the FEN is not "
                         "updated"
@@ -219,14 +319,24 @@ if __name__ == "__main__":
                     print_legal_moves(board)
                     last_time_of_board_update = time.time()
                 else:
-                    detected_move = chess.Move.from_uci(detected_move)
-                    detected_move_str = get_move_str(detected_move, board)
-                    run_lcd_configuration_script_on_rpi(detected_move_str)
-                    board.push(detected_move)
-                    if len(board.move_stack) == 1:
-                        node = game.add_variation(detected_move)
-                    else:
-                        node = node.add_variation(detected_move)
+                    if len(detected_moves) > 1:
+                        print(
+                            f"\t{len(detected_moves)} moves have been made "
+                            "since the last board update"
+                        )
+                    detected_move_strs = []
+                    for detected_move in detected_moves:
+                        detected_move_strs.append(
+                            get_move_str(detected_move, board)
+                        )
+                        board.push(detected_move)
+                        if len(board.move_stack) == 1:
+                            node = game.add_variation(detected_move)
+                        else:
+                            node = node.add_variation(detected_move)
+                    run_lcd_configuration_script_on_rpi(
+                        " ".join(detected_move_strs)
+                    )
                     pgn_str = save_current_pgn(
                         game, FULL_FEN_OF_STARTING_POSITION
                     )
@@ -248,10 +358,16 @@ if __name__ == "__main__":
 
                 ready_for_fen = False
 
-            else:
-                if (
-                    done_with_perspective_transform
-                    and time.time() - last_time_of_board_update
+            elif done_with_perspective_transform:
+                if MOTION_GATED_BOARD_UPDATES:
+                    if motion_gate.update(img_perspective_transformed) or (
+                        motion_gate.is_stable()
+                        and time.time() - last_time_of_board_update
+                        >= MAX_TIME_BETWEEN_CONSECUTIVE_BOARD_UPDATES
+                    ):
+                        ready_for_fen = True
+                elif (
+                    time.time() - last_time_of_board_update
                     >= TIME_BETWEEN_CONSECUTIVE_BOARD_UPDATES
                 ):
                     ready_for_fen = True
@@ -265,6 +381,7 @@ if __name__ == "__main__":
 
             if pressed_key == ord("r"):  # Get ready for FEN generation
                 save_slider_values()
+                lock_perspective_transform()
                 done_with_perspective_transform = True
                 ready_for_fen = True
                 print("\tThe slider values have been successfully saved!")
@@ -281,6 +398,8 @@ if __name__ == "__main__":
                 "p"
             ):  # Pause the program and redo the slider tuning
                 done_with_perspective_transform = False
+                unlock_perspective_transform()
+                motion_gate.reset()
                 print(
                     "The Lobsterpincer Specatator has been paused for "
                     "slider-value tuning..."
@@ -295,6 +414,8 @@ if __name__ == "__main__":
                 )
                 cv2.imwrite(f"{current_time}.png", img_perspective_transformed)
             if pressed_key == ord("q"):  # Quit the program
+                cap.print_statistics()
+                cap.release()
                 quit_lpspectator(engine, pgn_str, len(board.move_stack) >= 1)
                 break
 
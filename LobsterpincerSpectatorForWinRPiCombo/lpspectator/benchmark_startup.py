@@ -0,0 +1,91 @@
+"""This module is responsible for benchmarking the startup of the program.
+
+It imports the FEN-prediction module (which pulls in the whole
+board-prediction pipeline) in a fresh Python process, measures how long
+the import takes, and checks that TensorFlow/Keras were not imported
+when the ONNX backend is selected.
+
+Run this file directly (from either the main project directory or the
+"lpspectator" directory) to guard against startup-time regressions; it
+exits with a nonzero status if a check fails.
+"""
+
+import os
+import subprocess
+import sys
+
+
+MAX_IMPORT_TIME = 5
+"""Maximum acceptable import time (in seconds) of "predict_fen.py".
+
+Importing TensorFlow alone typically takes longer than this, so this
+threshold catches Keras/TensorFlow sneaking back into the import path.
+"""
+
+NUM_OF_RUNS = 3
+"""Number of fresh processes to time (the fastest run is reported)."""
+
+HEAVY_MODULES = ("tensorflow", "keras")
+"""Modules that must not be imported when the ONNX backend is selected."""
+
+ABS_PATH_OF_MAIN_PROJECT_FOLDER = os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))
+)
+"""Absolute path of "LobsterpincerSpectatorForWinRPiCombo" folder."""
+
+_IMPORT_SCRIPT = f"""
+import sys
+import time
+
+start_time = time.perf_counter()
+import lpspectator.predict_fen as predict_fen
+finish_time = time.perf_counter()
+
+print(finish_time - start_time)
+print(predict_fen.ACTIVATE_ONNX)
+print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+"""Script run in each fresh process to time the import."""
+
+
+def time_import() -> tuple[float, bool, list[str]]:
+    """Import "predict_fen.py" in a fresh process and time the import.
+
+    :return: Length-3 tuple formed by the import time (in seconds),
+    whether the ONNX backend is selected, and the list of heavy modules
+    (see `HEAVY_MODULES`) that were imported.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SCRIPT],
+        cwd=ABS_PATH_OF_MAIN_PROJECT_FOLDER,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()[-3:]
+    import_time = float(output[0])
+    onnx_activated = output[1] == "True"
+    heavy_modules_imported = [name for name in output[2].split(",") if name]
+    return import_time, onnx_activated, heavy_modules_imported
+
+
+if __name__ == "__main__":
+    results = [time_import() for _ in range(NUM_OF_RUNS)]
+    import_time = min(result[0] for result in results)
+    _, onnx_activated, heavy_modules_imported = results[-1]
+    print(f'\tImporting "predict_fen.py" took {import_time} s')
+
+    passed = True
+    if import_time > MAX_IMPORT_TIME:
+        print(f"\tFailed: the import took longer than {MAX_IMPORT_TIME} s")
+        passed = False
+    if onnx_activated and heavy_modules_imported:
+        print(
+            "\tFailed: the ONNX backend is selected but "
+            f"{', '.join(heavy_modules_imported)} got imported"
+        )
+        passed = False
+
+    if passed:
+        print("\tThe startup benchmark has passed!")
+    else:
+        sys.exit(1)
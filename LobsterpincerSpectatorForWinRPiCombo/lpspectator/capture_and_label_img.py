@@ -1,6 +1,8 @@
 """This module is responsible for capturing and labeling images."""
 
 import os
+import threading
+import time
 
 import cv2
 import numpy as np
@@ -13,15 +15,201 @@ IMAGE_SOURCE = "http://10.0.0.45:8080/video"
 # IMAGE_SOURCE = 0
 """Global variable specifying the image source."""
 
+_transform_locked = False
+"""Whether the slider values (and hence the transform) are locked.
 
-def start_camera() -> cv2.VideoCapture:
+While the sliders are being tuned, the perspective transform changes
+from frame to frame, so it is computed from scratch every time. Once the
+slider values are locked (see `lock_perspective_transform()`), the
+transform is cached as fixed-point remap tables instead.
+"""
+
+_remap_key = None
+"""Corner coordinates and image shape the cached remap tables belong to."""
+
+_remap_maps = None
+"""Cached `cv2.convertMaps()` remap tables of the perspective transform."""
+
+FIRST_FRAME_TIMEOUT = 10
+"""Maximum time (in seconds) to wait for the first frame of the stream.
+
+Network streams (e.g., MJPEG over HTTP) can take several seconds to
+deliver their first frame, which is much longer than the time between
+two frames once the stream is running.
+"""
+
+
+class LatestFrameGrabber:
+    """Background thread that keeps only the newest frame of a stream.
+
+    `cv2.VideoCapture` buffers decoded frames, so reading it only every
+    now and then (as the main program does) returns stale images. This
+    class keeps draining the stream in a daemon thread and hands out
+    only the newest decoded frame.
+
+    Its `read()` method returns the same pair as
+    `cv2.VideoCapture.read()`, but it only ever returns a frame once:
+    it blocks (for at most `read_timeout` seconds by default) until a
+    frame that has not been returned yet arrives.
+    """
+
+    def __init__(self, cap: cv2.VideoCapture, read_timeout: float = 2):
+        """Initialize an instance of the `LatestFrameGrabber`.
+
+        :param cap: Opened `cv2.VideoCapture` to drain.
+
+        :param read_timeout: Maximum time (in seconds) `read()` waits
+            for a new frame.
+        """
+        self.cap = cap
+        self.read_timeout = read_timeout
+        self.num_of_frames_decoded = 0
+        """Number of frames decoded since the grabber was started."""
+        self.num_of_frames_dropped = 0
+        """Number of decoded frames that were never read."""
+        self.total_decode_time = 0
+        """Total time (in seconds) spent decoding frames."""
+
+        self._frame = None
+        self._timestamp = None
+        self._frame_is_new = False
+        self._running = True
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._update, daemon=True)
+        self._thread.start()
+
+    def _update(self):
+        """Keep decoding frames until the grabber is released.
+
+        The stream is released by this thread once it stops, so that it
+        is never released while `grab()` or `retrieve()` is using it.
+        """
+        try:
+            while self._running:
+                ret = self.cap.grab()  # This waits for the next frame
+                start_time = time.time()
+                if ret:
+                    ret, frame = self.cap.retrieve()  # This decodes it
+                finish_time = time.time()
+                if not ret or frame is None:
+                    # The stream is (temporarily) unavailable
+                    time.sleep(0.01)
+                    continue
+
+                with self._condition:
+                    self.num_of_frames_decoded += 1
+                    self.total_decode_time += finish_time - start_time
+                    if self._frame_is_new:
+                        self.num_of_frames_dropped += 1
+                    self._frame = frame
+                    self._timestamp = finish_time
+                    self._frame_is_new = True
+                    self._condition.notify_all()
+        finally:
+            self.cap.release()
+
+    def read_with_timestamp(
+        self, timeout: float | None = None
+    ) -> tuple[np.ndarray | None, float | None]:
+        """Return the newest frame along with the time it was decoded.
+
+        This function blocks until a frame that has not been returned yet
+        arrives.
+
+        :param timeout: Maximum time (in seconds) to wait for the frame.
+
+            If it is `None`, `read_timeout` is used.
+
+        :return: Pair formed by the newest BGR frame and its timestamp
+        (as returned by `time.time()`), or `(None, None)` if no new
+        frame arrived in time.
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._frame_is_new,
+                self.read_timeout if timeout is None else timeout,
+            ):
+                return None, None
+            self._frame_is_new = False
+            return self._frame, self._timestamp
+
+    def read(
+        self, timeout: float | None = None
+    ) -> tuple[bool, np.ndarray | None]:
+        """Return the newest frame (like `cv2.VideoCapture.read()`).
+
+        Unlike `cv2.VideoCapture.read()`, this function does not return
+        immediately: it blocks until a new frame arrives (see
+        `read_with_timestamp()`).
+
+        :param timeout: Maximum time (in seconds) to wait for the frame.
+
+            If it is `None`, `read_timeout` is used.
+
+        :return: Pair formed by whether a new frame was obtained and the
+        newest BGR frame (or `None`).
+        """
+        frame, _ = self.read_with_timestamp(timeout)
+        return frame is not None, frame
+
+    def read_burst(self, num_of_frames: int) -> list[np.ndarray]:
+        """Return the next few frames of the stream.
+
+        Each frame is a new one (see `read_with_timestamp()`), so the
+        frames of a burst are consecutive decoded frames (unless frames
+        are dropped in between).
+
+        :param num_of_frames: Number of frames to wait for.
+
+        :return: List of the new BGR frames (shorter than
+        `num_of_frames` if the stream stalls).
+        """
+        frames = []
+        for _ in range(num_of_frames):
+            frame, _ = self.read_with_timestamp()
+            if frame is None:
+                break
+            frames.append(frame)
+        return frames
+
+    @property
+    def mean_decode_time(self) -> float:
+        """Average time (in seconds) spent decoding a frame."""
+        if self.num_of_frames_decoded == 0:
+            return 0
+        return self.total_decode_time / self.num_of_frames_decoded
+
+    def print_statistics(self):
+        """Print the dropped-frame and decode-time counters."""
+        print(
+            f"\t{self.num_of_frames_decoded} frames decoded, "
+            f"{self.num_of_frames_dropped} frames dropped, "
+            f"{self.mean_decode_time * 1000:.1f} ms per decode on average"
+        )
+
+    def release(self):
+        """Stop the background thread and release the stream.
+
+        This function waits (at most `read_timeout` seconds) for the
+        thread to stop. If the thread is still blocked on the stream by
+        then, it releases the stream itself as soon as it stops.
+        """
+        self._running = False
+        self._thread.join(timeout=self.read_timeout)
+
+
+def start_camera() -> LatestFrameGrabber:
     """Start the camera, create the windows, and initialize the sliders.
 
     :return: Variable `cap` that can be used to capture images.
+
+        Its `read()` method waits for and returns the newest frame of
+        the stream (see `LatestFrameGrabber`).
     """
     cap = cv2.VideoCapture(IMAGE_SOURCE)
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 3264)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1836)
+    cap = LatestFrameGrabber(cap)
 
     cv2.namedWindow("Trackbar window", cv2.WINDOW_NORMAL)
 
@@ -49,10 +237,10 @@ def start_camera() -> cv2.VideoCapture:
     return cap
 
 
-def draw_circles_and_obtain_coordinates(
+def obtain_coordinates(
     img: np.ndarray,
 ) -> tuple[int, int, int, int, int, int, int, int]:
-    """Draw circles on the input image and return their coordinates.
+    """Obtain the coordinates specified by the slider values.
 
     :param img: Input BGR image.
 
@@ -63,10 +251,8 @@ def draw_circles_and_obtain_coordinates(
         circle, the third are those of the bottom-left circle, and the
         fourth are those of the bottom-right circle.
     """
-    img_copy = img.copy()
-
-    width = img_copy.shape[1]
-    height = img_copy.shape[0]
+    width = img.shape[1]
+    height = img.shape[0]
 
     x_TL = int(
         np.round(width * cv2.getTrackbarPos("x_TL", "Trackbar window") / 1000)
@@ -92,6 +278,43 @@ def draw_circles_and_obtain_coordinates(
     y_BR = int(
         np.round(height * cv2.getTrackbarPos("y_BR", "Trackbar window") / 1000)
     )
+
+    return x_TL, y_TL, x_TR, y_TR, x_BL, y_BL, x_BR, y_BR
+
+
+def obtain_frame_corners(img: np.ndarray) -> list[list[int]]:
+    """Obtain the coordinates of the board corners in the input image.
+
+    :param img: Input BGR image.
+
+    :return: Length-4 list of coordinates of four corners.
+
+        The 4 board corners are in the order of top left, top right,
+        bottom right, and bottom left (the order used by the
+        `board_corners` and `frame_corners` parameters of
+        `predict_fen_and_move()`).
+    """
+    x_TL, y_TL, x_TR, y_TR, x_BL, y_BL, x_BR, y_BR = obtain_coordinates(img)
+    return [[x_TL, y_TL], [x_TR, y_TR], [x_BR, y_BR], [x_BL, y_BL]]
+
+
+def draw_circles_and_obtain_coordinates(
+    img: np.ndarray,
+) -> tuple[int, int, int, int, int, int, int, int]:
+    """Draw circles on the input image and return their coordinates.
+
+    :param img: Input BGR image.
+
+    :return: Eight integers representing the coordinates of the circles.
+
+        The first two integers are the x- and y-coordinates of the
+        top-left circle, the second two are those of the top-right
+        circle, the third are those of the bottom-left circle, and the
+        fourth are those of the bottom-right circle.
+    """
+    img_copy = img.copy()
+
+    x_TL, y_TL, x_TR, y_TR, x_BL, y_BL, x_BR, y_BR = obtain_coordinates(img)
     img_circles = cv2.circle(img_copy, (x_TL, y_TL), 20, (255, 0, 0), -1)
     img_circles = cv2.circle(img_copy, (x_TR, y_TR), 20, (255, 0, 0), -1)
     img_circles = cv2.circle(img_copy, (x_BL, y_BL), 20, (255, 0, 0), -1)
@@ -102,6 +325,80 @@ def draw_circles_and_obtain_coordinates(
     return x_TL, y_TL, x_TR, y_TR, x_BL, y_BL, x_BR, y_BR
 
 
+def lock_perspective_transform():
+    """Lock the perspective transform once the slider values are saved.
+
+    From then on, `perspective_transform()` caches the transform as
+    fixed-point remap tables (built from the first frame it receives)
+    and applies it with the cheaper `cv2.remap()`.
+    """
+    global _transform_locked
+    _transform_locked = True
+
+
+def unlock_perspective_transform():
+    """Unlock the perspective transform and drop the cached remap tables.
+
+    This function should be called whenever slider-value tuning is
+    reopened.
+    """
+    global _transform_locked, _remap_key, _remap_maps
+    _transform_locked = False
+    _remap_key = None
+    _remap_maps = None
+
+
+def _build_remap_maps(
+    M: np.ndarray, size: int = 1200
+) -> tuple[np.ndarray, np.ndarray]:
+    """Build the fixed-point remap tables of a perspective transform.
+
+    :param M: 3x3 perspective-transform matrix (from the input image to
+        the perspective-transformed image).
+
+    :param size: Size of the perspective-transformed image.
+
+    :return: Pair of remap tables to pass to `cv2.remap()`.
+    """
+    M_inv = np.linalg.inv(M)
+    x, y = np.meshgrid(np.arange(size), np.arange(size))
+    w = M_inv[2, 0] * x + M_inv[2, 1] * y + M_inv[2, 2]
+    map_x = (M_inv[0, 0] * x + M_inv[0, 1] * y + M_inv[0, 2]) / w
+    map_y = (M_inv[1, 0] * x + M_inv[1, 1] * y + M_inv[1, 2]) / w
+    return cv2.convertMaps(
+        map_x.astype(np.float32), map_y.astype(np.float32), cv2.CV_16SC2
+    )
+
+
+def _remap_with_cached_maps(
+    img: np.ndarray, coordinates: tuple[int, int, int, int, int, int, int, int]
+) -> np.ndarray:
+    """Perform a perspective transform with the cached remap tables.
+
+    The remap tables are rebuilt only if the corner coordinates or the
+    image shape change.
+
+    :param img: Input BGR image.
+
+    :param coordinates: Eight integers representing the coordinates of
+        the corners (in the order returned by `obtain_coordinates()`).
+
+    :return: Perspective-transformed BGR image.
+    """
+    global _remap_key, _remap_maps
+    key = (*coordinates, img.shape)
+    if key != _remap_key:
+        x_TL, y_TL, x_TR, y_TR, x_BL, y_BL, x_BR, y_BR = coordinates
+        pts1 = np.float32(
+            [[x_TL, y_TL], [x_TR, y_TR], [x_BL, y_BL], [x_BR, y_BR]]
+        )
+        pts2 = np.float32([[0, 0], [1199, 0], [0, 1199], [1199, 1199]])
+        M = cv2.getPerspectiveTransform(pts1, pts2)
+        _remap_maps = _build_remap_maps(M)
+        _remap_key = key
+    return cv2.remap(img, _remap_maps[0], _remap_maps[1], cv2.INTER_LINEAR)
+
+
 def perspective_transform(
     img: np.ndarray,
     x_TL: int,
@@ -119,6 +416,11 @@ def perspective_transform(
     This function performs a perspective transform on the input image,
     plots the transformed image, and returns the transformed image.
 
+    If the perspective transform is locked (see
+    `lock_perspective_transform()`), the transform is applied with
+    cached remap tables, which are rebuilt only if the corner
+    coordinates or the image shape change.
+
     :param img: Input BGR image.
 
     :param x_TL: X-coordinate of the top-left corner.
@@ -141,10 +443,17 @@ def perspective_transform(
 
     :return: Perspective-transformed BGR image.
     """
-    pts1 = np.float32([[x_TL, y_TL], [x_TR, y_TR], [x_BL, y_BL], [x_BR, y_BR]])
-    pts2 = np.float32([[0, 0], [1199, 0], [0, 1199], [1199, 1199]])
-    M = cv2.getPerspectiveTransform(pts1, pts2)
-    img_perspective_transformed = cv2.warpPerspective(img, M, (1200, 1200))
+    if _transform_locked:
+        img_perspective_transformed = _remap_with_cached_maps(
+            img, (x_TL, y_TL, x_TR, y_TR, x_BL, y_BL, x_BR, y_BR)
+        )
+    else:
+        pts1 = np.float32(
+            [[x_TL, y_TL], [x_TR, y_TR], [x_BL, y_BL], [x_BR, y_BR]]
+        )
+        pts2 = np.float32([[0, 0], [1199, 0], [0, 1199], [1199, 1199]])
+        M = cv2.getPerspectiveTransform(pts1, pts2)
+        img_perspective_transformed = cv2.warpPerspective(img, M, (1200, 1200))
     img_perspective_transformed_resized = cv2.resize(
         img_perspective_transformed, (400, 400)
     )
@@ -183,6 +492,22 @@ def visualize_slider_values_and_get_transformed_img(
     )
 
 
+def get_transformed_img(img: np.ndarray) -> np.ndarray:
+    """Obtain the perspective-transformed image without visualizing it.
+
+    Unlike `visualize_slider_values_and_get_transformed_img()`, this
+    function neither draws nor shows anything, and it always applies the
+    transform with the cached remap tables (which are shared with the
+    locked `perspective_transform()`), so it is meant for extra frames
+    of the same stream (e.g., the other frames of a burst).
+
+    :param img: Input BGR image.
+
+    :return: Perspective-transformed BGR image.
+    """
+    return _remap_with_cached_maps(img, obtain_coordinates(img))
+
+
 def save_slider_values():
     """Save the slider values."""
     slider_values = np.int16([cv2.getTrackbarPos("x_TL", "Trackbar window")])
@@ -4,6 +4,8 @@ Note: the LCD screen is assumed to be able to display at most two lines
 of text with each line having a maximum of 16 characters.
 """
 
+import re
+
 import RPi.GPIO as GPIO
 
 from RPLCD import CharLCD
@@ -75,8 +77,22 @@ def display_last_move_on_lcd_screen(lcd: CharLCD, last_move_san: str):
         (as in `"1. d4"`, which says white played d4 on the first move).
         Another example of the latter format is `"1... Nf6"`, which says
         black played Nf6 on the first move.
+
+        If several moves have been made since the last board update,
+        they are separated by spaces (as in `"1. e4 1... e5"`). If they
+        do not fit on one line, the last two moves are displayed on one
+        line each.
     """
-    first_line = generate_full_line_string("Last move:")
+    moves = re.findall(r"\d+\.+ \S+|\S+", last_move_san)
+    if len(moves) > 1 and len(last_move_san) > 16:
+        first_line = generate_full_line_string(moves[-2])
+        second_line = generate_full_line_string(moves[-1])
+        display_text_on_lcd_screen(lcd, first_line + second_line)
+        return
+
+    first_line = generate_full_line_string(
+        "Last move:" if len(moves) == 1 else "Last moves:"
+    )
     second_line = generate_full_line_string(last_move_san)
     text_to_display = first_line + second_line
     display_text_on_lcd_screen(lcd, text_to_display)
@@ -97,12 +113,7 @@ if __name__ == "__main__":
 
     lcd = set_up_lcd()
 
-    if len(sys.argv) == 2:
-        last_move_san = sys.argv[1]
-
-        display_last_move_on_lcd_screen(lcd, last_move_san)
-
-    elif len(sys.argv) == 3:
-        last_move_san = sys.argv[1] + " " + sys.argv[2]
+    if len(sys.argv) >= 2:
+        last_move_san = " ".join(sys.argv[1:])
 
         display_last_move_on_lcd_screen(lcd, last_move_san)
@@ -35,6 +35,9 @@ def run_lcd_configuration_script_on_rpi(last_move_san: str):
         Another example of the latter format is `"1... Nf6"`, which says
         black played Nf6 on the first move.
 
+        If several moves have been made since the last board update,
+        they are separated by spaces (as in `"1. e4 1... e5"`).
+
         If `None`, the LCD will simply be initialized and show nothing
         on the screen.
     """
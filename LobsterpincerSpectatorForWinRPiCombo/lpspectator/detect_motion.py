@@ -0,0 +1,156 @@
+"""This module is responsible for detecting changes on the chessboard.
+
+Running the full FEN prediction (and the engine) on a fixed timer wastes
+work while nothing happens and often fires while a hand is over the
+board. The gate in this module compares cheap, downscaled grayscale
+versions of consecutive perspective-transformed images instead, and only
+asks for a board update once the board has changed and then stayed
+still for a few frames.
+"""
+
+import cv2
+import numpy as np
+
+
+class BoardMotionGate:
+    """Frame-differencing gate deciding when to update the board.
+
+    Each perspective-transformed image is shrunk to a small grayscale
+    image and compared square by square (the comparison uses the largest
+    per-square mean absolute difference, so that a single moved piece is
+    not averaged away over the 64 squares):
+
+    - against the previous image, to tell whether something is moving
+      (e.g., a hand over the board);
+
+    - against the reference image (the image of the last board update),
+      to tell whether the board has changed.
+
+    `update()` returns `True` when the board has changed and then been
+    stable for `num_of_stable_frames` consecutive frames.
+    """
+
+    def __init__(
+        self,
+        num_of_stable_frames: int = 5,
+        motion_threshold: float = 6,
+        change_threshold: float = 10,
+        size: int = 64,
+    ):
+        """Initialize an instance of the `BoardMotionGate`.
+
+        :param num_of_stable_frames: Number of consecutive still frames
+            required before a change triggers a board update.
+
+        :param motion_threshold: Per-square mean absolute difference (in
+            gray levels) between consecutive frames above which the board
+            is considered to be moving.
+
+        :param change_threshold: Per-square mean absolute difference (in
+            gray levels) from the reference image above which the board
+            is considered to have changed.
+
+        :param size: Size of the downscaled image (a multiple of 8).
+        """
+        assert size % 8 == 0
+        self.num_of_stable_frames = num_of_stable_frames
+        self.motion_threshold = motion_threshold
+        self.change_threshold = change_threshold
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        """Forget the previous and reference images."""
+        self._previous = None
+        self._reference = None
+        self._stable_count = 0
+
+    def _shrink(self, board_img: np.ndarray) -> np.ndarray:
+        """Downscale a BGR board image to a small grayscale image.
+
+        :param board_img: Perspective-transformed BGR image.
+
+        :return: `(size, size)` float32 grayscale image.
+        """
+        gray = cv2.cvtColor(board_img, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(
+            gray, (self.size, self.size), interpolation=cv2.INTER_AREA
+        )
+        return small.astype(np.float32)
+
+    def _max_square_diff(self, img1: np.ndarray, img2: np.ndarray) -> float:
+        """Return the largest per-square mean absolute difference.
+
+        :param img1: Downscaled grayscale image.
+
+        :param img2: Downscaled grayscale image.
+
+        :return: Largest mean absolute difference over the 64 squares.
+        """
+        square_size = self.size // 8
+        diff = np.abs(img1 - img2).reshape(8, square_size, 8, square_size)
+        return float(diff.mean(axis=(1, 3)).max())
+
+    def update(self, board_img: np.ndarray) -> bool:
+        """Feed a new frame to the gate.
+
+        :param board_img: Perspective-transformed BGR image.
+
+        :return: Whether the board should be updated now, i.e., whether
+        the board differs from the reference image and has been stable
+        for `num_of_stable_frames` frames (if there is no reference
+        image yet, stability alone is enough).
+        """
+        small = self._shrink(board_img)
+        if (
+            self._previous is not None
+            and self._max_square_diff(small, self._previous)
+            > self.motion_threshold
+        ):
+            self._stable_count = 0
+        else:
+            self._stable_count += 1
+        self._previous = small
+
+        if not self.is_stable():
+            return False
+        if self._reference is None:
+            return True
+        return (
+            self._max_square_diff(small, self._reference)
+            > self.change_threshold
+        )
+
+    def is_stable(self) -> bool:
+        """Return whether the board has been still for long enough."""
+        return self._stable_count >= self.num_of_stable_frames
+
+    def set_reference(self, board_img: np.ndarray):
+        """Set the image the next changes are measured against.
+
+        This function should be called with the image used for every
+        board update.
+
+        :param board_img: Perspective-transformed BGR image.
+        """
+        self._reference = self._shrink(board_img)
+
+
+if __name__ == "__main__":
+    # Note: make sure to switch to the "lpspectator" directory in the
+    # terminal (`cd .\lpspectator\`) before running this file directly
+    import time
+
+    before_img = cv2.imread("..\\Test Images\\before_0-0-0_by_black.png")
+    after_img = cv2.imread("..\\Test Images\\after_0-0-0_by_black.png")
+    hand_img = before_img.copy()
+    hand_img[300:900, 200:700] = (140, 170, 210)  # A "hand" over the board
+
+    gate = BoardMotionGate(num_of_stable_frames=3)
+    gate.set_reference(before_img)
+    frames = [before_img] * 3 + [hand_img] * 3 + [after_img] * 4
+    start_time = time.time()
+    decisions = [gate.update(frame) for frame in frames]
+    finish_time = time.time()
+    print(f"\tDecisions: {decisions}")
+    print(f"\tEach update took {(finish_time - start_time) / len(frames)} s")
@@ -29,7 +29,11 @@ from lpspectator.visualize_fen import (
     add_evaluation_bar_to_plot,
 )
 from lpspectator.play_audio import play_critical_moment_audio
-from lpspectator.capture_and_label_img import start_camera
+from lpspectator.capture_and_label_img import (
+    FIRST_FRAME_TIMEOUT,
+    start_camera,
+)
+from lpspectator.predict_fen import warm_up_piece_model
 from lpspectator.configure_led_win import run_led_configuration_script_on_rpi
 from lpspectator.configure_lcd_win import run_lcd_configuration_script_on_rpi
 from lpspectator.utilities import (
@@ -79,6 +83,18 @@ def initialize_lpspectator(
         sys.exit()
     print("\tStockfish engine has been successfully initialized!")
 
+    try:
+        warm_up_piece_model()
+    except Exception:
+        print("\tFailed to load the chess-piece model")
+        print(
+            "\t\tPlease make sure the selected model is in the "
+            '"livechess2fen/selected_models" folder and rerun the program'
+        )
+        quit_engine(engine)
+        sys.exit()
+    print("\tChess-piece model has been successfully loaded!")
+
     board = chess.Board(full_fen_of_starting_position)
     if board.is_checkmate() or board.is_stalemate():
         print(
@@ -117,7 +133,7 @@ def initialize_lpspectator(
     print("\tBoard has been successfully initialized!")
 
     cap = start_camera()
-    _, previous_img = cap.read()
+    _, previous_img = cap.read(timeout=FIRST_FRAME_TIMEOUT)
     if previous_img is None:
         print("\tFailed to initialize the camera")
         print(
@@ -2,19 +2,18 @@
 
 import numpy as np
 import cv2
-import os
-
-os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
-from keras.applications.imagenet_utils import (
-    preprocess_input as prein_squeezenet1p1,
-)
+import chess
 
 try:
     from livechess2fen.lc2fen.predict_board import (
         predict_board_keras,
         predict_board_onnx,
     )
-    from lpspectator.utilities import delete
+    from livechess2fen.lc2fen.model_registry import (
+        warm_up_model,
+        release_model,
+    )
+    from livechess2fen.lc2fen.preprocess_squares import SquarePreprocessor
 except (
     ModuleNotFoundError
 ):  # This happens when we run this file from the "lpspectator" directory
@@ -26,7 +25,11 @@ except (
             predict_board_keras,
             predict_board_onnx,
         )
-        from lpspectator.utilities import delete
+        from livechess2fen.lc2fen.model_registry import (
+            warm_up_model,
+            release_model,
+        )
+        from livechess2fen.lc2fen.preprocess_squares import SquarePreprocessor
     except ModuleNotFoundError:
         print(
             "Please make sure to set your terminal's directory to "
@@ -38,12 +41,42 @@ except (
 ACTIVATE_KERAS = False
 MODEL_PATH_KERAS = "livechess2fen\\selected_models\\SqueezeNet1p1_all_last.h5"
 IMG_SIZE_KERAS = 227
-PRE_INPUT_KERAS = prein_squeezenet1p1
+PRE_INPUT_KERAS = SquarePreprocessor(IMG_SIZE_KERAS)
+BATCH_SIZE_KERAS = 64
 
 ACTIVATE_ONNX = True
 MODEL_PATH_ONNX = "livechess2fen\\selected_models\\SqueezeNet1p1_all_last.onnx"
 IMG_SIZE_ONNX = 227
-PRE_INPUT_ONNX = prein_squeezenet1p1
+PRE_INPUT_ONNX = SquarePreprocessor(IMG_SIZE_ONNX)
+BATCH_SIZE_ONNX = 64  # Lower this (e.g., to 8) on low-memory devices
+
+PIECE_ASSIGNMENT = "greedy"  # Or "optimal" (slower but more robust)
+
+TEMPORAL_FILTERING = False  # Whether to fuse probabilities across frames
+
+PRE_CLASSIFICATION = False  # Whether to skip the CNN on clear-cut squares
+
+
+def warm_up_piece_model():
+    """Load the activated chess-piece model and run it once.
+
+    This function keeps the model-loading cost out of the first board
+    update (the model then stays loaded until `release_piece_model()` is
+    called).
+    """
+    assert ACTIVATE_KERAS != ACTIVATE_ONNX
+    if ACTIVATE_KERAS:
+        warm_up_model(MODEL_PATH_KERAS, "keras", IMG_SIZE_KERAS)
+    else:  # elif ACTIVATE_ONNX:
+        warm_up_model(MODEL_PATH_ONNX, "onnx", IMG_SIZE_ONNX)
+
+
+def release_piece_model():
+    """Release the activated chess-piece model."""
+    if ACTIVATE_KERAS:
+        release_model(MODEL_PATH_KERAS, "keras")
+    else:  # elif ACTIVATE_ONNX:
+        release_model(MODEL_PATH_ONNX, "onnx")
 
 
 def predict_fen_and_move(
@@ -52,6 +85,9 @@ def predict_fen_and_move(
     board_corners: list[list[int]] | None = None,
     previous_fen: str | None = None,
     must_detect_move: bool = False,
+    frame_corners: list[list[int]] | None = None,
+    board: chess.Board | None = None,
+    burst_imgs: list[np.ndarray] | None = None,
 ) -> tuple[str, str | None]:
     """Predict FEN of current position and move in previous position.
 
@@ -91,36 +127,74 @@ def predict_fen_and_move(
         This parameter only makes a difference if `previous_fen` is
         not `None`.
 
+    :param frame_corners: Coordinates of the board corners in the frame.
+
+        If it is not `None`, `img` is the raw camera frame (rather than
+        the perspective-transformed image) and these are the coordinates
+        of its four board corners (in the order of top left, top right,
+        bottom right, and bottom left). The 64 squares are then sampled
+        straight from the raw frame, which skips both board detection
+        and the full-board perspective transform.
+
+    :param board: Previous board position.
+
+        If it is not `None` (in which case its piece placement must be
+        `previous_fen`), the move is decoded among the legal moves of
+        this position (taking whose turn it is, the castling rights, and
+        the en-passant square into account). If both players moved
+        since the previous position, both moves are detected (see
+        `MAX_NUM_OF_PLIES` in "decode_move.py").
+
+    :param burst_imgs: Other BGR images of the same board, captured
+        right after `img` (and of the same kind as `img`).
+
+        If it is not empty, the blurry images are dropped and the piece
+        probabilities are averaged over the remaining ones (see
+        "frame_burst.py"), whose squares go through the model together.
+
     :return: Predicted current FEN and detected previous move.
+
+        If several moves were detected, they are separated by spaces in
+        the UCI string (e.g., `"e2e4 e7e5"`).
     """
     assert ACTIVATE_KERAS != ACTIVATE_ONNX
-    path = "_.png"
-    cv2.imwrite(path, img)
     if ACTIVATE_KERAS:
         fen, _, detected_move = predict_board_keras(
             MODEL_PATH_KERAS,
             IMG_SIZE_KERAS,
             PRE_INPUT_KERAS,
-            path,
+            img,
             a1_pos,
             board_corners,
             previous_fen,
             must_detect_move,
+            BATCH_SIZE_KERAS,
+            frame_corners,
+            board,
+            PIECE_ASSIGNMENT,
+            TEMPORAL_FILTERING,
+            burst_imgs,
+            PRE_CLASSIFICATION,
         )
     else:  # elif ACTIVATE_ONNX:
         fen, _, detected_move = predict_board_onnx(
             MODEL_PATH_ONNX,
             IMG_SIZE_ONNX,
             PRE_INPUT_ONNX,
-            path,
+            img,
             a1_pos,
             board_corners,
             previous_fen,
             must_detect_move,
+            BATCH_SIZE_ONNX,
+            frame_corners,
+            board,
+            PIECE_ASSIGNMENT,
+            TEMPORAL_FILTERING,
+            burst_imgs,
+            PRE_CLASSIFICATION,
         )
 
-    delete(path)
-
     return str(fen), detected_move
 
 
@@ -144,6 +218,11 @@ if (
     # must_detect_move = True
     must_detect_move = False
 
+    start_time = time.time()
+    warm_up_piece_model()
+    finish_time = time.time()
+    print(f"\tLoading the model took {finish_time - start_time} s")
+
     start_time = time.time()
     fen, detected_move = predict_fen_and_move(
         img, a1_pos, board_corners, previous_fen, must_detect_move
@@ -11,6 +11,7 @@ from time import sleep
 from lpspectator.capture_and_label_img import save_slider_values
 from lpspectator.evaluate_position import quit_engine
 from lpspectator.configure_led_win import run_led_configuration_script_on_rpi
+from lpspectator.predict_fen import release_piece_model
 from lpspectator.utilities import delete_all_powershell_scripts
 
 
@@ -30,6 +31,7 @@ def quit_lpspectator(
     save_slider_values()
     cv2.destroyAllWindows()
     quit_engine(engine)
+    release_piece_model()
     run_led_configuration_script_on_rpi(0, cleanup=True)
     sleep(2)
     delete_all_powershell_scripts()
@@ -0,0 +1,151 @@
+"""Tests of "decode_move.py".
+
+Note: run the tests from the "LobsterpincerSpectatorForWinRPiCombo"
+directory with `python -m pytest tests`.
+"""
+
+import chess
+import numpy as np
+import pytest
+
+from livechess2fen.lc2fen.decode_move import (
+    EXTRA_PLY_PENALTY,
+    MIN_MARGIN,
+    decode_moves,
+)
+from livechess2fen.lc2fen.fen import fen_to_codes, list_to_codes
+from livechess2fen.lc2fen.infer_pieces import infer_chess_pieces
+
+
+def one_hot_probs(fen: str) -> np.ndarray:
+    """Return the piece probabilities of a CNN that is never wrong.
+
+    :param fen: FEN string (piece placement only) the CNN sees.
+
+    :return: `(64, 13)` array of one-hot piece probabilities in
+    FEN-notation order.
+    """
+    return np.eye(13)[fen_to_codes(fen)]
+
+
+@pytest.mark.parametrize(
+    "fen, move_uci",
+    [
+        (  # Kingside castling
+            "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R "
+            "w KQkq - 4 4",
+            "e1g1",
+        ),
+        (  # Queenside castling
+            "r3kbnr/pppqpppp/2np4/8/3PP1b1/2N1BN2/PPP2PPP/R2BKQ1R "
+            "b kq - 0 1",
+            "e8c8",
+        ),
+        (  # En passant
+            "rnbqkbnr/ppp2ppp/4p3/3pP3/8/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 3",
+            "e5d6",
+        ),
+        ("1r5k/P7/8/8/8/8/8/K7 w - - 0 1", "a7a8q"),  # Promotion
+        (  # Under-promotion with capture
+            "1r5k/P7/8/8/8/8/8/K7 w - - 0 1",
+            "a7b8n",
+        ),
+    ],
+)
+def test_move_is_decoded(fen, move_uci):
+    """The move seen by the CNN is decoded with a confident margin."""
+    board = chess.Board(fen)
+    move = chess.Move.from_uci(move_uci)
+    board_after_move = board.copy()
+    board_after_move.push(move)
+
+    moves, margin = decode_moves(
+        board, one_hot_probs(board_after_move.board_fen())
+    )
+    assert moves == [move]
+    assert margin >= MIN_MARGIN
+
+
+def test_no_move_is_decoded_for_an_unchanged_board():
+    """The null hypothesis wins when nothing has changed."""
+    board = chess.Board()
+    moves, margin = decode_moves(board, one_hot_probs(board.board_fen()))
+    assert moves == []
+    assert margin >= MIN_MARGIN
+
+
+def test_ambiguous_move_is_rejected():
+    """A move the CNN is unsure about is not accepted."""
+    board = chess.Board()
+    board_after_move = board.copy()
+    board_after_move.push_uci("e2e4")
+    # The CNN cannot tell the position before the move from the one
+    # after it
+    probs = (
+        one_hot_probs(board.board_fen())
+        + one_hot_probs(board_after_move.board_fen())
+    ) / 2
+
+    _, margin = decode_moves(board, probs)
+    assert margin < MIN_MARGIN
+
+    piece_list, move_uci = infer_chess_pieces(
+        probs,
+        "BL",
+        previous_fen=board.board_fen(),
+        must_detect_move=True,
+        board=board,
+    )
+    assert move_uci is None
+    assert list_to_codes(piece_list).tolist() == (
+        fen_to_codes(board.board_fen()).tolist()
+    )
+
+
+def spread_probs(fen: str, prob: float) -> np.ndarray:
+    """Return the piece probabilities of an unsure (but right) CNN.
+
+    :param fen: FEN string (piece placement only) the CNN sees.
+
+    :param prob: Probability given to the true piece of each square.
+
+        The rest of the probability is spread evenly over the other 12
+        pieces.
+
+    :return: `(64, 13)` array of piece probabilities in FEN-notation
+    order.
+    """
+    probs = np.full((64, 13), (1 - prob) / 12)
+    probs[np.arange(64), fen_to_codes(fen)] = prob
+    return probs
+
+
+@pytest.mark.parametrize("moves_uci", ["e2e4 e7e5", "g1f3 g8f6"])
+@pytest.mark.parametrize("prob", [1, 0.5])
+def test_two_moves_are_decoded(moves_uci, prob):
+    """Both moves are recovered when both players moved."""
+    board = chess.Board()
+    board_after_moves = board.copy()
+    for move_uci in moves_uci.split(" "):
+        board_after_moves.push_uci(move_uci)
+
+    moves, margin = decode_moves(
+        board, spread_probs(board_after_moves.board_fen(), prob)
+    )
+    assert " ".join(move.uci() for move in moves) == moves_uci
+    assert margin >= MIN_MARGIN
+
+
+def test_two_move_margin():
+    """The extra move adds its log-likelihood gain minus the penalty."""
+    board = chess.Board()
+    board_after_moves = board.copy()
+    board_after_moves.push_uci("e2e4")
+    board_after_moves.push_uci("e7e5")
+
+    # Each of the 2 squares changed by the second move adds log(12) to
+    # the margin over the first move alone
+    _, margin = decode_moves(
+        board, spread_probs(board_after_moves.board_fen(), 0.5)
+    )
+    assert margin == pytest.approx(2 * np.log(12) - EXTRA_PLY_PENALTY)
@@ -0,0 +1,1002 @@
+"""Tests of "infer_pieces.py".
+
+The vectorized `_infer_pieces_greedily()` is checked against the
+original one-piece-at-a-time implementation, and the move-geometry
+tables are checked against the original `_is_*_move()` helpers; both
+are kept here as the reference.
+
+Note: run the tests from the "LobsterpincerSpectatorForWinRPiCombo"
+directory with `python -m pytest tests`.
+"""
+
+import contextlib
+import io
+
+import chess
+import numpy as np
+import pytest
+
+from livechess2fen.lc2fen.fen import (
+    codes_to_list,
+    fen_to_codes,
+    is_light_square,
+)
+from livechess2fen.lc2fen.infer_pieces import (
+    _CASTLING_MOVES,
+    _IDX_TO_PIECE,
+    _IDX_TO_PIECE_FULL,
+    _MOVE_GEOMETRY,
+    _PAWN_MOVES,
+    _PIECE_TO_IDX,
+    _PIECE_TO_IDX_FULL,
+    _complete_prediction_by_brute_force,
+    _detect_move,
+    _determine_changed_squares,
+    _infer_pieces_greedily,
+    _is_empty_square,
+    _print_unbalanced_prediction_warning,
+    infer_chess_pieces,
+)
+from livechess2fen.lc2fen.predict_board import check_validity_of_fen
+
+
+NUM_OF_MATRICES = 200
+"""Number of random probability matrices per test."""
+
+
+def _sort_probs_by_piece_type(
+    probs_by_square: list[tuple[list[float], int]],
+) -> list[list[tuple[list[float], int]]]:
+    """Return a length-10 descending-order list of piece probabilities.
+
+    This function returns a length-10 list of piece probabilities sorted
+    in descending order.
+
+    :param probs_by_square: Length-64 list of piece probabilities.
+
+        Each tuple in the list corresponds to a unique square on the
+        chessboard.
+
+        The first element of each tuple is the list of piece
+        probabilities (in the order of `_PIECE_TO_IDX_FULL`) for the
+        corresponding square, while the second is
+        the integer specifying the position of the corresponding square
+        on the chessboard.
+
+    :return: Length-10 list of piece probabilities.
+
+        Each element in the list is a sublist that corresponds to a
+        unique piece type (the piece types are in the order of
+        `_IDX_TO_PIECE`).
+
+        Each sublist is either length-64 (for a nonpawn piece) or
+        length-48 (for a pawn).
+
+        Each tuple in a sublist corresponds to a unique square on the
+        chessboard.
+
+        The first element of each tuple is the list of piece
+        probabilities (in the order of `_PIECE_TO_IDX_FULL`) for the
+        corresponding square, while the second is the integer specifying
+        the position of the corresponding square on the chessboard.
+
+        The tuples are ordered based on the piece probability; the first
+        tuple in a sublist corresponds to the square on the chessboard
+        that has the highest probability of having the piece type
+        corresponding to the sublist.
+    """
+    w_bishops = sorted(
+        probs_by_square,
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["B"]],
+        reverse=True,
+    )
+    w_knights = sorted(
+        probs_by_square,
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["N"]],
+        reverse=True,
+    )
+    w_pawns = sorted(
+        probs_by_square[8:-8],  # Pawns can't be in the first or last row
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["P"]],
+        reverse=True,
+    )
+    w_queens = sorted(
+        probs_by_square,
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["Q"]],
+        reverse=True,
+    )
+    w_rooks = sorted(
+        probs_by_square,
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["R"]],
+        reverse=True,
+    )
+    b_bishops = sorted(
+        probs_by_square,
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["b"]],
+        reverse=True,
+    )
+    b_knights = sorted(
+        probs_by_square,
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["n"]],
+        reverse=True,
+    )
+    b_pawns = sorted(
+        probs_by_square[8:-8],  # Pawns can't be in the first or last row
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["p"]],
+        reverse=True,
+    )
+    b_queens = sorted(
+        probs_by_square,
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["q"]],
+        reverse=True,
+    )
+    b_rooks = sorted(
+        probs_by_square,
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["r"]],
+        reverse=True,
+    )
+    return [
+        w_bishops,
+        w_knights,
+        w_pawns,
+        w_queens,
+        w_rooks,
+        b_bishops,
+        b_knights,
+        b_pawns,
+        b_queens,
+        b_rooks,
+    ]
+
+
+def _piece_with_highest_prob(
+    top_probs_by_type: list[tuple[list[float], int]],
+) -> int:
+    """Determine the piece that has the highest piece probability.
+
+    This function determines the piece that has the highest piece
+    probability across the entire chessboard.
+
+    See "infer_pieces.png" (in the "docs" folder) for a visualization of
+    the algorithm.
+
+    :param top_probs_by_type: Length-10 list of piece probabilities.
+
+        Each element in the list is a tuple that corresponds to a unique
+        piece type (the piece types are in the order of
+        `_IDX_TO_PIECE`).
+
+        Each tuple also corresponds to the square on the chessboard that
+        has the highest probability of having the corresponding piece
+        type.
+
+        The first element of each tuple is the list of piece
+        probabilities (in the
+        order of `_PIECE_TO_IDX_FULL`) for the corresponding square,
+        while the second is the integer specifying the position of the
+        corresponding square on the chessboard.
+
+    :return: Index (between 0 and 9) specifying which piece has the
+    highest piece probability on any square on the chessboard.
+    """
+    # Set the initial maximum probability and index to the first piece
+    # in the list
+    value = top_probs_by_type[_PIECE_TO_IDX["B"]][0][_PIECE_TO_IDX_FULL["B"]]
+    idx = _PIECE_TO_IDX["B"]
+    if (
+        top_probs_by_type[_PIECE_TO_IDX["N"]][0][_PIECE_TO_IDX_FULL["N"]]
+        > value
+    ):
+        value = top_probs_by_type[_PIECE_TO_IDX["N"]][0][
+            _PIECE_TO_IDX_FULL["N"]
+        ]
+        idx = _PIECE_TO_IDX["N"]
+    if (
+        top_probs_by_type[_PIECE_TO_IDX["P"]][0][_PIECE_TO_IDX_FULL["P"]]
+        > value
+    ):
+        value = top_probs_by_type[_PIECE_TO_IDX["P"]][0][
+            _PIECE_TO_IDX_FULL["P"]
+        ]
+        idx = _PIECE_TO_IDX["P"]
+    if (
+        top_probs_by_type[_PIECE_TO_IDX["Q"]][0][_PIECE_TO_IDX_FULL["Q"]]
+        > value
+    ):
+        value = top_probs_by_type[_PIECE_TO_IDX["Q"]][0][
+            _PIECE_TO_IDX_FULL["Q"]
+        ]
+        idx = _PIECE_TO_IDX["Q"]
+    if (
+        top_probs_by_type[_PIECE_TO_IDX["R"]][0][_PIECE_TO_IDX_FULL["R"]]
+        > value
+    ):
+        value = top_probs_by_type[_PIECE_TO_IDX["R"]][0][
+            _PIECE_TO_IDX_FULL["R"]
+        ]
+        idx = _PIECE_TO_IDX["R"]
+    if (
+        top_probs_by_type[_PIECE_TO_IDX["b"]][0][_PIECE_TO_IDX_FULL["b"]]
+        > value
+    ):
+        value = top_probs_by_type[_PIECE_TO_IDX["b"]][0][
+            _PIECE_TO_IDX_FULL["b"]
+        ]
+        idx = _PIECE_TO_IDX["b"]
+    if (
+        top_probs_by_type[_PIECE_TO_IDX["n"]][0][_PIECE_TO_IDX_FULL["n"]]
+        > value
+    ):
+        value = top_probs_by_type[_PIECE_TO_IDX["n"]][0][
+            _PIECE_TO_IDX_FULL["n"]
+        ]
+        idx = _PIECE_TO_IDX["n"]
+    if (
+        top_probs_by_type[_PIECE_TO_IDX["p"]][0][_PIECE_TO_IDX_FULL["p"]]
+        > value
+    ):
+        value = top_probs_by_type[_PIECE_TO_IDX["p"]][0][
+            _PIECE_TO_IDX_FULL["p"]
+        ]
+        idx = _PIECE_TO_IDX["p"]
+    if (
+        top_probs_by_type[_PIECE_TO_IDX["q"]][0][_PIECE_TO_IDX_FULL["q"]]
+        > value
+    ):
+        value = top_probs_by_type[_PIECE_TO_IDX["q"]][0][
+            _PIECE_TO_IDX_FULL["q"]
+        ]
+        idx = _PIECE_TO_IDX["q"]
+    if (
+        top_probs_by_type[_PIECE_TO_IDX["r"]][0][_PIECE_TO_IDX_FULL["r"]]
+        > value
+    ):
+        # value = top_probs_by_type[_PIECE_TO_IDX["r"]][0][
+        #     _PIECE_TO_IDX_FULL["r"]
+        # ]
+        idx = _PIECE_TO_IDX["r"]
+    return idx
+
+
+def _check_balance_among_pawns_queens_and_bishops(
+    piece_type: str,
+    max_pieces_left: list[int],
+    B_light_squared: int,
+    B_dark_squared: int,
+    b_light_squared: int,
+    b_dark_squared: int,
+    square: int,
+) -> bool:
+    """Check the balance among pawns, queens, and bishops on the board.
+
+    This function determines whether the numbers of pawns, queens, and
+    bishops make sense for a standard physical chess set after placing
+    another piece. For example, if there are 2 light-squared bishops and
+    2 queens for white, then the number of pawns that white has must be
+    at most 6 (so if there are already 6 pawns on the board, we cannot
+    place another pawn on the board).
+
+    :param piece_type: Which piece we are about to place on the board.
+
+    :param max_pieces_left: Length-10 list of integers.
+
+        The 10 integers, in the order of `_IDX_TO_PIECE`, specifies how
+        many additional pieces we may place on the rest of the board.
+
+    :param B_light_squared: Number of white's light-squared bishops.
+
+        This is the number of light-squared bishops that white already
+        has.
+
+    :param B_dark_squared: Number of  white's dark-squared bishops.
+
+        This is the number of dark-squared bishops that white already
+        has.
+
+    :param b_light_squared: Number of black's light-squared bishops.
+
+        This is the number of light-squared bishops that black already
+        has.
+
+    :param b_dark_squared: Number of black's dark-squared bishops.
+
+        This is the number of dark-squared bishops that black already
+        has.
+
+    :param square: Integer specifying the square of interest.
+
+        This integer specifies which square we are interested in placing
+        the piece on.
+
+    :return: Whether placing the piece would affect the balance among
+    pawns, queens, and bishops on the chessboard.
+    """
+    if not piece_type in ["P", "p", "Q", "q", "B", "b"]:
+        return True
+    elif piece_type == "P" and (
+        (
+            (
+                max_pieces_left[_PIECE_TO_IDX["Q"]] == 0
+            )  # Whether a white pawn has promoted into a queen
+            + max(
+                B_dark_squared == 2, B_light_squared == 2
+            )  # Whether a white pawn has promoted into a bishop
+        )
+        <= (max_pieces_left[_PIECE_TO_IDX["P"]] - 1)
+    ):
+        return True
+    elif piece_type == "p" and (
+        (
+            (
+                max_pieces_left[_PIECE_TO_IDX["q"]] == 0
+            )  # Whether a black pawn has promoted into a queen
+            + max(
+                b_dark_squared == 2, b_light_squared == 2
+            )  # Whether a black pawn has promoted into a bishop
+        )
+        <= (max_pieces_left[_PIECE_TO_IDX["p"]] - 1)
+    ):
+        return True
+    elif piece_type == "Q" and (
+        (
+            ((max_pieces_left[_PIECE_TO_IDX["Q"]] - 1) == 0)
+            + max(
+                B_dark_squared == 2, B_light_squared == 2
+            )  # Whether a white pawn has promoted into a bishop
+        )
+        <= max_pieces_left[_PIECE_TO_IDX["P"]]
+    ):
+        return True
+    elif piece_type == "q" and (
+        (
+            ((max_pieces_left[_PIECE_TO_IDX["q"]] - 1) == 0)
+            + max(
+                b_dark_squared == 2, b_light_squared == 2
+            )  # Whether a black pawn has promoted into a bishop
+        )
+        <= max_pieces_left[_PIECE_TO_IDX["p"]]
+    ):
+        return True
+    elif (
+        piece_type == "B"
+        and not is_light_square(square)
+        and (
+            (
+                (
+                    max_pieces_left[_PIECE_TO_IDX["Q"]] == 0
+                )  # Whether a white pawn has promoted into a queen
+                + max(
+                    (B_dark_squared + 1) == 2, B_light_squared == 2
+                )  # Whether white is about to have 2 dark-squared bishops
+            )
+            <= max_pieces_left[_PIECE_TO_IDX["P"]]
+        )
+    ):
+        return True
+    elif (
+        piece_type == "B"
+        and is_light_square(square)
+        and (
+            (
+                (
+                    max_pieces_left[_PIECE_TO_IDX["Q"]] == 0
+                )  # Whether a white pawn has promoted into a queen
+                + max(
+                    B_dark_squared == 2, (B_light_squared + 1) == 2
+                )  # Whether white is about to have 2 light-squared bishops
+            )
+            <= max_pieces_left[_PIECE_TO_IDX["P"]]
+        )
+    ):
+        return True
+    elif (
+        piece_type == "b"
+        and not is_light_square(square)
+        and (
+            (
+                (
+                    max_pieces_left[_PIECE_TO_IDX["q"]] == 0
+                )  # Whether a black pawn has promoted into a queen
+                + max(
+                    (b_dark_squared + 1) == 2, b_light_squared == 2
+                )  # Whether black is about to have 2 dark-squared bishops
+            )
+            <= max_pieces_left[_PIECE_TO_IDX["p"]]
+        )
+    ):
+        return True
+    elif (
+        piece_type == "b"
+        and is_light_square(square)
+        and (
+            (
+                (
+                    max_pieces_left[_PIECE_TO_IDX["q"]] == 0
+                )  # Whether a black pawn has promoted into a queen
+                + max(
+                    b_dark_squared == 2, (b_light_squared + 1) == 2
+                )  # Whether black is about to have 2 light-squared bishops
+            )
+            <= max_pieces_left[_PIECE_TO_IDX["p"]]
+        )
+    ):
+        return True
+    else:
+        return False
+
+
+def _infer_pieces_one_at_a_time(
+    probs_with_no_indices: list[list[float]],
+) -> list[str]:
+    """Infer the pieces one at a time, without any previous position.
+
+    This is the original (pure-Python) implementation, which
+    `_infer_pieces_greedily()` must reproduce exactly.
+
+    :param probs_with_no_indices: Length-64 list of piece probabilities
+        in FEN-notation order (see `infer_chess_pieces()`).
+
+    :return: Length-64 list of the inferred chess pieces in
+    FEN-notation order.
+    """
+    # Initialize the output list of predicted piece types (from a8, b8,
+    # ..., to h1)
+    # (`None` represents that the piece type of that square has not been
+    # determined yet)
+    predicted_piece_list = [None] * 64
+
+    probs_by_square = [
+        (probs, i) for i, probs in enumerate(probs_with_no_indices)
+    ]
+
+    # First determine the king locations (one white king and one black
+    # king)
+    white_king = max(
+        probs_by_square,
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["K"]],
+    )
+    black_kings = sorted(
+        probs_by_square,
+        key=lambda prob: prob[0][_PIECE_TO_IDX_FULL["k"]],
+        reverse=True,
+    )  # Descending order
+
+    black_king = black_kings[0]
+    if black_king[1] == white_king[1]:
+        black_king = black_kings[1]
+
+    predicted_piece_list[white_king[1]] = "K"
+    predicted_piece_list[black_king[1]] = "k"
+
+    num_of_undetermined_squares = (
+        62  # We have already determined the king locations
+    )
+
+    # Then identify the empty squares (the CNN has a very high accuracy
+    # of detecting empty squares)
+    for idx, piece in enumerate(probs_with_no_indices):
+        if predicted_piece_list[idx] is None:
+            if _is_empty_square(piece):
+                predicted_piece_list[idx] = "_"
+                num_of_undetermined_squares -= 1
+
+    # Determine the locations of the other pieces in order of
+    # probability (there is a total of
+    # (`num_of_undetermined_squares` * 10) probabilities)
+    probs_by_type = _sort_probs_by_piece_type(probs_by_square)
+    # Keep track of the indices to the squares, whose piece types have
+    # not been determined, with the highest probabilities in
+    # `probs_by_type` (there are 10 piece types left, so we need to keep
+    # track of 10 indices)
+    idx = [0] * 10
+    # Keep track of the top entry of each sorted piece list
+    # (corresponding to the square with the highest probability)
+    top_probs_by_type = [
+        probs_for_a_specific_type[0]
+        for probs_for_a_specific_type in probs_by_type
+    ]
+    # Maximum number of pieces of each type in the same order as
+    # `top_probs_by_type`
+    max_pieces_left = [2, 2, 8, 2, 2, 2, 2, 8, 2, 2]
+    # Keep track of the numbers of light-squared and dark-squared
+    # bishops for both sides
+    B_light_squared = 0  # Number of light-squared bishops for white
+    B_dark_squared = 0  # Number of dark-squared bishops for white
+    b_light_squared = 0  # Number of light-squared bishops for black
+    b_dark_squared = 0  # Number of dark-squared bishops for black
+    # Occasionally, the model is not accurate enough to predict a
+    # balanced board configuration (balanced in terms of the numbers of
+    # pawns, queens, and bishops)
+    failed_to_complete_prediction = False
+
+    # See "infer_pieces.png" (in the "docs" folder) for a visualization
+    # of the following `while` loop
+    while num_of_undetermined_squares > 0:
+        # Determine the piece type of the square that has the piece with
+        # the highest probability across the entire board
+        max_idx = _piece_with_highest_prob(top_probs_by_type)
+        square = top_probs_by_type[max_idx][1]
+        # If we haven't maxed that piece type and the piece type of that
+        # square hasn't been determined, then we conclude that that
+        # square has exactly that piece
+        if (
+            max_pieces_left[max_idx] > 0
+            and predicted_piece_list[square] is None
+        ):
+            piece_type = _IDX_TO_PIECE[max_idx]
+            if _check_balance_among_pawns_queens_and_bishops(
+                piece_type,
+                max_pieces_left,
+                B_light_squared,
+                B_dark_squared,
+                b_light_squared,
+                b_dark_squared,
+                square,
+            ):
+                predicted_piece_list[square] = piece_type
+                num_of_undetermined_squares -= 1
+                max_pieces_left[max_idx] -= 1
+
+                if piece_type == "B" and is_light_square(square):
+                    B_light_squared += 1
+                elif piece_type == "B" and not is_light_square(square):
+                    B_dark_squared += 1
+                elif piece_type == "b" and is_light_square(square):
+                    b_light_squared += 1
+                elif piece_type == "b" and not is_light_square(square):
+                    b_dark_squared += 1
+
+        # In any case, for the piece type we have tried above, we must
+        # replace the entry in `top_probs_by_type` with the
+        # next-highest-probability entry
+        try:
+            idx[max_idx] += 1
+            top_probs_by_type[max_idx] = probs_by_type[max_idx][idx[max_idx]]
+        except (
+            IndexError
+        ):  # Model is not accurate enough to predict a balanced configuration
+            # (balance in terms of the numbers of pawns, queens, and bishops)
+            _print_unbalanced_prediction_warning()
+            failed_to_complete_prediction = True
+            break
+
+    if failed_to_complete_prediction:
+        _complete_prediction_by_brute_force(
+            probs_with_no_indices, predicted_piece_list
+        )
+
+    return predicted_piece_list
+
+
+def run_both(probs: np.ndarray) -> tuple[list[str], str, list[str], str]:
+    """Run both implementations and capture what they print.
+
+    :param probs: `(64, 13)` array of piece probabilities.
+
+    :return: Length-4 tuple formed by the pieces inferred by the
+    reference implementation and what it printed, followed by the same
+    for `_infer_pieces_greedily()`.
+    """
+    probs_as_lists = list(probs.astype(np.float32))
+    reference_output = io.StringIO()
+    with contextlib.redirect_stdout(reference_output):
+        reference = _infer_pieces_one_at_a_time(probs_as_lists)
+    vectorized_output = io.StringIO()
+    with contextlib.redirect_stdout(vectorized_output):
+        vectorized = _infer_pieces_greedily(probs_as_lists)
+    return (
+        reference,
+        reference_output.getvalue(),
+        vectorized,
+        vectorized_output.getvalue(),
+    )
+
+
+def random_position(rng: np.random.Generator) -> list[str]:
+    """Return the pieces of a random position of a physical chess set.
+
+    The position is reached by random legal moves from the starting
+    position, and it respects the piece counts of a standard physical
+    chess set (see `check_validity_of_fen()` in "predict_board.py").
+    """
+    while True:
+        board = chess.Board()
+        for _ in range(rng.integers(0, 80)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(moves[rng.integers(len(moves))])
+        if check_validity_of_fen(board.board_fen()):
+            return codes_to_list(fen_to_codes(board.board_fen()))
+
+
+@pytest.mark.parametrize("num_of_conflicts", [0, 2])
+@pytest.mark.parametrize("tied", [False, True])
+def test_greedy_inference_of_balanced_predictions(
+    tied: bool, num_of_conflicts: int
+):
+    """Both implementations agree when the argmax is (nearly) valid.
+
+    The most probable piece of every square (and the most probable
+    square of either king) is that of a random position, so the pieces
+    are placed by the greedy loop itself (with no brute-force fallback),
+    but the probabilities of the other pieces still interleave across
+    squares.
+
+    :param tied: Whether the probabilities are rounded, so that many
+        candidates are tied and their order is decided by piece type and
+        square.
+
+    :param num_of_conflicts: Number of squares whose most probable piece
+        is then replaced with a random piece (other than a king).
+
+        The piece counts may then be exceeded, in which case the greedy
+        loop has to place the second most probable pieces of some
+        squares (and occasionally falls back to brute force).
+    """
+    rng = np.random.default_rng(0)
+    num_of_fallbacks = 0
+    for _ in range(NUM_OF_MATRICES):
+        pieces = random_position(rng)
+        logits = rng.normal(0, 1, (64, 13))
+        for square, piece in enumerate(pieces):
+            logits[square, _PIECE_TO_IDX_FULL[piece]] = logits[
+                square
+            ].max() + rng.uniform(1 if tied else 0.1, 4)
+        nonking_squares = [
+            square for square, piece in enumerate(pieces) if piece not in "Kk"
+        ]
+        for square in rng.choice(
+            nonking_squares, num_of_conflicts, replace=False
+        ):
+            code = rng.choice(
+                [
+                    _PIECE_TO_IDX_FULL[piece]
+                    for piece in _PIECE_TO_IDX_FULL
+                    if piece not in "Kk"
+                ]
+            )
+            logits[square, code] = logits[square].max() + rng.uniform(0.1, 4)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        if tied:
+            probs = np.round(probs, 2)
+        # The kings are placed first, on the squares with the highest
+        # king probabilities
+        for king in ("K", "k"):
+            column = _PIECE_TO_IDX_FULL[king]
+            king_prob = probs[pieces.index(king), column]
+            other_squares = np.arange(64) != pieces.index(king)
+            probs[other_squares, column] = np.minimum(
+                probs[other_squares, column], king_prob - 0.01
+            )
+
+        reference, reference_output, vectorized, vectorized_output = run_both(
+            probs
+        )
+        assert reference_output == vectorized_output
+        assert reference == vectorized
+        if num_of_conflicts == 0:
+            assert reference_output == ""
+            assert reference == pieces
+        num_of_fallbacks += bool(reference_output)
+
+    # Most matrices must go through the greedy loop only
+    assert num_of_fallbacks < NUM_OF_MATRICES // 2
+
+
+@pytest.mark.parametrize("kind", ["peaked", "flat", "tied"])
+def test_greedy_inference_of_unbalanced_predictions(kind: str):
+    """Both implementations agree when the model is not accurate.
+
+    The most probable pieces of such random matrices do not respect the
+    piece counts of a chess set, so both implementations fall back to
+    brute force (and print the same warning).
+    """
+    rng = np.random.default_rng(0)
+    generate = {
+        "peaked": lambda: rng.dirichlet([0.1] * 13, 64),
+        "flat": lambda: rng.dirichlet([1.0] * 13, 64),
+        "tied": lambda: np.round(rng.dirichlet([0.3] * 13, 64), 1) + 0.05,
+    }[kind]
+    for _ in range(NUM_OF_MATRICES):
+        reference, reference_output, vectorized, vectorized_output = run_both(
+            generate()
+        )
+        assert reference_output == vectorized_output
+        assert reference == vectorized
+
+
+def _is_king_move(
+    initial_sq: tuple[int, int], final_sq: tuple[int, int]
+) -> bool:
+    """Determine if the move could have been a king move.
+
+    A king can move at most one square in any direction (horizontally,
+    vertically, or diagonally).
+
+    :param initial_sq: Row and column indices of the initial square.
+
+        The `0` row index corresponds to the 8th rank, and the `0`
+        column index corresponds to the a file.
+
+    :param final_sq: Row and column indices of the final square.
+
+        The `0` row index of corresponds to the 8th rank, and the `0`
+        column index corresponds to the a file.
+
+    :return: Whether the move given by the initial and final squares
+    could have been a king move.
+    """
+    return (
+        abs(initial_sq[0] - final_sq[0]) <= 1
+        and abs(initial_sq[1] - final_sq[1]) <= 1
+    )
+
+
+def _is_rook_move(
+    initial_sq: tuple[int, int], final_sq: tuple[int, int]
+) -> bool:
+    """Determine if the move could have been a rook move.
+
+    A rook can move any number of squares (without jumping over any
+    piece) along the same rank or file.
+
+    :param initial_sq: Row and column indices of the initial square.
+
+        The `0` row index corresponds to the 8th rank, and the `0`
+        column index corresponds to the a file.
+
+    :param final_sq: Row and column indices of the final square.
+
+        The `0` row index of corresponds to the 8th rank, and the `0`
+        column index corresponds to the a file.
+
+    :return: Whether the move given by the initial and final squares
+    could have been a rook move.
+    """
+    return initial_sq[0] == final_sq[0] or initial_sq[1] == final_sq[1]
+
+
+def _is_bishop_move(
+    initial_sq: tuple[int, int], final_sq: tuple[int, int]
+) -> bool:
+    """Determine if the move could have been a bishop move.
+
+    A bishop can move any number of squares (without jumping over any
+    piece) diagonally.
+
+    :param initial_sq: Row and column indices of the initial square.
+
+        The `0` row index corresponds to the 8th rank, and the `0`
+        column index corresponds to the a file.
+
+    :param final_sq: Row and column indices of the final square.
+
+        The `0` row index of corresponds to the 8th rank, and the `0`
+        column index corresponds to the a file.
+
+    :return: Whether the move given by the initial and final squares
+    could have been a bishop move.
+    """
+    return (
+        (initial_sq[0] - initial_sq[1] == final_sq[0] - final_sq[1])
+        # The move is parallel to the a8-h1 diagonal
+    ) or (
+        (initial_sq[0] + initial_sq[1] == final_sq[0] + final_sq[1])
+        # The move is parallel to the a1-h8 diagonal
+    )
+
+
+def _is_knight_move(
+    initial_sq: tuple[int, int], final_sq: tuple[int, int]
+) -> bool:
+    """Determine if the move could have been a knight move.
+
+    A knight moves in an L-shape (diagonal of a 2x3 rectangle) fashion.
+
+    :param initial_sq: Row and column indices of the initial square.
+
+        The `0` row index corresponds to the 8th rank, and the `0`
+        column index corresponds to the a file.
+
+    :param final_sq: Row and column indices of the final square.
+
+        The `0` row index of corresponds to the 8th rank, and the `0`
+        column index corresponds to the a file.
+
+    :return: Whether the move given by the initial and final squares
+    could have been a knight move.
+    """
+    row_d = abs(initial_sq[0] - final_sq[0])  # This is the distance in ranks
+    col_d = abs(initial_sq[1] - final_sq[1])  # This is the distance in files
+    return (row_d == 1 and col_d == 2) or (row_d == 2 and col_d == 1)
+
+
+def _is_pawn_move(
+    initial_sq: tuple[int, int],
+    final_sq: tuple[int, int],
+    capturing: bool,
+    white: bool,
+) -> bool:
+    """Determine if the move could have been a pawn move.
+
+    A pawn can move one square (or two squares if it hasn't moved yet)
+    forward along the same file (or two if it hasn't moved yet) and
+    capture one square forward diagonally.
+
+    :param initial_sq: Row and column indices of the initial square.
+
+        The `0` row index corresponds to the 8th rank, and the `0`
+        column index corresponds to the a file.
+
+    :param final_sq: Row and column indices of the final square.
+
+        The `0` row index of corresponds to the 8th rank, and the `0`
+        column index corresponds to the a file.
+
+    :param capturing: Whether the move was a capture.
+
+    :param white: Whether it was white to move.
+
+    :return: Whether the move given by the initial and final squares
+    could have been a pawn move.
+    """
+    if white:
+        if capturing:
+            return (
+                initial_sq[0] - final_sq[0] == 1
+                and abs(initial_sq[1] - final_sq[1]) == 1
+            )
+        else:
+            return initial_sq[1] == final_sq[1] and (
+                initial_sq[0] - final_sq[0] == 1
+                or (initial_sq[0] - final_sq[0] == 2 and initial_sq[0] == 6)
+            )
+    else:
+        if capturing:
+            return (
+                initial_sq[0] - final_sq[0] == -1
+                and abs(initial_sq[1] - final_sq[1]) == 1
+            )
+        else:
+            return initial_sq[1] == final_sq[1] and (
+                initial_sq[0] - final_sq[0] == -1
+                or (initial_sq[0] - final_sq[0] == -2 and initial_sq[0] == 1)
+            )
+
+
+def _castling_action(king: str, final_sq: int) -> str | None:
+    """Determine the castling action from the final square of the king.
+
+    This is how the original `_detect_move()` determined the action once
+    it had found a king and an empty square two squares away from it
+    (without checking the initial square of the king).
+
+    :param king: `"K"` or `"k"`.
+
+    :param final_sq: Final square of the king (in FEN-notation order).
+
+    :return: Castling action or `None`.
+    """
+    if king == "K" and final_sq == 62:
+        return "white_castles_kingside"
+    elif king == "K" and final_sq == 58:
+        return "white_castles_queenside"
+    elif king == "k" and final_sq == 6:
+        return "black_castles_kingside"
+    elif king == "k" and final_sq == 2:
+        return "black_castles_queenside"
+    else:
+        return None
+
+
+def _is_move_of_piece(
+    piece: str, initial_sq: int, final_sq: int, capturing: bool
+) -> bool:
+    """Determine with the original helpers if a piece could have moved.
+
+    :param piece: Piece (in the notation of `_IDX_TO_PIECE_FULL`).
+
+    :param initial_sq: Initial square (in FEN-notation order).
+
+    :param final_sq: Final square (in FEN-notation order).
+
+    :param capturing: Whether the move was a capture.
+
+    :return: Whether the piece could have made the move.
+    """
+    initial_row_and_col = (initial_sq // 8, initial_sq % 8)
+    final_row_and_col = (final_sq // 8, final_sq % 8)
+    if piece in ("P", "p"):
+        return _is_pawn_move(
+            initial_row_and_col, final_row_and_col, capturing, piece == "P"
+        )
+    return {
+        "B": _is_bishop_move,
+        "K": _is_king_move,
+        "N": _is_knight_move,
+        "Q": lambda initial, final: (
+            _is_rook_move(initial, final) or _is_bishop_move(initial, final)
+        ),
+        "R": _is_rook_move,
+        "_": lambda initial, final: False,
+    }[piece.upper()](initial_row_and_col, final_row_and_col)
+
+
+def test_move_geometry_tables_match_original_helpers():
+    """Every entry of the tables agrees with the original helpers."""
+    for piece_code, piece in _IDX_TO_PIECE_FULL.items():
+        for capturing in (False, True):
+            expected = np.array(
+                [
+                    [
+                        _is_move_of_piece(
+                            piece, initial_sq, final_sq, capturing
+                        )
+                        for final_sq in range(64)
+                    ]
+                    for initial_sq in range(64)
+                ]
+            )
+            np.testing.assert_array_equal(
+                _MOVE_GEOMETRY[piece_code, int(capturing)], expected
+            )
+            if piece in ("P", "p"):
+                np.testing.assert_array_equal(
+                    _PAWN_MOVES[int(piece == "P"), int(capturing)], expected
+                )
+
+
+def test_castling_table_matches_original_rule():
+    """The castling table agrees with the original rule for real castling.
+
+    The original rule only looked at the final square of the king, so it
+    also accepted a king two squares away from its castling square on
+    another starting square (e.g., a king on a1 "castling" to c1), which
+    then crashed `push_uci()`; the table rejects those candidates.
+    """
+    for king, home_sq in (("K", 60), ("k", 4)):
+        for initial_sq in range(64):
+            for final_sq in range(64):
+                if abs(final_sq - initial_sq) != 2:
+                    continue
+                action = _CASTLING_MOVES.get(
+                    (_PIECE_TO_IDX_FULL[king], initial_sq, final_sq)
+                )
+                if initial_sq == home_sq:
+                    assert action == _castling_action(king, final_sq)
+                else:
+                    assert action is None
+
+
+@pytest.mark.parametrize("must_detect_move", [True, False])
+def test_impossible_move_is_not_detected(must_detect_move: bool):
+    """A move the moving piece can't have made is rejected.
+
+    The rook on a1 seemingly jumps to b3, which the original
+    `_detect_move()` accepted as `"white_moves"` before `push_uci()`
+    raised an `IllegalMoveError`.
+    """
+    previous_fen = "4k3/8/8/8/8/8/8/R3K3"
+    current_fen = "4k3/8/8/8/8/1R6/8/4K3"
+    probs = list(np.eye(13)[fen_to_codes(current_fen)])
+
+    changed_squares = _determine_changed_squares(
+        fen_to_codes(previous_fen), probs
+    )
+    assert changed_squares == [41, 56]
+    assert (
+        _detect_move(fen_to_codes(previous_fen), probs, changed_squares)
+        is None
+    )
+
+    piece_list, move_uci = infer_chess_pieces(
+        probs,
+        "BL",
+        previous_fen=previous_fen,
+        must_detect_move=must_detect_move,
+    )
+    assert move_uci is None
+    expected_fen = previous_fen if must_detect_move else current_fen
+    assert piece_list == codes_to_list(fen_to_codes(expected_fen))
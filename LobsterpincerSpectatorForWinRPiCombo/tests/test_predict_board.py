@@ -0,0 +1,133 @@
+"""Tests of "predict_board.py".
+
+Note: run the tests from the "LobsterpincerSpectatorForWinRPiCombo"
+directory with `python -m pytest tests`.
+"""
+
+import chess
+import numpy as np
+import pytest
+
+from livechess2fen.lc2fen import predict_board as predict_board_module
+from livechess2fen.lc2fen.fen import fen_to_codes
+from livechess2fen.lc2fen.predict_board import predict_board
+from livechess2fen.lc2fen.preprocess_squares import SquarePreprocessor
+
+
+FRAME_SIZE = 480
+"""Size of the synthetic camera frames."""
+
+FRAME_CORNERS = [
+    [0, 0],
+    [FRAME_SIZE - 1, 0],
+    [FRAME_SIZE - 1, FRAME_SIZE - 1],
+    [0, FRAME_SIZE - 1],
+]
+"""Board corners of the synthetic camera frames."""
+
+
+class FakeModel:
+    """Image-to-prob function that "sees" a given board position.
+
+    The squares are in FEN-notation order (which is the order of the
+    squares of the input image when a1 is at the bottom left), so each
+    row of the probabilities favors the piece of the corresponding
+    square of `fen`.
+    """
+
+    def __init__(self, fen: str):
+        """Initialize an instance of the `FakeModel`.
+
+        :param fen: FEN string of the position the model sees.
+        """
+        self.fen = fen
+        self.num_of_calls = 0
+
+    def __call__(self, piece_imgs: np.ndarray) -> np.ndarray:
+        """Return the piece probabilities of the squares of `fen`."""
+        self.num_of_calls += 1
+        probs = np.full((64, 13), 0.1 / 12)
+        probs[np.arange(64), fen_to_codes(self.fen)] = 0.9
+        return probs[: len(piece_imgs)]
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Forget the positions and probabilities of the previous tests."""
+    predict_board_module._POSITION_SIGNATURES.clear()
+    predict_board_module._SQUARE_PROBS.clear()
+    yield
+    predict_board_module._POSITION_SIGNATURES.clear()
+    predict_board_module._SQUARE_PROBS.clear()
+
+
+def test_missed_move_is_retried_at_the_next_update():
+    """A move missed by the model is detected at the next update."""
+    frame = np.random.default_rng(0).integers(
+        0, 256, (FRAME_SIZE, FRAME_SIZE, 3), dtype=np.uint8
+    )
+    board = chess.Board()
+    previous_fen = board.board_fen()
+    moved_board = board.copy()
+    moved_board.push_uci("e2e4")
+
+    # The move has been made, but the model still sees the old position
+    model = FakeModel(previous_fen)
+    fen, _, detected_move = predict_board(
+        frame,
+        "BL",
+        SquarePreprocessor(),
+        model,
+        previous_fen=previous_fen,
+        must_detect_move=True,
+        frame_corners=FRAME_CORNERS,
+        board=board,
+    )
+    assert fen == previous_fen
+    assert detected_move is None
+
+    # Nothing has changed in the frame, but the model now sees the move
+    model.fen = moved_board.board_fen()
+    fen, _, detected_move = predict_board(
+        frame,
+        "BL",
+        SquarePreprocessor(),
+        model,
+        previous_fen=previous_fen,
+        must_detect_move=True,
+        frame_corners=FRAME_CORNERS,
+        board=board,
+    )
+    assert model.num_of_calls == 2
+    assert fen == moved_board.board_fen()
+    assert detected_move == "e2e4"
+
+    # The position reached by the move is stored, so an unchanged frame
+    # no longer needs the model
+    fen, _, detected_move = predict_board(
+        frame,
+        "BL",
+        SquarePreprocessor(),
+        model,
+        previous_fen=moved_board.board_fen(),
+        must_detect_move=True,
+        frame_corners=FRAME_CORNERS,
+        board=moved_board,
+    )
+    assert model.num_of_calls == 2
+    assert fen == moved_board.board_fen()
+    assert detected_move is None
+
+
+def test_pre_classification_requires_model_key():
+    """Pre-classification is not silently ignored without a model key."""
+    frame = np.zeros((FRAME_SIZE, FRAME_SIZE, 3), dtype=np.uint8)
+    with pytest.raises(ValueError):
+        predict_board(
+            frame,
+            "BL",
+            SquarePreprocessor(),
+            FakeModel(chess.Board().board_fen()),
+            frame_corners=FRAME_CORNERS,
+            pre_classification=True,
+        )
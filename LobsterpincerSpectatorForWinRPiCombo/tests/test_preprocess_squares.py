@@ -0,0 +1,93 @@
+"""Tests of "preprocess_squares.py".
+
+Note: run the tests from the "LobsterpincerSpectatorForWinRPiCombo"
+directory with `python -m pytest tests`.
+"""
+
+import cv2
+import numpy as np
+import PIL.Image
+import pytest
+
+from livechess2fen.lc2fen.preprocess_squares import SquarePreprocessor
+
+
+TEST_IMAGES = [
+    "Test Images/before_0-0-0_by_black.png",
+    "Test Images/after_0-0-0_by_black.png",
+    "Test Images/test.png",
+]
+"""Chessboard images (already perspective-transformed) to preprocess."""
+
+FRAME_CORNERS = [[150, 100], [1100, 60], [1150, 1130], [40, 1000]]
+"""Board corners used when treating a test image as a raw frame."""
+
+MAX_FRAME_DIFFERENCE = 4
+"""Maximum absolute difference between the two raw-frame paths.
+
+`cv2.warpPerspective()` and `cv2.remap()` round the bilinear
+interpolation slightly differently, so a few pixel values may be off by
+a few intensity levels.
+"""
+
+MAX_FRAME_DIFFERENCE_FRACTION = 1e-3
+"""Maximum fraction of values that may differ between the two paths."""
+
+
+def prein_squeezenet1p1_reference(board_img: np.ndarray) -> np.ndarray:
+    """Preprocess the 64 squares the way the SqueezeNet1p1 path used to.
+
+    Each square is cropped, converted to RGB, resized with PIL's
+    nearest-neighbor interpolation (as `keras.utils.load_img()` does by
+    default), and preprocessed in Keras's `"caffe"` mode (conversion to
+    BGR and subtraction of the means, in float32).
+
+    :param board_img: BGR chessboard image.
+
+    :return: `(64, 227, 227, 3)` float32 array of the squares.
+    """
+    square_size = board_img.shape[0] // 8
+    squares = []
+    for row_start in range(0, 8 * square_size, square_size):
+        for col_start in range(0, 8 * square_size, square_size):
+            square = board_img[
+                row_start : row_start + square_size,
+                col_start : col_start + square_size,
+            ]
+            img = PIL.Image.fromarray(square[:, :, ::-1]).resize(
+                (227, 227), PIL.Image.NEAREST
+            )
+            x = np.asarray(img, dtype="float32")[:, :, ::-1].copy()
+            x[..., 0] -= 103.939
+            x[..., 1] -= 116.779
+            x[..., 2] -= 123.68
+            squares.append(x)
+    return np.stack(squares)
+
+
+@pytest.mark.parametrize("filename", TEST_IMAGES)
+def test_squares_match_prein_squeezenet1p1(filename):
+    """The squares are bit-for-bit identical to the reference path."""
+    board_img = cv2.imread(filename)
+    actual = SquarePreprocessor(227)(board_img)
+    expected = prein_squeezenet1p1_reference(board_img)
+    assert actual.dtype == expected.dtype
+    assert np.array_equal(actual, expected)
+
+
+@pytest.mark.parametrize("filename", TEST_IMAGES)
+def test_squares_from_frame_match_warped_board(filename):
+    """Sampling the raw frame matches warping the frame first."""
+    frame = cv2.imread(filename)
+    preprocessor = SquarePreprocessor(227)
+    M = cv2.getPerspectiveTransform(
+        np.float32(FRAME_CORNERS),
+        np.float32([[0, 0], [1199, 0], [1199, 1199], [0, 1199]]),
+    )
+    expected = preprocessor(cv2.warpPerspective(frame, M, (1200, 1200)))
+    expected = expected.copy()  # The next call overwrites the buffer
+    actual = preprocessor.from_frame(frame, FRAME_CORNERS)
+
+    difference = np.abs(actual - expected)
+    assert difference.max() <= MAX_FRAME_DIFFERENCE
+    assert np.mean(difference > 0) <= MAX_FRAME_DIFFERENCE_FRACTION
@@ -0,0 +1,51 @@
+"""Tests of "temporal_filter.py".
+
+Note: run the tests from the "LobsterpincerSpectatorForWinRPiCombo"
+directory with `python -m pytest tests`.
+"""
+
+import chess
+import numpy as np
+
+from livechess2fen.lc2fen.fen import fen_to_codes
+from livechess2fen.lc2fen.temporal_filter import SquareBeliefFilter
+
+
+def test_only_observed_squares_are_fused():
+    """Cached probabilities do not make the beliefs more confident."""
+    board = chess.Board()
+    probs = np.full((64, 13), 0.4 / 12)
+    probs[np.arange(64), fen_to_codes(board.board_fen())] = 0.6
+    observed_squares = np.zeros(64, dtype=bool)
+    observed_squares[[52, 36]] = True  # e2 and e4 (with a1 at BL)
+
+    belief_filter = SquareBeliefFilter()
+    first_beliefs = belief_filter.update(
+        "key", probs, "BL", board.board_fen(), board
+    )
+    beliefs = first_beliefs
+    for _ in range(5):
+        beliefs = belief_filter.update(
+            "key", probs, "BL", board.board_fen(), board, observed_squares
+        )
+
+    # The squares whose (cached) probabilities were not observed again
+    # keep their beliefs, while the observed squares are fused again
+    np.testing.assert_array_equal(
+        beliefs[~observed_squares], first_beliefs[~observed_squares]
+    )
+    assert np.all(
+        beliefs[observed_squares].max(axis=1)
+        > first_beliefs[observed_squares].max(axis=1)
+    )
+
+
+def test_all_squares_are_fused_for_a_new_key():
+    """The first frame of a key is fused regardless of the mask."""
+    probs = np.full((64, 13), 0.4 / 12)
+    probs[:, 6] = 0.6
+    belief_filter = SquareBeliefFilter()
+    beliefs = belief_filter.update(
+        "key", probs, "BL", observed_squares=np.zeros(64, dtype=bool)
+    )
+    assert np.all(beliefs.argmax(axis=1) == 6)